@@ -11,16 +11,33 @@ import copy
 import warnings
 import os
 import time
+import glob
+import concurrent.futures
 
 from . import config
 from . import utils
 from .basic_worm import WormPartition, BasicWorm
-from .pre_features import WormParsing
+from .basic_worm import data_to_json, json_to_data, _get_attribute_names
+from .ragged_frames import RaggedFrames
+from .pre_features import WormParsing, ChainCodeCache
 
 # TODO: remove this dependency by moving feature_comparisons to utils and 
 #       renaming it to something more general.
 from .features import feature_comparisons as fc
 
+#The # of frames given to each process when calculating pre-features in 
+#parallel, see NormalizedWorm.calculate_pre_features
+DEFAULT_FRAMES_PER_CHUNK = 500
+
+#Holds the attributes that are not arrays, see 
+#NormalizedWorm.save_to_npy_directory
+NPY_METADATA_FILE = 'metadata.json'
+
+#The attributes set by calculate_pre_features
+PRE_FEATURE_NAMES = ['angles', 'skeleton', 'vulva_contour', 
+                     'non_vulva_contour', 'length', 'head_area', 'tail_area',
+                     'vulva_area', 'non_vulva_area']
+
 
 class NormalizedWorm(BasicWorm, WormPartition):
     """
@@ -75,7 +92,19 @@ class NormalizedWorm(BasicWorm, WormPartition):
 
 
     @classmethod
-    def from_BasicWorm_factory(cls, basic_worm):
+    def from_BasicWorm_factory(cls, basic_worm, n_workers=None, 
+                               frames_per_chunk=DEFAULT_FRAMES_PER_CHUNK,
+                               processing_options=None):
+        """
+        Parameters
+        ----------
+        basic_worm : BasicWorm
+        n_workers : int (optional)
+        frames_per_chunk : int
+        processing_options : FeatureProcessingOptions (optional)
+            See calculate_pre_features
+        
+        """
         nw = NormalizedWorm()        
         
         
@@ -85,7 +114,8 @@ class NormalizedWorm(BasicWorm, WormPartition):
         # TODO: We should probably validate that the worm is valid before
         #       calculating pre-features.
         
-        nw.calculate_pre_features()
+        nw.calculate_pre_features(n_workers, frames_per_chunk, 
+                                  processing_options)
         
         return nw
 
@@ -207,6 +237,82 @@ class NormalizedWorm(BasicWorm, WormPartition):
             
             return nw
 
+    @classmethod
+    def from_npy_directory_factory(cls, dir_path):
+        """
+        Loads a worm saved by save_to_npy_directory.
+        
+        The arrays are loaded lazily: each file is memory-mapped when its
+        attribute is first accessed, and data are only read from disk as
+        they are used. Modifying an array changes the copy in memory, 
+        never the file.
+        
+        See Also
+        --------
+        convert_schafer_file
+        
+        """
+        if not os.path.isdir(dir_path):
+            raise Exception("Directory not found: " + dir_path)
+            
+        nw = cls()
+        
+        with open(os.path.join(dir_path, NPY_METADATA_FILE), 'r') as infile:
+            for name, value in json_to_data(infile.read()):
+                setattr(nw, name, value)
+        
+        nw._lazy_array_paths = {}
+        for file_path in glob.glob(os.path.join(dir_path, '*.npy')):
+            name = os.path.splitext(os.path.basename(file_path))[0]
+            nw._lazy_array_paths[name] = file_path
+            # Removing values set by the constructor so that the array is 
+            # loaded on access
+            if name in nw.__dict__:
+                delattr(nw, name)
+            
+        return nw
+        
+    def save_to_npy_directory(self, dir_path):
+        """
+        Saves each array attribute to its own .npy file in dir_path. Other
+        attributes are saved to a JSON file in the same directory. 
+        Attributes starting with an underscore aren't saved.
+        
+        See Also
+        --------
+        from_npy_directory_factory
+        
+        """
+        if not os.path.isdir(dir_path):
+            os.makedirs(dir_path)
+            
+        metadata = []
+        # Private attributes (e.g. cached values) aren't saved
+        for name in _get_attribute_names(self):
+            value = getattr(self, name)
+            if isinstance(value, np.ndarray):
+                np.save(os.path.join(dir_path, name + '.npy'), value)
+            else:
+                metadata.append((name, value))
+        
+        with open(os.path.join(dir_path, NPY_METADATA_FILE), 'w') as outfile:
+            outfile.write(data_to_json(metadata))
+            
+    def __getattr__(self, name):
+        """
+        This is only called when an attribute is not found normally, which
+        is how arrays from from_npy_directory_factory are loaded on access.
+        """
+        lazy_array_paths = self.__dict__.get('_lazy_array_paths', {})
+        if name not in lazy_array_paths:
+            raise AttributeError("'%s' object has no attribute '%s'" % 
+                                 (type(self).__name__, name))
+        
+        # Copy-on-write, so that in-place changes don't modify the file
+        value = np.load(lazy_array_paths.pop(name), mmap_mode='c')
+        setattr(self, name, value)
+        return value
+
     def get_BasicWorm(self):
         """
         Return an instance of BasicWorm containing this instance of 
@@ -227,7 +333,9 @@ class NormalizedWorm(BasicWorm, WormPartition):
         
         return bw
     
-    def calculate_pre_features(self):
+    def calculate_pre_features(self, n_workers=None, 
+                               frames_per_chunk=DEFAULT_FRAMES_PER_CHUNK,
+                               processing_options=None):
         """
         Calculate "pre-features" given basic information about the worm.
         
@@ -242,20 +350,100 @@ class NormalizedWorm(BasicWorm, WormPartition):
         5. Calculate length, head_area, tail_area, vulva_area, non_vulva area
            for each frame 
 
+        Parameters
+        ----------
+        n_workers : int (optional)
+            If specified, the frames are split into chunks which are 
+            processed by this many processes. Each frame is processed 
+            independently so the results are the same as when not
+            using any workers.
+        frames_per_chunk : int
+            The # of frames in each chunk, only used with n_workers
+        processing_options : FeatureProcessingOptions (optional)
+            Only the 'pre_features' options and 'dtype' are used. The 
+            pre-features are always computed in double precision, they are 
+            then stored as 'dtype'.
+
         """
         print("Calculating pre-features")
-
+        
+        if processing_options is None:
+            max_contour_points = None
+        else:
+            max_contour_points = \
+                processing_options.pre_features.max_contour_points
+        
+        if n_workers is None:
+            self.h__calculatePreFeatures(max_contour_points)
+        else:
+            self.h__calculatePreFeaturesInParallel(n_workers, frames_per_chunk,
+                                                   max_contour_points)
+        
+        if processing_options is not None:
+            for name in PRE_FEATURE_NAMES:
+                if name in self.__dict__:
+                    setattr(self, name, convert_floats(getattr(self, name),
+                                                processing_options.dtype))
+
+    def h__calculatePreFeaturesInParallel(self, n_workers, frames_per_chunk,
+                                          max_contour_points):
+        """
+        Splits the frames into chunks, processes the chunks on a pool of
+        processes, and joins the results back together in order.
+        """
+        if self.vulva_contour is not None:
+            inputs = [self.vulva_contour, self.non_vulva_contour, None]
+            n_frames = len(self.vulva_contour)
+        else:
+            inputs = [None, None, self.skeleton]
+            n_frames = self.skeleton.shape[-1] \
+                       if isinstance(self.skeleton, np.ndarray) \
+                       else len(self.skeleton)
+        
+        if n_frames == 0:
+            self.h__calculatePreFeatures(max_contour_points)
+            return
+        
+        starts = range(0, n_frames, frames_per_chunk)
+        chunks = [[get_frame_range(data, start, start + frames_per_chunk) 
+                   for start in starts] for data in inputs]
+        chunks.append([max_contour_points]*len(starts))
+        
+        with concurrent.futures.ProcessPoolExecutor(n_workers) as executor:
+            results = list(executor.map(calculate_pre_features_chunk, *chunks))
+        
+        # All chunks set the same attributes, in frame order
+        for name in results[0]:
+            values = [result[name] for result in results]
+            if values[0] is None:
+                setattr(self, name, None)
+            else:
+                setattr(self, name, np.concatenate(values, axis=-1))
+
+    def h__calculatePreFeatures(self, max_contour_points=None):
+        """
+        The serial version of calculate_pre_features.
+        """
         #t = time.time()
         #elapsed = time.time() - t
         
+        #Chain code lengths are shared by the steps below that work on the
+        #same points (e.g. the angles and the skeleton)
+        cache = ChainCodeCache()
+        
         #TODO: Need to add on testing for normalized data as an input
         #TODO: This could be simplified, although order may matter somewhat
         if self.vulva_contour is not None:
+            if max_contour_points is not None:
+                self.vulva_contour = WormParsing.downsampleContours(
+                    self.vulva_contour, max_contour_points)
+                self.non_vulva_contour = WormParsing.downsampleContours(
+                    self.non_vulva_contour, max_contour_points)
             widths, skeleton = WormParsing.computeWidths(self.vulva_contour, self.non_vulva_contour)
-            self.angles = WormParsing.calculateAngles(skeleton)
-            self.skeleton = WormParsing.normalizeAllFramesXY(skeleton)
-            self.vulva_contour = WormParsing.normalizeAllFramesXY(self.vulva_contour)
-            self.non_vulva_contour = WormParsing.normalizeAllFramesXY(self.non_vulva_contour)
+            self.angles = WormParsing.calculateAngles(skeleton, cache)
+            self.skeleton = WormParsing.normalizeAllFramesXY(skeleton, cache)
+            self.vulva_contour = WormParsing.normalizeAllFramesXY(self.vulva_contour, cache)
+            self.non_vulva_contour = WormParsing.normalizeAllFramesXY(self.non_vulva_contour, cache)
             
             #TODO: Calculate area 
             #The old method was:
@@ -274,8 +462,8 @@ class NormalizedWorm(BasicWorm, WormPartition):
             #code instead.
         else:
             #Skeleton input should be good
-            self.angles = WormParsing.calculateAngles(self.skeleton)
-            self.skeleton = WormParsing.normalizeAllFramesXY(self.skeleton)
+            self.angles = WormParsing.calculateAngles(self.skeleton, cache)
+            self.skeleton = WormParsing.normalizeAllFramesXY(self.skeleton, cache)
             self.vulva_contour = None
             self.non_vulva_contour = None
             self.head_area = None
@@ -285,7 +473,7 @@ class NormalizedWorm(BasicWorm, WormPartition):
             
             
         
-        self.length = WormParsing.computeSkeletonLengths(self.skeleton)
+        self.length = WormParsing.computeSkeletonLengths(self.skeleton, cache)
         
                 
         #Old MC comments below ...
@@ -300,6 +488,73 @@ class NormalizedWorm(BasicWorm, WormPartition):
         # and tail and between tail and head remains constant between frames.
         pass
   
+    def astype(self, dtype):
+        """
+        Returns a copy of this worm with all of its floating point data 
+        converted to dtype, e.g. np.float32 to halve the memory used. Arrays 
+        that are already of this type are shared rather than copied, and 
+        if all of them are, this worm is returned (with its cached values, 
+        and without loading its lazily loaded arrays).
+        
+        See Also
+        --------
+        FeatureProcessingOptions.dtype
+        """
+        dtype = np.dtype(dtype)
+        lazy_array_paths = self.__dict__.get('_lazy_array_paths', {})
+        if not any(needs_float_conversion(value, dtype) for name, value in 
+                   self.__dict__.items() if not name.startswith('_')) and \
+                not any(h__npyNeedsFloatConversion(path, dtype)
+                        for path in lazy_array_paths.values()):
+            return self
+            
+        return self.h__copy(lambda name, value: convert_floats(value, dtype))
+
+    def get_frame_range(self, start, stop):
+        """
+        Returns a worm with frames start through stop-1 of this worm, e.g. to
+        compute features on a window of a long recording. 
+        
+        No data are copied: all per-frame data (arrays with frames along the 
+        last dimension, such as the skeleton, angles, segmentation_status and
+        frame_code, as well as RaggedFrames and lists of frames) are views of
+        this worm's data. Everything else is shared as is.
+        
+        Parameters
+        ----------
+        start : int
+        stop : int
+            As in a slice, i.e. frames[start:stop]
+        """
+        n_frames = self.num_frames
+        start, stop, _ = slice(start, stop).indices(n_frames)
+        stop = max(start, stop)
+        
+        def get_frames(name, value):
+            if is_per_frame(value, n_frames):
+                return get_frame_range(value, start, stop)
+            return value
+        
+        return self.h__copy(get_frames)
+        
+    def h__copy(self, convert):
+        """
+        Returns a shallow copy of this worm, with each attribute value 
+        replaced by convert(name, value). Cached values are not copied.
+        """
+        # This also loads any lazily loaded arrays
+        values = [(name, getattr(self, name)) 
+                  for name in _get_attribute_names(self)]
+        
+        nw = copy.copy(self)
+        nw._lazy_array_paths = {}
+        nw._partition_stats = {}
+        nw.__dict__.pop('_orientation_free_skeleton_cache', None)
+        for name, value in values:
+            setattr(nw, name, convert(name, value))
+        
+        return nw
+  
     def validate(self):
         """
         Checks array lengths, etc. to ensure that this is a valid instance
@@ -368,7 +623,7 @@ class NormalizedWorm(BasicWorm, WormPartition):
         the angle formed by the first and last skeleton point.
 
         """
-        s = self.skeletons
+        s = self.skeleton
         # obtain vector between first and last skeleton point
         v = s[48, :,:]-s[0,:,:]  
         # find the angle of this vector
@@ -385,11 +640,10 @@ class NormalizedWorm(BasicWorm, WormPartition):
         A numpy array with the above properties.
 
         """
-        s = self.skeletons
+        s = self.skeleton
         
-        if(s.size == 0):
-            s_mean = np.ones(np.shape(s)) * np.nanmean(s, 0, keepdims=False)
-            return s - s_mean
+        if(s.size != 0):
+            return s - self.centre
         else:
             return s
 
@@ -420,38 +674,36 @@ class NormalizedWorm(BasicWorm, WormPartition):
         #rot_matrix = np.ones(np.shape(s1)) * rot_matrix
 
         #self.skeletons_rotated = rot_matrix.dot(self.skeletons)    
+        
+        The rotation is now done for all frames at once by writing out the 
+        matrix multiplication. The result is cached until the skeleton is
+        replaced (modifying it in place isn't noticed).
 
         """
 
-        centred_skeleton = self.centred_skeleton()
+        # The result is cached, along with the skeleton it was computed from
+        # so that a new skeleton is noticed
+        cache = self.__dict__.get('_orientation_free_skeleton_cache')
+        if cache is not None and cache[0] is self.skeleton:
+            return cache[1]
+        
+        centred_skeleton = self.centred_skeleton
         orientation = self.angle
 
         a = -orientation * (np.pi / 180)
+        cos_a = np.cos(a)
+        sin_a = np.sin(a)
 
-        rot_matrix = np.array([[np.cos(a), -np.sin(a)],
-                               [np.sin(a),  np.cos(a)]])
-
-        # we need the x,y listed in the first dimension
-        s1 = np.rollaxis(centred_skeleton, 1)
-
-        # for example, here is the first point of the first frame rotated:
-        # rot_matrix[:,:,0].dot(s1[:,0,0])
+        # All frames are rotated at once, rot_matrix[:,:,frame] * s[:,:,frame]
+        # with rot_matrix = [[cos(a), -sin(a)],[sin(a), cos(a)]]
+        x = centred_skeleton[:, 0, :]
+        y = centred_skeleton[:, 1, :]
+        rotated = np.empty(centred_skeleton.shape)
+        rotated[:, 0, :] = cos_a*x - sin_a*y
+        rotated[:, 1, :] = sin_a*x + cos_a*y
 
-        # ATTEMPTING TO CHANGE rot_matrix from 2x2x49xn to 2x49xn
-        # rot_matrix2 = np.ones((2, 2, np.shape(s1)[1], np.shape(s1)[2])) * rot_matrix
-
-        s1_rotated = []
-
-        # rotate the worm frame-by-frame and add these skeletons to a list
-        for frame_index in range(self.num_frames):
-            s1_rotated.append(rot_matrix[:, :, frame_index].dot(s1[:,:, frame_index]))
-        # print(np.shape(np.rollaxis(rot_matrix[:,:,0].dot(s1[:,:,0]),0)))
-
-        # save the list as a numpy array
-        s1_rotated = np.array(s1_rotated)
-
-        # fix the axis settings
-        return np.rollaxis(np.rollaxis(s1_rotated, 0, 3), 1)
+        self._orientation_free_skeleton_cache = (self.skeleton, rotated)
+        return rotated
 
 
     @property
@@ -550,3 +802,106 @@ class NormalizedWorm(BasicWorm, WormPartition):
         #TODO: This omits the properties above ...
         return utils.print_object(self)
 
+
+def convert_schafer_file(data_file_path, dir_path):
+    """
+    Converts a normalized worm file from the Schafer lab (see 
+    NormalizedWorm.from_schafer_file_factory) to a directory of .npy files,
+    which can be loaded lazily by NormalizedWorm.from_npy_directory_factory.
+    
+    This only needs to be done once per file.
+    """
+    nw = NormalizedWorm.from_schafer_file_factory(data_file_path)
+    nw.save_to_npy_directory(dir_path)
+
+
+def convert_floats(data, dtype):
+    """
+    Converts floating point data to dtype. The data may be an array, a 
+    RaggedFrames or a list of frames. Anything else is returned as is.
+    """
+    if isinstance(data, np.ndarray):
+        if np.issubdtype(data.dtype, np.floating):
+            return data.astype(dtype, copy=False)
+        return data
+    elif isinstance(data, RaggedFrames):
+        return RaggedFrames(convert_floats(data.data, dtype), data.offsets,
+                            data.is_valid)
+    elif isinstance(data, list):
+        return [convert_floats(frame, dtype) for frame in data]
+    else:
+        return data
+
+
+def needs_float_conversion(data, dtype):
+    """
+    Whether convert_floats(data, dtype) would change data
+    """
+    if isinstance(data, np.ndarray):
+        return np.issubdtype(data.dtype, np.floating) and data.dtype != dtype
+    elif isinstance(data, RaggedFrames):
+        return needs_float_conversion(data.data, dtype)
+    elif isinstance(data, list):
+        return any(needs_float_conversion(frame, dtype) for frame in data)
+    else:
+        return False
+
+
+def h__npyNeedsFloatConversion(file_path, dtype):
+    """
+    needs_float_conversion for an array that hasn't been loaded from a .npy
+    file yet. Only the file's header is read.
+    """
+    try:
+        data = np.load(file_path, mmap_mode='r')
+    except ValueError:
+        # Arrays of objects can't be memory mapped
+        return False
+    return needs_float_conversion(data, dtype)
+
+
+def is_per_frame(data, n_frames):
+    """
+    Whether data has a value for each of n_frames frames, see 
+    get_frame_range
+    """
+    if isinstance(data, np.ndarray):
+        return data.ndim > 0 and data.shape[-1] == n_frames
+    elif isinstance(data, (RaggedFrames, list)):
+        return len(data) == n_frames
+    else:
+        return False
+
+
+def get_frame_range(data, start, stop):
+    """
+    Returns frames start through stop-1 of a list of frames, a RaggedFrames,
+    or an array with frames along the last dimension. None is returned as is.
+    """
+    if data is None:
+        return None
+    elif isinstance(data, np.ndarray):
+        return data[..., start:stop]
+    else:
+        return data[start:stop]
+
+
+def calculate_pre_features_chunk(vulva_contour, non_vulva_contour, skeleton,
+                                 max_contour_points=None):
+    """
+    Calculates the pre-features of a set of frames, for use with a process 
+    pool (see NormalizedWorm.calculate_pre_features).
+    
+    Returns
+    -------
+    dict
+        The computed attributes, see PRE_FEATURE_NAMES
+    """
+    nw = NormalizedWorm()
+    nw.vulva_contour = vulva_contour
+    nw.non_vulva_contour = non_vulva_contour
+    nw.skeleton = skeleton
+    nw.h__calculatePreFeatures(max_contour_points)
+    
+    return dict((name, getattr(nw, name)) for name in PRE_FEATURE_NAMES 
+                if hasattr(nw, name))
@@ -14,11 +14,17 @@ License
 https://github.com/openworm/movement_validation/LICENSE.md
 
 """
+#This is set before the imports below as some of the modules use it
+__version__ = '0.1.0'
+
 from .NormalizedWorm import NormalizedWorm
 from .video_info import VideoInfo
 from .features.worm_features import WormFeatures
+from .features.worm_batch import WormBatch
+from .features.feature_cache import FeatureCache
 from .WormPlotter import WormPlotter
 from .basic_worm import BasicWorm
+from .ragged_frames import RaggedFrames
 
 from .features.feature_processing_options import FeatureProcessingOptions
 
@@ -26,9 +32,12 @@ from .statistics.histogram_manager import HistogramManager
 from .statistics.manager import StatisticsManager
 
 
-__all__ = ['BasicWorm'
+__all__ = ['BasicWorm',
+           'RaggedFrames',
             'NormalizedWorm',
 		'VideoInfo',
            'WormFeatures',
+           'WormBatch',
+           'FeatureCache',
            'FeatureProcessingOptions',
            'WormPlotter']
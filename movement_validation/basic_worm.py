@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 """
-BasicWorm, WormPartition, JSON_Serializer
+BasicWorm, WormPartition, JSON_Serializer, HDF5_Serializer
 
 Credit to Christopher R. Wagner at 
 http://robotfantastic.org/serializing-python-data-to-json-some-edge-cases.html    
@@ -18,11 +18,14 @@ import numpy as np
 import warnings
 import copy
 import h5py
+import os
+import base64
 
 import json
 from collections import namedtuple, Iterable, OrderedDict
 
 from . import utils
+from .ragged_frames import RaggedFrames
 
 
 class JSON_Serializer():
@@ -30,27 +33,118 @@ class JSON_Serializer():
     A class that can save all of its attributes to a JSON file, or 
     load them from a JSON file.
     
+    The file is written as it is generated, rather than building the 
+    whole document in memory first. Arrays are written as binary data 
+    (see save_to_JSON) so they don't need to be converted to and from 
+    one Python object per value.
+    
     """
     def __init__(self):
         pass
     
-    def save_to_JSON(self, JSON_path):
-        serialized_data = data_to_json(list(self.__dict__.items()))
+    def save_to_JSON(self, JSON_path, array_format='base64'):
+        """
+        Parameters
+        ----------
+        JSON_path : string
+        array_format : {'base64', 'npy', 'list'}
+            - 'base64' : the bytes of each array, base64 encoded
+            - 'npy' : each array is saved to a .npy file in a directory
+              next to the JSON file (see get_JSON_array_dir)
+            - 'list' : nested lists of values, as was done originally. 
+              This is much larger and slower.
+        """
+        members = [(name, getattr(self, name)) 
+                   for name in _get_attribute_names(self)]
 
         with open(JSON_path, 'w') as outfile:
-            outfile.write(serialized_data)
+            write_json(members, outfile, array_format, 
+                       get_JSON_array_dir(JSON_path))
 
     def load_from_JSON(self, JSON_path):
         with open(JSON_path, 'r') as infile:
-            serialized_data = infile.read()
-
-        member_list = json_to_data(serialized_data)
+            member_list = json.load(infile, object_hook=lambda dct: 
+                            restore(dct, os.path.dirname(JSON_path)))
         
         for member in member_list:
             setattr(self, member[0], member[1])
 
 
-class BasicWorm(JSON_Serializer):
+class HDF5_Serializer():
+    """
+    A class that can save all of its attributes to an HDF5 file, or load
+    them from an HDF5 file.
+    
+    Each array is saved as a compressed dataset with its original dtype. 
+    Arrays with one value per frame (along the last dimension) are chunked 
+    by frame so that a range of frames can be loaded without reading the 
+    rest of the file. Lists of per-frame arrays (with None for missing 
+    frames) and RaggedFrames are saved as the arrays of a RaggedFrames. 
+    All other attributes are saved as JSON (see data_to_json).
+    
+    Attributes starting with an underscore (e.g. cached values) are not 
+    saved.
+    
+    """
+    def save_to_HDF5(self, HDF5_path, compression='gzip'):
+        n_frames = self.h__getFrameCount()
+        
+        metadata = []
+        with h5py.File(HDF5_path, 'w') as h:
+            for name in _get_attribute_names(self):
+                value = getattr(self, name)
+                if isinstance(value, np.ndarray) and value.dtype != object:
+                    _write_array(h, name, value, n_frames, compression)
+                elif isinstance(value, RaggedFrames) or _is_frame_list(value):
+                    group = h.create_group(name)
+                    group.attrs['type'] = type(value).__name__
+                    if isinstance(value, list):
+                        value = RaggedFrames.from_list(value)
+                    for array_name, array in value.to_arrays().items():
+                        _write_array(group, array_name, array, None, 
+                                     compression)
+                else:
+                    metadata.append((name, value))
+            
+            h.attrs['metadata'] = data_to_json(metadata)
+
+    def load_from_HDF5(self, HDF5_path, frame_range=None):
+        """
+        Parameters
+        ----------
+        HDF5_path : string
+        frame_range : (start, stop) (optional)
+            If specified, only frames start through stop-1 are loaded.
+        """
+        with h5py.File(HDF5_path, 'r') as h:
+            for name, value in json_to_data(h.attrs['metadata']):
+                setattr(self, name, value)
+            
+            for name, item in h.items():
+                if isinstance(item, h5py.Group):
+                    value = _read_ragged_frames(item, frame_range)
+                    if item.attrs['type'] == 'list':
+                        value = list(value)
+                else:
+                    value = _read_array(item, frame_range)
+                setattr(self, name, value)
+
+
+    def h__getFrameCount(self):
+        """
+        The # of frames, based on the skeleton or contour. None if neither 
+        is set.
+        """
+        for name in ('skeleton', 'vulva_contour'):
+            value = getattr(self, name, None)
+            if isinstance(value, np.ndarray):
+                return value.shape[-1]
+            elif value is not None:
+                return len(value)
+        return None
+
+
+class BasicWorm(JSON_Serializer, HDF5_Serializer):
     """
     Encapsulates the notion of a worm contour data that might have
     been obtained from a computer vision operation 
@@ -71,6 +165,11 @@ class BasicWorm(JSON_Serializer):
             in the second case n_points is obviously fixed, and currently
             should be at 49.
             Missing frames in the first case should be identified by None.    
+            A RaggedFrames may be used in place of the list.
+    vulva_contour : [ndarray], RaggedFrames or ndarray
+    non_vulva_contour : [ndarray], RaggedFrames or ndarray
+        Same format as skeleton. from_schafer_file_factory stores these 
+        as RaggedFrames.
     
     is_stage_movement :
     is_valid : 
@@ -220,43 +319,49 @@ class BasicWorm(JSON_Serializer):
 
     
     @classmethod
-    def from_schafer_file_factory(cls,data_file_path):
-
+    def from_schafer_file_factory(cls, data_file_path, frame_range=None,
+                                  progress_callback=None):
+        """
+        Loads the contours from a file created by the Schafer lab code.
+        
+        Parameters
+        ----------
+        data_file_path : string
+        frame_range : (start, stop) (optional)
+            If specified only frames start through stop-1 are loaded.
+        progress_callback : function (optional)
+            Called as progress_callback(n_frames_loaded, n_frames) while 
+            the contours are loaded
+            
+        """
         self = cls()        
     
-        #Would 'with()' be more appropriate here ???
-        h = h5py.File(data_file_path, 'r')
-
-        #These are all HDF5 'references'
-        all_vulva_contours_refs = h['all_vulva_contours'].value
-        all_non_vulva_contours_refs = h['all_non_vulva_contours'].value
-        all_skeletons_refs = h['all_skeletons'].value
+        with h5py.File(data_file_path, 'r') as h:
+            is_stage_movement = utils._extract_time_from_disk(h,'is_stage_movement')
+            is_valid = utils._extract_time_from_disk(h,'is_valid')
+            
+            if frame_range is None:
+                frame_range = (0, is_valid.size)
+            frames = slice(*frame_range)
+            is_stage_movement = is_stage_movement[frames]
+            is_valid = is_valid[frames]
+            
+            #These are all HDF5 'references', one per frame. Only the ones
+            #in the frame range are read.
+            all_refs = [h['all_vulva_contours'][frames, 0],
+                        h['all_non_vulva_contours'][frames, 0]]
                 
-        is_stage_movement = utils._extract_time_from_disk(h,'is_stage_movement')
-        is_valid = utils._extract_time_from_disk(h,'is_valid')
-
-        all_skeletons = []
-        all_vulva_contours = []
-        all_non_vulva_contours = []
-
-        for valid_frame,iFrame in zip(is_valid,range(is_valid.size)):
-            if valid_frame:
-                all_skeletons.append(h[all_skeletons_refs[iFrame][0]].value) 
-                all_vulva_contours.append(h[all_vulva_contours_refs[iFrame][0]].value)
-                all_non_vulva_contours.append(h[all_non_vulva_contours_refs[iFrame][0]].value)
-            else:
-                all_skeletons.append(None) 
-                all_vulva_contours.append(None) 
-                all_non_vulva_contours.append(None)           
+            #NOTE: The skeletons ('all_skeletons') are not loaded as they
+            #are not used
+            all_vulva_contours, all_non_vulva_contours = \
+                read_referenced_frames(h, all_refs, is_valid, progress_callback)
                 
         self.is_stage_movement = is_stage_movement
         self.is_valid = is_valid
         self.skeleton = None
-        #self.all_skeletons = all_skeletons
         self.vulva_contour = all_vulva_contours
-        self.non_vulva_contour = all_non_vulva_contours 
+        self.non_vulva_contour = all_non_vulva_contours
         self.plate_wireframe_video_key = 'Cheeseburger? WTF is this?'
-        h.close()   
         
         return self
         
@@ -266,6 +371,12 @@ class BasicWorm(JSON_Serializer):
     
     
     
+#The reductions available in WormPartition.get_partition_stat
+PARTITION_STATS = {'mean': np.mean,
+                   'nanmean': np.nanmean,
+                   'nanstd': np.nanstd}
+
+
 class WormPartition():
     def __init__(self):
         print("In WormPartition initializer")
@@ -423,6 +534,214 @@ class WormPartition():
         else:
             return None
 
+    def get_partition_stat(self, partition_key, data_key='skeleton', 
+                           stat='mean'):
+        """
+        Reduces a partition of a measurement of the worm over its points, 
+        e.g. the mean width of the head in each frame.
+        
+        Each (data_key, partition_key, stat) is only computed once per worm 
+        and the result is shared by all callers, so it is read-only. It is
+        recomputed if the attribute is replaced, but not if it is modified
+        in place.
+        
+        Parameters
+        ----------
+        partition_key : string
+            A key of worm_partitions (e.g. 'head') or of 
+            worm_partition_subsets (e.g. 'first_third')
+        data_key : string
+            e.g. 'skeleton', 'angles' or 'widths'
+        stat : string
+            A key of PARTITION_STATS, i.e. 'mean', 'nanmean' or 'nanstd'
+            
+        Returns
+        -------
+        numpy.array
+            The first dimension of the data is reduced, so this is [n_frames]
+            for angles or widths, and [2 x n_frames] for the skeleton. 
+        """
+        # Not created in __init__ as worms are also created by copying
+        cache = self.__dict__.setdefault('_partition_stats', {})
+        
+        data = getattr(self, data_key)
+        key = (data_key, partition_key, stat)
+        if key in cache and cache[key][0] is data:
+            return cache[key][1]
+        
+        if partition_key in self.worm_partitions:
+            partition = data[slice(*self.worm_partitions[partition_key])]
+        else:
+            partition = data[self.get_subset_partition_mask(partition_key)]
+        
+        # Suppress RuntimeWarning: Mean of empty slice for those frames 
+        # that are ALL NaN.
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            value = PARTITION_STATS[stat](partition, axis=0)
+        
+        value.flags.writeable = False
+        cache[key] = (data, value)
+        
+        return value
+
+
+def _get_attribute_names(obj):
+    """
+    The attributes saved by JSON_Serializer and HDF5_Serializer. Those 
+    starting with an underscore (e.g. cached values) are not saved.
+    """
+    names = [name for name in obj.__dict__ if not name.startswith('_')]
+    # Arrays that have not been loaded yet, see 
+    # NormalizedWorm.from_npy_directory_factory
+    names.extend(obj.__dict__.get('_lazy_array_paths', {}))
+    return names
+
+
+#Arrays with one value per frame are chunked by this many frames, see
+#HDF5_Serializer
+HDF5_FRAMES_PER_CHUNK = 1000
+
+
+def _is_frame_list(value):
+    """
+    Whether a value is a list of per-frame arrays (or None)
+    """
+    return isinstance(value, list) and len(value) > 0 and \
+           all(x is None or isinstance(x, np.ndarray) for x in value)
+
+
+def _write_array(parent, name, value, n_frames, compression):
+    """
+    Writes an array to an HDF5 group, see HDF5_Serializer
+    """
+    attrs = {}
+    if value.dtype.kind == 'U':
+        # HDF5 has no equivalent of numpy's fixed length unicode strings
+        attrs['unicode_dtype'] = value.dtype.str
+        value = np.char.encode(value, 'utf-8')
+    
+    attrs['is_per_frame'] = n_frames is not None and value.ndim > 0 and \
+                            value.shape[-1] == n_frames
+    
+    options = {}
+    if value.size > 0 and value.ndim > 0:
+        options['compression'] = compression
+        if attrs['is_per_frame']:
+            options['chunks'] = value.shape[:-1] + \
+                                (min(n_frames, HDF5_FRAMES_PER_CHUNK),)
+        else:
+            options['chunks'] = True
+    
+    dataset = parent.create_dataset(name, data=value, **options)
+    for key, attr_value in attrs.items():
+        dataset.attrs[key] = attr_value
+
+
+def _read_array(dataset, frame_range=None):
+    """
+    Reads an array written by _write_array
+    """
+    if frame_range is not None and dataset.attrs['is_per_frame']:
+        value = dataset[..., slice(*frame_range)]
+    else:
+        value = dataset[()]
+    
+    if 'unicode_dtype' in dataset.attrs:
+        value = np.char.decode(value, 'utf-8').astype(
+                    dataset.attrs['unicode_dtype'])
+    return value
+
+
+def _read_ragged_frames(group, frame_range=None):
+    """
+    Reads RaggedFrames written by HDF5_Serializer
+    """
+    is_valid = group['is_valid']
+    if frame_range is None:
+        frame_range = (0, is_valid.shape[0])
+    start, stop, _ = slice(*frame_range).indices(is_valid.shape[0])
+    stop = max(start, stop)
+    
+    offsets = group['offsets'][start:stop + 1]
+    data = group['data'][..., offsets[0]:offsets[-1]]
+    return RaggedFrames(data, offsets - offsets[0], is_valid[start:stop])
+
+
+def read_referenced_frames(h, all_refs, is_valid, progress_callback=None,
+                           frames_per_batch=1000):
+    """
+    Reads per-frame datasets that are pointed to by HDF5 object references,
+    as in files saved by Matlab.
+    
+    Rather than creating a h5py Dataset for each frame, the low level API
+    is used to read each dataset directly into one array for each batch
+    of frames.
+    
+    Parameters
+    ----------
+    h : h5py.File
+    all_refs : [numpy.array]
+        Each element holds one reference per frame. Each reference points
+        to an array of size [n_dims x n_points]
+    is_valid : numpy.array
+        Frames that are not valid are not read
+    progress_callback : function (optional)
+        Called as progress_callback(n_frames_loaded, n_frames)
+    frames_per_batch : int
+    
+    Returns
+    -------
+    [RaggedFrames]
+        One for each element of all_refs
+    
+    """
+    n_frames = len(is_valid)
+    is_valid = np.asarray(is_valid, dtype=bool)
+    n_points = np.zeros((len(all_refs), n_frames), dtype=int)
+    all_data = [[] for refs in all_refs]
+    
+    for start_I in range(0, n_frames, frames_per_batch):
+        frame_I = np.flatnonzero(is_valid[start_I:start_I + frames_per_batch])
+        frame_I += start_I
+        for refs, cur_n_points, data in zip(all_refs, n_points, all_data):
+            datasets = [h5py.h5r.dereference(refs[I], h.id) for I in frame_I]
+            if len(datasets) == 0:
+                continue
+            shapes = np.array([dataset.shape for dataset in datasets])
+            n_dims = shapes[0, 0]
+            cur_n_points[frame_I] = shapes[:, 1]
+            
+            #Each frame is read as a contiguous [n_dims x n_points] block
+            flat_data = np.empty(n_dims*shapes[:, 1].sum())
+            flat_start = 0
+            for dataset, (_, n) in zip(datasets, shapes):
+                block = flat_data[flat_start:flat_start + n_dims*n]
+                dataset.read(h5py.h5s.ALL, h5py.h5s.ALL, 
+                             block.reshape((n_dims, n)))
+                flat_start += n_dims*n
+            
+            #Rearranging to [n_dims x n_points in batch]
+            n = shapes[:, 1]
+            frame_start = np.repeat(np.cumsum(n) - n, n)
+            point_I = np.arange(n.sum()) - frame_start
+            I = n_dims*frame_start + point_I
+            n_rep = np.repeat(n, n)
+            data.append(np.vstack([flat_data[I + dim*n_rep] 
+                                   for dim in range(n_dims)]))
+                                   
+        if progress_callback is not None:
+            progress_callback(min(start_I + frames_per_batch, n_frames), 
+                              n_frames)
+    
+    all_frames = []
+    for cur_n_points, data in zip(n_points, all_data):
+        offsets = np.zeros(n_frames + 1, dtype=int)
+        np.cumsum(cur_n_points, out=offsets[1:])
+        data = np.hstack(data) if len(data) > 0 else np.zeros((2, 0))
+        all_frames.append(RaggedFrames(data, offsets, is_valid))
+        
+    return all_frames
 
 
 def isnamedtuple(obj):
@@ -435,38 +754,58 @@ def isnamedtuple(obj):
            and hasattr(obj, "_asdict") \
            and callable(obj._asdict)
 
-def serialize(data):
+def serialize(data, serialize_array=None):
     """
+    
+    Parameters
+    ----------
+    data :
+    serialize_array : function (optional)
+        If specified, this is called on each numpy array rather than 
+        converting the array to a list
     """
+    def ser(value):
+        return serialize(value, serialize_array)
 
     if data is None or isinstance(data, (bool, int, float, str)):
         return data
     if isinstance(data, list):
-        return [serialize(val) for val in data]
+        return [ser(val) for val in data]
     if isinstance(data, OrderedDict):
         return {"py/collections.OrderedDict":
-                [[serialize(k), serialize(v)] for k, v in data.items()]}
+                [[ser(k), ser(v)] for k, v in data.items()]}
     if isnamedtuple(data):
         return {"py/collections.namedtuple": {
             "type":   type(data).__name__,
             "fields": list(data._fields),
-            "values": [serialize(getattr(data, f)) for f in data._fields]}}
+            "values": [ser(getattr(data, f)) for f in data._fields]}}
     if isinstance(data, dict):
         if all(isinstance(k, str) for k in data):
-            return {k: serialize(v) for k, v in data.items()}
-        return {"py/dict": [[serialize(k), serialize(v)] for k, v in data.items()]}
+            return {k: ser(v) for k, v in data.items()}
+        return {"py/dict": [[ser(k), ser(v)] for k, v in data.items()]}
     if isinstance(data, tuple):
-        return {"py/tuple": [serialize(val) for val in data]}
+        return {"py/tuple": [ser(val) for val in data]}
     if isinstance(data, set):
-        return {"py/set": [serialize(val) for val in data]}
+        return {"py/set": [ser(val) for val in data]}
     if isinstance(data, np.ndarray):
+        if serialize_array is not None and data.dtype != object:
+            return serialize_array(data)
         return {"py/numpy.ndarray": {
             "values": data.tolist(),
             "dtype":  str(data.dtype)}}
+    if isinstance(data, RaggedFrames):
+        return {"py/RaggedFrames": ser(data.to_arrays())}
     raise TypeError("Type %s not data-serializable" % type(data))
 
-def restore(dct):
+def restore(dct, base_dir=''):
     """
+    
+    Parameters
+    ----------
+    dct : dict
+    base_dir : string
+        The directory that the paths of arrays saved to .npy files (see 
+        write_json) are relative to
     """
 
     if "py/dict" in dct:
@@ -480,9 +819,17 @@ def restore(dct):
         return namedtuple(data["type"], data["fields"])(*data["values"])
     if "py/numpy.ndarray" in dct:
         data = dct["py/numpy.ndarray"]
+        if "base64" in data:
+            values = bytearray(base64.b64decode(data["base64"]))
+            return np.frombuffer(values, dtype=data["dtype"]).reshape(
+                                                            data["shape"])
+        if "npy" in data:
+            return np.load(os.path.join(base_dir, data["npy"]))
         return np.array(data["values"], dtype=data["dtype"])
     if "py/collections.OrderedDict" in dct:
         return OrderedDict(dct["py/collections.OrderedDict"])
+    if "py/RaggedFrames" in dct:
+        return RaggedFrames.from_arrays(dct["py/RaggedFrames"])
     return dct
 
 def data_to_json(data):
@@ -498,6 +845,101 @@ def json_to_data(s):
     return json.loads(s, object_hook=restore)
 
 
+class _BinaryArray(object):
+    """
+    Marks where an array goes when writing JSON, see write_json
+    """
+    def __init__(self, array):
+        self.array = array
+
+
+def get_JSON_array_dir(JSON_path):
+    """
+    The directory that holds the .npy files of a JSON file saved with the 
+    'npy' array format.
+    """
+    return os.path.splitext(JSON_path)[0] + '_arrays'
+
+
+def write_json(data, outfile, array_format='base64', array_dir=None):
+    """
+    Writes data as JSON to an open file, piece by piece.
+    
+    This gives the same document as data_to_json except for how arrays 
+    are written, which is controlled by array_format. json_to_data, or
+    JSON_Serializer.load_from_JSON, can read any of the formats.
+    
+    Parameters
+    ----------
+    data :
+    outfile : file
+    array_format : {'base64', 'npy', 'list'}
+        See JSON_Serializer.save_to_JSON
+    array_dir : string
+        Where to save arrays when using the 'npy' format. The paths written
+        to the JSON file are relative to the directory containing array_dir.
+    """
+    if array_format == 'list':
+        outfile.write(data_to_json(data))
+        return
+    elif array_format not in ('base64', 'npy'):
+        raise ValueError("Unrecognized array format: %s" % array_format)
+    
+    serialized_data = serialize(data, _BinaryArray)
+    
+    if array_format == 'npy' and not os.path.isdir(array_dir):
+        os.makedirs(array_dir)
+    
+    n_arrays = [0]
+    def write_array(array):
+        array = np.ascontiguousarray(array)
+        if array_format == 'npy':
+            file_name = 'array_%d.npy' % n_arrays[0]
+            n_arrays[0] += 1
+            np.save(os.path.join(array_dir, file_name), array)
+            outfile.write('{"py/numpy.ndarray": {"npy": %s}}' % json.dumps(
+                os.path.join(os.path.basename(array_dir), file_name)))
+            return
+            
+        outfile.write('{"py/numpy.ndarray": {"dtype": %s, "shape": %s, '
+                      '"base64": "' % (json.dumps(array.dtype.str), 
+                                       json.dumps(list(array.shape))))
+        values = memoryview(array.reshape(-1).view(np.uint8))
+        # Multiples of 3 bytes encode without padding
+        block_size = 3*2**16
+        for start_I in range(0, len(values), block_size):
+            outfile.write(base64.b64encode(
+                values[start_I:start_I + block_size]).decode('ascii'))
+        outfile.write('"}}')
+    
+    _write_json_value(serialized_data, outfile, write_array)
+
+
+def _write_json_value(value, outfile, write_array):
+    """
+    Recursive helper for write_json
+    """
+    if isinstance(value, _BinaryArray):
+        write_array(value.array)
+    elif isinstance(value, dict):
+        outfile.write('{')
+        for I, (key, sub_value) in enumerate(value.items()):
+            if I > 0:
+                outfile.write(', ')
+            outfile.write(json.dumps(key) + ': ')
+            _write_json_value(sub_value, outfile, write_array)
+        outfile.write('}')
+    elif isinstance(value, list):
+        outfile.write('[')
+        for I, sub_value in enumerate(value):
+            if I > 0:
+                outfile.write(', ')
+            _write_json_value(sub_value, outfile, write_array)
+        outfile.write(']')
+    else:
+        outfile.write(json.dumps(value))
+
+
 
 def nested_equal(v1, v2):
     """
@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+"""
+Computes the features of many normalized worm files, e.g. all of those of
+an experiment, and writes each to an HDF5 features file (see
+WormFeatures.write_to_disk).
+
+Files are processed on a pool of processes. Each completed file is added
+to a manifest in the output directory, so an interrupted run continues
+where it stopped when it's run again. A file that fails is reported and
+doesn't stop the others. As failed files aren't added to the manifest,
+they are tried again on the next run, as are files that were completed
+with another frame rate or other features.
+
+Usage
+-----
+python -m movement_validation.batch_features "data/*.mat" features_dir
+python -m movement_validation.batch_features --help
+
+Input files may be:
+- Schafer lab normalized worm files (.mat)
+- NormalizedWorm HDF5 files (.h5 or .hdf5), see BasicWorm.save_to_HDF5
+- directories of .npy files, see NormalizedWorm.save_to_npy_directory
+
+"""
+
+from __future__ import print_function, division
+
+import argparse
+import collections
+import concurrent.futures
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+try:
+    from concurrent.futures.process import BrokenProcessPool
+except ImportError:
+    BrokenProcessPool = RuntimeError
+
+from . import config
+from .NormalizedWorm import NormalizedWorm
+from .video_info import VideoInfo
+from .features.worm_features import WormFeatures
+from .features.feature_cache import FeatureCache
+from .features.feature_processing_options import FeatureProcessingOptions
+
+#The completed files, one JSON object per line, in the output directory
+MANIFEST_FILE = 'manifest.jsonl'
+
+#Appended to the name of each input file (without its extension) for the
+#name of its features file
+OUTPUT_SUFFIX = '_features.hdf5'
+
+HDF5_EXTENSIONS = ['.h5', '.hdf5']
+
+#A worker that dies (e.g. killed for using too much memory) stops the pool,
+#which is then restarted for the remaining files. The files that were being
+#processed are then tried again one at a time, and a file that was being 
+#processed when the pool stopped this many times fails.
+MAX_POOL_FAILURES = 2
+
+#Each worker is replaced after processing this many files, so that memory
+#that a file leaves behind (e.g. from fragmentation) doesn't add up. Only
+#used from Python 3.11.
+MAX_FILES_PER_WORKER = 1
+
+
+def process_files(input_paths, output_dir, fps=config.FPS, n_workers=None,
+                  max_memory=None, cache_dir=None, features_to_compute=None):
+    """
+    Computes and writes the features of each input file that isn't in the
+    manifest of output_dir yet.
+
+    Parameters
+    ----------
+    input_paths : [str]
+    output_dir : str
+    fps : float
+        The frame rate of all of the videos
+    n_workers : int
+        The # of processes. None processes the files in this process. The
+        workers may be started by importing the script that calls this
+        (see MAX_FILES_PER_WORKER), which then needs the 
+        "if __name__ == '__main__':" guard.
+    max_memory : int
+        The most memory (address space), in MB, that each worker may use.
+        A file that needs more fails with a MemoryError rather than
+        affecting the other workers. Only supported on Unix, and not used 
+        when n_workers is None, as the limit can't be removed from this 
+        process afterwards.
+    cache_dir : str
+        If given, features are cached here, see FeatureCache
+    features_to_compute : [str]
+        See FeatureProcessingOptions.features_to_compute
+
+    Returns
+    -------
+    dict
+        'completed', 'skipped' and 'failed' are lists of input paths.
+        'failures' has the error of each failed path, and 'n_frames' and
+        'elapsed_time' are for the completed files.
+    """
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    output_paths = get_output_paths(input_paths, output_dir)
+
+    if features_to_compute is not None:
+        # As saved in the manifest
+        features_to_compute = list(features_to_compute)
+
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    done = set(entry['input'] for entry in read_manifest(manifest_path)
+               if os.path.exists(entry['output']) and
+               entry.get('fps') == fps and
+               entry.get('features') == features_to_compute)
+
+    tasks = [(os.path.abspath(path), output_paths[path]) for path in
+             input_paths if os.path.abspath(path) not in done]
+    task_args = (fps, cache_dir, features_to_compute)
+
+    result = {'completed': [], 'failed': [], 'failures': {},
+              'skipped': [os.path.abspath(path) for path in input_paths
+                          if os.path.abspath(path) in done],
+              'n_frames': 0, 'elapsed_time': None}
+
+    print('%d files to process (%d already done)' %
+          (len(tasks), len(result['skipped'])))
+
+    start_time = time.time()
+    with open(manifest_path, 'a') as manifest:
+        for input_path, output, error in h__runTasks(tasks, task_args,
+                                                     n_workers, max_memory):
+            index = len(result['completed']) + len(result['failed']) + 1
+            name = os.path.basename(input_path)
+            if error is not None:
+                result['failed'].append(input_path)
+                result['failures'][input_path] = error
+                print('[%d/%d] %s failed: %s' % (index, len(tasks), name,
+                                                 error.splitlines()[-1]))
+                continue
+
+            entry = dict(output, input=input_path)
+            manifest.write(json.dumps(entry) + '\n')
+            manifest.flush()
+
+            result['completed'].append(input_path)
+            result['n_frames'] += entry['n_frames']
+            print('[%d/%d] %s: %d frames in %0.1fs (%0.0f frames/s)' %
+                  (index, len(tasks), name, entry['n_frames'],
+                   entry['elapsed_time'],
+                   entry['n_frames'] / max(entry['elapsed_time'], 1e-9)))
+
+    result['elapsed_time'] = time.time() - start_time
+
+    h__printSummary(result)
+
+    return result
+
+
+def get_output_paths(input_paths, output_dir):
+    """
+    Returns
+    -------
+    dict
+        The path of the features file of each input path
+
+    Raises
+    ------
+    ValueError
+        If two input files would have the same features file
+    """
+    output_paths = {}
+    inputs_by_output = {}
+    for path in input_paths:
+        name = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+        output_path = os.path.join(os.path.abspath(output_dir),
+                                   name + OUTPUT_SUFFIX)
+        if output_path in inputs_by_output:
+            raise ValueError('%s and %s would both be written to %s' %
+                             (inputs_by_output[output_path], path,
+                              output_path))
+        inputs_by_output[output_path] = path
+        output_paths[path] = output_path
+    return output_paths
+
+
+def read_manifest(manifest_path):
+    """
+    Returns
+    -------
+    [dict]
+        The entries of the completed files, see process_file. A partly
+        written last line (e.g. from a killed run) is ignored. A file that
+        was completed more than once (e.g. with other features) has an 
+        entry for each time, the last of which is the current one.
+    """
+    if not os.path.exists(manifest_path):
+        return []
+
+    entries = []
+    with open(manifest_path) as manifest:
+        for line in manifest:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                pass
+    return entries
+
+
+def load_normalized_worm(input_path):
+    """
+    Loads a normalized worm from any of the file types listed in the
+    module's documentation
+    """
+    extension = os.path.splitext(input_path)[1].lower()
+    if os.path.isdir(input_path):
+        return NormalizedWorm.from_npy_directory_factory(input_path)
+    elif extension == '.mat':
+        return NormalizedWorm.from_schafer_file_factory(input_path)
+    elif extension in HDF5_EXTENSIONS:
+        nw = NormalizedWorm()
+        nw.load_from_HDF5(input_path)
+        return nw
+    else:
+        raise ValueError('Unrecognized normalized worm file: %s' %
+                         input_path)
+
+
+def process_file(input_path, output_path, fps=config.FPS, cache_dir=None, 
+                 features_to_compute=None):
+    """
+    Computes and writes the features of one file. This is a module function
+    so that it can be run in another process.
+
+    The features are written to a temporary file that is renamed when it's
+    complete, so that output_path is never partly written.
+
+    Returns
+    -------
+    dict
+        The manifest entry of the file, without the input path
+    """
+    start_time = time.time()
+
+    nw = load_normalized_worm(input_path)
+
+    options = FeatureProcessingOptions(fps)
+    options.features_to_compute = features_to_compute
+    cache = FeatureCache(cache_dir) if cache_dir is not None else None
+
+    worm_features = WormFeatures(nw, VideoInfo(input_path, fps), options,
+                                 cache=cache)
+
+    temp_path = output_path + '.partial'
+    worm_features.write_to_disk(temp_path)
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    os.rename(temp_path, output_path)
+
+    return {'output': output_path, 'n_frames': int(nw.num_frames),
+            'elapsed_time': time.time() - start_time, 'fps': fps,
+            'features': features_to_compute}
+
+
+def h__limitMemory(max_memory):
+    """
+    Limits the memory of this process, which is a worker of the pool, see
+    process_files
+    """
+    if max_memory is not None and resource is not None:
+        limit = int(max_memory * 1024**2)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def h__runTask(input_path, output_path, task_args, max_memory=None):
+    """
+    Runs process_file, returning the error as text rather than raising it
+    so that exceptions that can't be pickled still get back to the main
+    process
+
+    Parameters
+    ----------
+    max_memory : int
+        Only given in workers of pools that can't be given an initializer
+        (before Python 3.7), see h__createPool
+    """
+    try:
+        h__limitMemory(max_memory)
+        return process_file(input_path, output_path, *task_args), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def h__createPool(n_workers, max_memory):
+    """
+    Returns
+    -------
+    (concurrent.futures.ProcessPoolExecutor, int)
+        The pool and the memory limit that each task needs to set itself,
+        which is None when the pool's initializer sets it
+    """
+    pool_kwargs = {'initializer': h__limitMemory, 'initargs': (max_memory,)}
+    try:
+        return concurrent.futures.ProcessPoolExecutor(
+                    n_workers, max_tasks_per_child=MAX_FILES_PER_WORKER,
+                    **pool_kwargs), None
+    except TypeError:
+        # Before Python 3.11
+        pass
+    try:
+        return concurrent.futures.ProcessPoolExecutor(n_workers, 
+                                                      **pool_kwargs), None
+    except TypeError:
+        # Before Python 3.7
+        return concurrent.futures.ProcessPoolExecutor(n_workers), max_memory
+
+
+def h__runTasks(tasks, task_args, n_workers, max_memory=None):
+    """
+    Yields (input path, manifest entry, error) in the order that the files
+    are completed. Either the entry or the error is None.
+    """
+    if n_workers is None:
+        if max_memory is not None:
+            print('The memory limit is only used with workers')
+        for input_path, output_path in tasks:
+            output, error = h__runTask(input_path, output_path, task_args)
+            yield input_path, output, error
+        return
+
+    # Only as many files as there are workers are submitted at a time, so 
+    # that when the pool stops only the files being processed are affected
+    pending = collections.deque(tasks)
+    n_pool_failures = collections.Counter()
+    while pending:
+        executor, task_max_memory = h__createPool(n_workers, max_memory)
+        with executor:
+            running = {}
+            is_broken = False
+            while running or (pending and not is_broken):
+                while pending and not is_broken and len(running) < n_workers:
+                    # Files that were being processed when the pool stopped
+                    # are processed alone, to find the one that stopped it
+                    is_alone = any(n_pool_failures[task[0]] 
+                                   for task in running.values())
+                    if running and (is_alone or n_pool_failures[pending[0][0]]):
+                        break
+                    task = pending.popleft()
+                    try:
+                        future = executor.submit(h__runTask, task[0], 
+                                                 task[1], task_args,
+                                                 task_max_memory)
+                    except BrokenProcessPool:
+                        pending.appendleft(task)
+                        is_broken = True
+                        break
+                    running[future] = task
+
+                if not running:
+                    break
+
+                done, not_done = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    try:
+                        output, error = future.result()
+                    except BrokenProcessPool:
+                        is_broken = True
+                        n_pool_failures[task[0]] += 1
+                        if n_pool_failures[task[0]] < MAX_POOL_FAILURES:
+                            pending.appendleft(task)
+                            continue
+                        output, error = None, traceback.format_exc()
+                    except Exception:
+                        output, error = None, traceback.format_exc()
+                    yield task[0], output, error
+
+
+def h__printSummary(result):
+    elapsed_time = result['elapsed_time']
+    print('Completed %d files (%d frames) in %0.1fs, %0.2f files/s, '
+          '%0.0f frames/s' %
+          (len(result['completed']), result['n_frames'], elapsed_time,
+           len(result['completed']) / max(elapsed_time, 1e-9),
+           result['n_frames'] / max(elapsed_time, 1e-9)))
+
+    if result['failed']:
+        print('%d files failed:' % len(result['failed']))
+        for input_path in result['failed']:
+            print('  %s: %s' % (input_path,
+                                result['failures'][input_path].splitlines()[-1]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compute the features of normalized worm files')
+    parser.add_argument('inputs', nargs='+',
+                        help='Input files or glob patterns, e.g. "data/*.mat"')
+    parser.add_argument('output_dir',
+                        help='Where the features files and the manifest of '
+                             'completed files are written')
+    parser.add_argument('--fps', type=float, default=config.FPS,
+                        help='Frame rate of the videos (default %(default)s)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='# of processes (default: # of CPUs). 0 '
+                             'processes the files in this process.')
+    parser.add_argument('--max-memory', type=float, default=None,
+                        help='Memory limit of each worker, in MB (Unix, '
+                             'not used with --workers 0)')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Directory of a feature cache to use')
+    parser.add_argument('--features', nargs='+', default=None,
+                        help='Only compute these features (and the ones '
+                             'they need), e.g. posture.coils path')
+    args = parser.parse_args(argv)
+
+    input_paths = []
+    for pattern in args.inputs:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            print('No files match %s' % pattern)
+        input_paths.extend(path for path in matches
+                           if path not in input_paths)
+
+    if args.workers is None:
+        n_workers = multiprocessing.cpu_count()
+    else:
+        n_workers = args.workers if args.workers > 0 else None
+
+    result = process_files(input_paths, args.output_dir, args.fps,
+                           n_workers, args.max_memory, args.cache_dir,
+                           args.features)
+
+    return 1 if result['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+Computes the features of long recordings (e.g. overnight recordings with
+millions of frames) a window of frames at a time, so that the memory used
+while computing the features depends on the size of the windows rather than
+on the length of the recording.
+
+Most features of a frame only depend on the frames around it, e.g. the
+velocity of a frame uses frames up to about velocity_body_diff seconds
+away. These are computed on overlapping windows, which extend past the
+frames that are kept by the # of frames that the features depend on (see
+get_feature_support), so the stitched values are the same as when all of
+the frames are computed at once.
+
+Features that are computed from the whole recording (e.g. the motion events
+or the crawling bends, which interpolate over gaps of any length and take
+the FFT of the bend angles between pauses) are then computed from per-frame
+values that were stitched together from the windows, e.g. the midbody speed,
+the mean bend angles, or the centroid of the contour for the path range 
+(which is relative to the mean of the centroids of all of the frames). These
+are 1-d, so are small compared to the worm's data.
+
+The path duration needs the skeleton of every frame at once, so isn't 
+computed (see UNSUPPORTED_FEATURES).
+
+For the worm's data to not be loaded all at once, the worm should be one
+that's loaded as it's used, e.g. from NormalizedWorm.from_npy_directory_factory.
+
+Usage
+-----
+nw = NormalizedWorm.from_npy_directory_factory('/path/to/worm')
+wf = compute_features_in_chunks(nw, video_info, chunk_size=50000)
+
+"""
+
+import copy
+import warnings
+
+import numpy as np
+
+from . import feature_processing_options as fpo
+from . import locomotion_bends
+from . import locomotion_features
+from . import locomotion_turns
+from . import path_features
+from . import posture_features
+from . import velocity as velocity_module
+from . import worm_features
+from .worm_features import WormFeatures
+from .feature_timer import FeatureTimer
+
+#The # of frames whose features are kept from each window
+DEFAULT_CHUNK_SIZE = 100000
+
+#Features whose values in a frame only depend on the worm's data in that
+#frame
+FRAME_FEATURES = ['morphology.length',
+                  'morphology.width',
+                  'morphology.area',
+                  'morphology.area_per_length',
+                  'morphology.width_per_length',
+                  'posture.bends',
+                  'posture.eccentricity',
+                  'posture.amplitude_and_wavelength',
+                  'posture.kinks',
+                  'posture.directions',
+                  'posture.skeleton',
+                  'posture.eigen_projection',
+                  'path.coordinates']
+
+#Features that are computed from the whole recording, after the windows
+RECORDING_FEATURES = ['locomotion.motion_events',
+                      'locomotion.motion_mode',
+                      'locomotion.crawling_bends',
+                      'locomotion.foraging_bends',
+                      'locomotion.turns',
+                      'posture.coils',
+                      'path.range']
+
+#Features that need all of the worm's data at once, i.e. the path duration,
+#which is found from the skeleton points of all of the frames. These are set
+#to None.
+UNSUPPORTED_FEATURES = ['path.duration']
+
+
+def get_feature_support(feature_name, options, fps):
+    """
+    Parameters
+    ----------
+    feature_name : str
+        e.g. 'locomotion.velocity', see fpo.FEATURE_DEPENDENCIES
+    options : FeatureProcessingOptions
+    fps : float
+
+    Returns
+    -------
+    int
+        The # of frames before and after a frame that the feature's values
+        in the frame depend on. None for features that depend on all of the
+        frames, see RECORDING_FEATURES and UNSUPPORTED_FEATURES.
+    """
+    if feature_name in FRAME_FEATURES:
+        return 0
+    elif feature_name == 'locomotion.velocity':
+        # See velocity.h__getVelocityIndices, which moves up to
+        # frames_per_sample - 1 frames away when frames are missing
+        locomotion_options = options.locomotion
+        return max(velocity_module.get_frames_per_sample(fps, sample_time)
+                   for sample_time in (locomotion_options.velocity_tip_diff,
+                                       locomotion_options.velocity_body_diff)) - 1
+    elif feature_name == 'path.curvature':
+        # The velocity, and then differences of the velocity frame_scale
+        # frames apart, see path_features.worm_path_curvature
+        frame_scale = velocity_module.get_frames_per_sample(
+                                    fps, path_features.CURVATURE_BODY_DIFF)
+        return 2 * frame_scale
+    elif feature_name in RECORDING_FEATURES or \
+            feature_name in UNSUPPORTED_FEATURES:
+        return None
+    else:
+        raise ValueError('Unrecognized feature: %s' % feature_name)
+
+
+def compute_features_in_chunks(nw, video_info, processing_options=None,
+                               chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Computes the features of a worm a window of frames at a time, see the
+    module's documentation.
+
+    Parameters
+    ----------
+    nw : movement_validation.NormalizedWorm
+    video_info : movement_validation.video_info
+    processing_options : FeatureProcessingOptions (optional)
+        features_to_compute and features_to_ignore are respected
+    chunk_size : int
+        The # of frames whose features are kept from each window. The
+        windows are longer by the support of the features on either side.
+
+    Returns
+    -------
+    WormFeatures
+        Features in UNSUPPORTED_FEATURES, and the ones that weren't
+        requested, are None. The worm isn't kept (nw is None).
+    """
+    if processing_options is None:
+        processing_options = fpo.FeatureProcessingOptions(video_info.fps)
+
+    fps = video_info.fps
+    n_frames = nw.num_frames
+
+    to_compute = processing_options.get_features_to_compute()
+
+    unsupported = [name for name in UNSUPPORTED_FEATURES
+                   if name in to_compute]
+    if unsupported:
+        warnings.warn('These features are not computed in chunks: %s' %
+                      ', '.join(unsupported))
+
+    window_features = sorted(name for name in to_compute if
+                             get_feature_support(name, processing_options,
+                                                 fps) is not None)
+
+    #The windows compute the features that aren't computed from the whole
+    #recording
+    window_options = copy.deepcopy(processing_options)
+    window_options.features_to_compute = window_features
+    window_options.features_to_ignore = []
+
+    support = max([0] + [get_feature_support(name, processing_options, fps)
+                         for name in window_features])
+    if 'locomotion.foraging_bends' in to_compute:
+        # See LocomotionForagingBends.get_nose_bend_angles
+        foraging_options = processing_options.locomotion.foraging_bends
+        support = max(support, foraging_options.max_samples_interp_nose + 1)
+
+    timer = FeatureTimer(n_frames, processing_options.track_memory)
+
+    # Features of the windows, and the per-frame values that the features
+    # of the whole recording are computed from
+    stitched = None
+    for start in range(0, n_frames, chunk_size):
+        stop = min(start + chunk_size, n_frames)
+        window_start = max(0, start - support)
+        window_stop = min(n_frames, stop + support)
+
+        print('Computing features of frames %d to %d of %d' %
+              (start, stop, n_frames))
+
+        window_nw = nw.get_frame_range(window_start, window_stop)
+        window = WormFeatures(window_nw, video_info, window_options)
+        timer.merge(window.timer)
+
+        window_values = {'sections': [getattr(window, name) for name in
+                                      WormFeatures.section_classes]}
+        if 'locomotion.crawling_bends' in to_compute:
+            window_values['avg_bend_angles'] = locomotion_bends.\
+                LocomotionCrawlingBends.get_average_bend_angles(
+                    window, window.nw.angles)
+        if 'locomotion.foraging_bends' in to_compute:
+            window_values['nose_bend_angles'] = locomotion_bends.\
+                LocomotionForagingBends.get_nose_bend_angles(window)
+        if 'locomotion.turns' in to_compute:
+            window_values['turn_values'] = locomotion_turns.\
+                LocomotionTurns.get_turn_values(window, window.nw.angles)
+        if 'path.range' in to_compute:
+            window_values['contour_centroid'] = list(path_features.Range.\
+                get_contour_centroid(window.nw.contour_x, 
+                                     window.nw.contour_y))
+
+        n_window_frames = window_stop - window_start
+        keep = slice(start - window_start, stop - window_start)
+        if stitched is None:
+            stitched = h__allocate(window_values, n_window_frames, n_frames)
+        h__fill(stitched, window_values, n_window_frames, n_frames, keep,
+                slice(start, stop))
+
+        del window, window_nw, window_values
+
+    features_ref = WormFeatures.__new__(WormFeatures)
+    features_ref.video_info = video_info
+    features_ref.options = processing_options
+    features_ref.nw = nw
+    features_ref.cache = None
+    features_ref.timer = timer
+
+    for name, section in zip(WormFeatures.section_classes,
+                             stitched['sections']):
+        setattr(features_ref, name, section)
+
+    # Features that the windows didn't compute are None, including the
+    # unsupported ones
+    h__computeRecordingFeatures(features_ref, stitched, to_compute)
+
+    # The features don't keep the worm, which may be large
+    features_ref.nw = None
+
+    return features_ref
+
+
+def h__computeRecordingFeatures(features_ref, stitched, to_compute):
+    """
+    Computes the features in RECORDING_FEATURES from the stitched per-frame
+    values, in the same way as WormLocomotion and WormPosture do
+    """
+    nw = features_ref.nw
+    options = features_ref.options
+    timer = features_ref.timer
+    locomotion = features_ref.locomotion
+    posture = features_ref.posture
+    path = features_ref.path
+    dtype = options.dtype
+
+    length = np.asarray(nw.length)
+    if np.issubdtype(length.dtype, np.floating):
+        length = length.astype(dtype, copy=False)
+
+    if 'locomotion.motion_events' in to_compute:
+        with timer.span('locomotion.motion_events'):
+            locomotion.motion_events = locomotion_features.MotionEvents(
+                features_ref, locomotion.velocity.midbody.speed, length)
+
+    if 'locomotion.motion_mode' in to_compute:
+        with timer.span('locomotion.motion_mode'):
+            locomotion.motion_mode = \
+                locomotion.motion_events.get_motion_mode()
+
+    if 'locomotion.crawling_bends' in to_compute:
+        with timer.span('locomotion.crawling_bends'):
+            locomotion.crawling_bends = locomotion_bends.\
+                LocomotionCrawlingBends.from_average_bend_angles(
+                    features_ref, stitched['avg_bend_angles'],
+                    locomotion.motion_events.is_paused, nw.is_segmented)
+
+    if 'locomotion.foraging_bends' in to_compute:
+        with timer.span('locomotion.foraging_bends'):
+            locomotion.foraging_bends = locomotion_bends.\
+                LocomotionForagingBends.from_nose_bend_angles(
+                    features_ref, stitched['nose_bend_angles'],
+                    nw.ventral_mode)
+
+    if 'locomotion.turns' in to_compute:
+        with timer.span('locomotion.turns'):
+            locomotion.turns = locomotion_turns.LocomotionTurns.\
+                from_turn_values(features_ref, stitched['turn_values'],
+                                 nw.segmentation_status == 'm',
+                                 locomotion.velocity.get_midbody_distance())
+
+    if 'posture.coils' in to_compute:
+        with timer.span('posture.coils'):
+            posture.coils = posture_features.get_worm_coils(
+                features_ref, locomotion.velocity.get_midbody_distance())
+
+    if 'path.range' in to_compute:
+        with timer.span('path.range'):
+            path.range = path_features.Range.from_contour_centroid(
+                *stitched['contour_centroid'])
+
+    # Stored with the precision of the options, as in WormFeatures
+    for section, name in [(locomotion, 'motion_events'), 
+                          (locomotion, 'crawling_bends'),
+                          (locomotion, 'foraging_bends'),
+                          (locomotion, 'turns'),
+                          (posture, 'coils'),
+                          (path, 'range')]:
+        setattr(section, name, worm_features.h__convertFeatureFloats(
+                                        getattr(section, name), dtype))
+
+
+def h__isPerFrame(value, n_frames):
+    return isinstance(value, np.ndarray) and value.ndim > 0 and \
+        value.shape[-1] == n_frames
+
+
+def h__allocate(value, n_window_frames, n_frames):
+    """
+    Returns a copy of the values of the first window in which the arrays
+    with a value for each frame of the window have one for each frame of the
+    recording instead, which are filled in by h__fill. Objects, dicts and
+    lists are copied, recursively. Private attributes (e.g. those kept by
+    lazy sections) are dropped.
+    """
+    if h__isPerFrame(value, n_window_frames):
+        return np.empty(value.shape[:-1] + (n_frames,), dtype=value.dtype)
+    elif isinstance(value, dict):
+        return dict((key, h__allocate(x, n_window_frames, n_frames))
+                    for key, x in value.items())
+    elif isinstance(value, list):
+        return [h__allocate(x, n_window_frames, n_frames) for x in value]
+    elif hasattr(value, '__dict__') and not isinstance(value, type):
+        allocated = copy.copy(value)
+        for name, x in list(vars(value).items()):
+            if name.startswith('_'):
+                delattr(allocated, name)
+            else:
+                setattr(allocated, name,
+                        h__allocate(x, n_window_frames, n_frames))
+        return allocated
+    else:
+        return value
+
+
+def h__fill(stitched, value, n_window_frames, n_frames, keep, frames):
+    """
+    Copies the kept frames of the values of a window into the stitched
+    values, see h__allocate
+
+    Parameters
+    ----------
+    keep : slice
+        The frames of the window to keep
+    frames : slice
+        The frames of the recording that these are
+    """
+    if isinstance(stitched, np.ndarray):
+        if h__isPerFrame(stitched, n_frames) and \
+                h__isPerFrame(value, n_window_frames):
+            stitched[..., frames] = value[..., keep]
+    elif isinstance(stitched, dict):
+        for key in stitched:
+            h__fill(stitched[key], value[key], n_window_frames, n_frames,
+                    keep, frames)
+    elif isinstance(stitched, list):
+        for stitched_x, x in zip(stitched, value):
+            h__fill(stitched_x, x, n_window_frames, n_frames, keep, frames)
+    elif hasattr(stitched, '__dict__') and not isinstance(stitched, type):
+        for name, x in vars(stitched).items():
+            h__fill(x, getattr(value, name), n_window_frames, n_frames,
+                    keep, frames)
@@ -291,7 +291,7 @@ class EventFinder:
         assert(len(np.shape(event_data)) == 1)
         assert(np.shape(event_data) == np.shape(event_mask))
         assert(event_mask.dtype == bool)
-        assert(event_data.dtype == float)
+        assert(np.issubdtype(event_data.dtype, np.floating))
 
         # We concatenate falses to ensure event starts and stops at the edges
         # are caught
@@ -985,6 +985,10 @@ class EventListWithFeatures(EventList):
             file_ref = frames.file
             for key in frames:
                 ref_array = frames[key]
+                if h5py.check_dtype(ref=ref_array.dtype) is None:
+                    # Saved by to_disk, as a flat array of values
+                    frame_values[key] = ref_array.value.ravel()
+                    continue
                 try:
                     # Yikes, getting the indexing right here was a PITA
                 
@@ -1036,6 +1040,14 @@ class EventListWithFeatures(EventList):
         else:
             raise Exception('Other formats not yet supported :/')
 
+        if 'totalTime' in event_ref:
+            # Saved by to_disk, which also works with no events and without
+            # the morphology
+            self.num_video_frames = int(
+                event_ref['numVideoFrames'].value[0][0])
+            self.total_time = event_ref['totalTime'].value[0][0]
+            return self
+
         # Num_video_frames - CRAP: :/   - @JimHokanson
         # Look away ...
         temp_length = file_ref['worm/morphology/length']
@@ -1046,6 +1058,53 @@ class EventListWithFeatures(EventList):
 
         return self
 
+    def to_disk(self, event_ref):
+        """
+        Saves the events so that they can be loaded by from_disk, using the 
+        MRC names. Rather than the Matlab structure array of references, 
+        each of the frame values is saved as one array.
+
+        Parameters
+        ---------------------------------------
+        event_ref : h5py.Group
+          The (empty) group of the event, e.g. 'worm/posture/coils'
+
+        """
+        if self.is_null:
+            # from_disk takes a dataset (rather than a group) to mean null
+            event_ref.create_dataset('frames', shape=(0, 0), dtype=float)
+            return
+
+        has_ratio = not np.isnan(self.data_ratio)
+
+        frames = event_ref.create_group('frames')
+        frame_values = [('start', self.start_frames),
+                        ('end', self.end_frames),
+                        ('time', self.event_durations),
+                        ('interTime', 
+                         np.append(self.time_between_events, np.NaN)),
+                        ('interDistance', 
+                         np.append(self.distance_between_events, np.NaN))]
+        if hasattr(self, 'is_ventral'):
+            frame_values.append(('isVentral', self.is_ventral))
+        if has_ratio:
+            frame_values.append(('distance', self.distance_during_events))
+
+        for key, value in frame_values:
+            utils._write_time_to_disk(frames, key, value)
+
+        utils._write_time_to_disk(event_ref, 'frequency', self.frequency)
+        utils._write_time_to_disk(event_ref, 'totalTime', self.total_time)
+        utils._write_time_to_disk(event_ref, 'numVideoFrames', 
+                                  self.num_video_frames)
+
+        if has_ratio:
+            ratio = event_ref.create_group('ratio')
+            utils._write_time_to_disk(ratio, 'time', self.time_ratio)
+            utils._write_time_to_disk(ratio, 'distance', self.data_ratio)
+        else:
+            utils._write_time_to_disk(event_ref, 'timeRatio', self.time_ratio)
+
     def __repr__(self):
         return utils.print_object(self)
 
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+This module defines the FeatureCache class, which keeps computed features
+on disk so that they don't need to be computed again for the same worm.
+
+"""
+
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+
+from .. import __version__
+from .. import utils
+from ..ragged_frames import RaggedFrames
+from . import feature_processing_options as fpo
+
+#The version of the code of each feature, which is part of the feature's
+#cache key. Increase the version of a feature here when a change to its
+#code changes its values, so that values computed by the older code are no
+#longer used. Features that aren't listed are at version 0.
+FEATURE_CODE_VERSIONS = {}
+
+#The options (attributes of FeatureProcessingOptions) that the features of
+#each section depend on. Options of the features' dependencies are included
+#through the keys of the dependencies.
+SECTION_OPTIONS = {'morphology': [],
+                   'locomotion': ['locomotion'],
+                   'posture': ['posture'],
+                   'path': []}
+
+#Options that all of the features depend on
+COMMON_OPTIONS = ['mimic_old_behaviour', 'dtype']
+
+#The file of each entry is named after its key
+ENTRY_EXTENSION = '.pkl'
+
+
+class FeatureCache(object):
+
+    """
+    Stores the values of each computed feature in a directory, keyed by a
+    hash of:
+    - the worm's data (the arrays of the normalized worm) and frame rate
+    - the processing options that the feature depends on
+    - the package version and the feature's version in FEATURE_CODE_VERSIONS
+    - the keys of the features that it needs
+
+    Changing an option only invalidates the features that depend on it.
+
+    When the entries take up more than max_size bytes, the least recently
+    used ones are removed. The size of the entries is found from the files
+    once, and then kept up to date as entries are stored, so entries stored
+    by other processes are only counted when entries are next removed.
+
+    The worm's data are only hashed the first time that a feature of the
+    worm is looked up, so modifying the worm in place after that isn't
+    noticed. Settings in user_config aren't part of the key, so the cache
+    should be cleared after changing them.
+
+    Usage
+    -----
+    cache = FeatureCache('/path/to/cache')
+    wf = WormFeatures(nw, video_info, cache=cache)
+
+    #After changing the code of the coils (or bumping its entry in
+    #FEATURE_CODE_VERSIONS)
+    cache.invalidate(['posture.coils'])
+
+    Attributes
+    ----------
+    cache_dir : str
+    max_size : int
+        In bytes. None for no limit.
+    n_hits : int
+    n_misses : int
+
+    """
+
+    def __init__(self, cache_dir, max_size=2 * 1024**3):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.n_hits = 0
+        self.n_misses = 0
+
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        #((ids), (weak references), {feature name: key}) of the worm,
+        #video_info and options of the most recent worm, see get_key. The
+        #weak references check that the ids haven't been reused, without
+        #keeping the worm in memory.
+        self._last_worm = None
+
+        #The # of bytes taken up by the entries, see h__updateSize
+        self._size = None
+
+    def load(self, features_ref, feature_name):
+        """
+        Parameters
+        ----------
+        features_ref : WormFeatures
+        feature_name : str
+            e.g. 'posture.coils', see
+            feature_processing_options.FEATURE_DEPENDENCIES
+
+        Returns
+        -------
+        dict
+            The attributes that the feature sets, by name. None if the
+            feature isn't in the cache.
+        """
+        file_path = self.h__getEntryPath(feature_name,
+                                         self.get_key(features_ref,
+                                                      feature_name))
+        try:
+            with open(file_path, 'rb') as infile:
+                values = pickle.load(infile)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            #Missing, or removed or partly written by another process
+            self.n_misses += 1
+            return None
+
+        #The modification time is used as the time of last use
+        try:
+            os.utime(file_path, None)
+        except OSError:
+            pass
+
+        self.n_hits += 1
+        return values
+
+    def store(self, features_ref, feature_name, values):
+        """
+        Parameters
+        ----------
+        features_ref : WormFeatures
+        feature_name : str
+        values : dict
+            The attributes that the feature sets, by name, see load
+        """
+        file_path = self.h__getEntryPath(feature_name,
+                                         self.get_key(features_ref,
+                                                      feature_name))
+        entry_dir = os.path.dirname(file_path)
+        if not os.path.isdir(entry_dir):
+            try:
+                os.makedirs(entry_dir)
+            except OSError:
+                #Created by another process in the meantime
+                pass
+
+        try:
+            old_size = os.path.getsize(file_path)
+        except OSError:
+            old_size = 0
+
+        #The entry is written to a temporary file first so that other
+        #processes never read part of it
+        handle, temp_path = tempfile.mkstemp(dir=entry_dir,
+                                             suffix='.tmp')
+        with os.fdopen(handle, 'wb') as outfile:
+            pickle.dump(values, outfile, pickle.HIGHEST_PROTOCOL)
+            new_size = outfile.tell()
+        h__replaceFile(temp_path, file_path)
+
+        self.h__updateSize(new_size - old_size)
+
+    def get_key(self, features_ref, feature_name):
+        """
+        Returns
+        -------
+        str
+            The hash of the values that the feature depends on, see
+            FeatureCache
+        """
+        nw = features_ref.nw
+        video_info = features_ref.video_info
+        options = features_ref.options
+
+        objects = (nw, video_info, options)
+        ids = tuple(id(x) for x in objects)
+
+        last_worm = self._last_worm
+        if last_worm is None or last_worm[0] != ids or \
+                any(ref() is not x for ref, x in zip(last_worm[1], objects)):
+            worm_hash = hashlib.sha1()
+            h__updateWormHash(worm_hash, nw)
+            worm_hash.update(repr(video_info.fps).encode('utf-8'))
+            last_worm = (ids, tuple(weakref.ref(x) for x in objects),
+                         {'': worm_hash.hexdigest()})
+            self._last_worm = last_worm
+
+        keys = last_worm[2]
+        if feature_name not in keys:
+            section_name = feature_name.split('.')[0]
+            option_names = COMMON_OPTIONS + SECTION_OPTIONS[section_name]
+            option_values = [(name, getattr(options, name))
+                             for name in option_names]
+
+            feature_hash = hashlib.sha1()
+            for value in [keys[''], __version__, feature_name,
+                          FEATURE_CODE_VERSIONS.get(feature_name, 0),
+                          h__optionsToText(option_values)]:
+                feature_hash.update(str(value).encode('utf-8'))
+            for dependency in fpo.FEATURE_DEPENDENCIES[feature_name]:
+                feature_hash.update(
+                    self.get_key(features_ref, dependency).encode('utf-8'))
+            keys[feature_name] = feature_hash.hexdigest()
+
+        return keys[feature_name]
+
+    def invalidate(self, feature_names):
+        """
+        Removes the entries of features, for all worms and options.
+
+        Parameters
+        ----------
+        feature_names : [str]
+            Features or sections, e.g. 'posture.coils' or 'path'. Features
+            that need these features keep their entries, but as their keys
+            include the keys of these features the entries won't be used
+            again (and will eventually be evicted).
+        """
+        for feature_name in fpo.h__expandFeatureNames(feature_names):
+            entry_dir = os.path.join(self.cache_dir, feature_name)
+            if os.path.isdir(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+
+        #Found from the files again when it's next needed
+        self._size = None
+
+    def clear(self):
+        """
+        Removes all of the entries
+        """
+        self.invalidate(fpo.FEATURE_SECTIONS)
+
+    def get_size(self):
+        """
+        Returns
+        -------
+        int
+            The # of bytes taken up by the entries
+        """
+        return sum(size for path, size, last_used in self.h__getEntries())
+
+    def h__getEntryPath(self, feature_name, key):
+        return os.path.join(self.cache_dir, feature_name,
+                            key + ENTRY_EXTENSION)
+
+    def h__getEntries(self):
+        """
+        Returns
+        -------
+        [(path, size, last used time)]
+        """
+        entries = []
+        for feature_name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, feature_name)
+            if not os.path.isdir(entry_dir):
+                continue
+            for file_name in os.listdir(entry_dir):
+                if not file_name.endswith(ENTRY_EXTENSION):
+                    continue
+                path = os.path.join(entry_dir, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def h__updateSize(self, size_change):
+        """
+        Updates the size of the entries after storing one, and removes
+        entries if they take up more than max_size bytes. Only the first
+        call (and the first after the entries are removed by invalidate)
+        goes through the files.
+        """
+        if self.max_size is None:
+            return
+
+        if self._size is None:
+            self._size = self.get_size()
+        else:
+            self._size += size_change
+
+        if self._size > self.max_size:
+            self.h__evict()
+
+    def h__evict(self):
+        """
+        Removes the least recently used entries until the entries take up
+        at most max_size bytes
+        """
+        if self.max_size is None:
+            return
+
+        entries = self.h__getEntries()
+        size = sum(entry[1] for entry in entries)
+
+        entries.sort(key=lambda entry: entry[2])
+        for path, entry_size, last_used in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                #Removed by another process
+                pass
+            size -= entry_size
+
+        self._size = size
+
+    def __getstate__(self):
+        #e.g. for the sections computed in other processes. The weak
+        #references can't be pickled, and the copy won't see the same worm.
+        state = self.__dict__.copy()
+        state['_last_worm'] = None
+        return state
+
+    def __repr__(self):
+        return utils.print_object(self)
+
+
+def h__updateWormHash(worm_hash, nw):
+    """
+    Adds the data of a normalized worm to a hash. Attributes that are loaded
+    on access (see NormalizedWorm.from_npy_directory_factory) are loaded.
+    """
+    names = set(vars(nw)) | set(nw.__dict__.get('_lazy_array_paths', {}))
+    for name in sorted(names):
+        if name.startswith('_'):
+            continue
+        worm_hash.update(name.encode('utf-8'))
+        h__updateValueHash(worm_hash, getattr(nw, name))
+
+
+def h__updateValueHash(worm_hash, value):
+    """
+    Adds the data of an attribute of a normalized worm to a hash.
+    
+    Raises
+    ------
+    TypeError
+        For values whose data can't be hashed reliably, since a text 
+        version of them (e.g. numpy's repr of a large array) could leave
+        some of it out
+    """
+    if isinstance(value, np.ndarray):
+        worm_hash.update(('ndarray %s %s' % (value.dtype.str, value.shape))
+                         .encode('utf-8'))
+        if value.dtype.hasobject:
+            for element in value.flat:
+                h__updateValueHash(worm_hash, element)
+        else:
+            worm_hash.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, RaggedFrames):
+        worm_hash.update(b'RaggedFrames')
+        for data in (value.data, value.offsets, value.is_valid):
+            h__updateValueHash(worm_hash, data)
+    elif isinstance(value, (list, tuple)):
+        worm_hash.update(('%s %d' % (type(value).__name__, len(value)))
+                         .encode('utf-8'))
+        for element in value:
+            h__updateValueHash(worm_hash, element)
+    elif isinstance(value, dict):
+        worm_hash.update(('dict %d' % len(value)).encode('utf-8'))
+        for key in sorted(value):
+            h__updateValueHash(worm_hash, key)
+            h__updateValueHash(worm_hash, value[key])
+    elif value is None or isinstance(value, (str, bytes, bool, int, float,
+                                             np.generic)):
+        worm_hash.update(repr(value).encode('utf-8'))
+    else:
+        raise TypeError('Unable to hash a worm attribute of type %s' %
+                        type(value).__name__)
+
+
+def h__optionsToText(value):
+    """
+    A text version of options that only depends on their values, for
+    hashing
+    """
+    if isinstance(value, (list, tuple)):
+        return '[%s]' % ', '.join(h__optionsToText(x) for x in value)
+    elif isinstance(value, dict):
+        return '{%s}' % ', '.join('%r: %s' % (k, h__optionsToText(value[k]))
+                                  for k in sorted(value))
+    elif isinstance(value, type):
+        return value.__name__
+    elif hasattr(value, '__dict__'):
+        return '%s(%s)' % (type(value).__name__,
+                           h__optionsToText(vars(value)))
+    else:
+        return repr(value)
+
+
+def h__replaceFile(source_path, destination_path):
+    try:
+        #Python 3.3+, which replaces the destination on Windows as well
+        os.replace(source_path, destination_path)
+    except AttributeError:
+        os.rename(source_path, destination_path)
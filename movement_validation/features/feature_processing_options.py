@@ -9,6 +9,10 @@ I'd like to move things from "config" into here ...
 
 from __future__ import division
 
+import collections
+
+import numpy as np
+
 from .. import utils
 
 
@@ -16,6 +20,39 @@ from .. import utils
 #Can't do this, would be circular
 #from .worm_features import WormFeatures
 
+#All of the features that can be computed, along with the features that are
+#needed to compute them. Features are listed after their dependencies. 
+#Names are '<section>.<feature>', the section being the attribute of 
+#WormFeatures that holds the feature.
+FEATURE_DEPENDENCIES = collections.OrderedDict([
+    ('morphology.length', []),
+    ('morphology.width', []),
+    ('morphology.area', []),
+    ('morphology.area_per_length', ['morphology.area', 'morphology.length']),
+    ('morphology.width_per_length', ['morphology.width', 
+                                     'morphology.length']),
+    ('locomotion.velocity', []),
+    ('locomotion.motion_events', ['locomotion.velocity']),
+    ('locomotion.motion_mode', ['locomotion.motion_events']),
+    ('locomotion.crawling_bends', ['locomotion.motion_events']),
+    ('locomotion.foraging_bends', []),
+    ('locomotion.turns', ['locomotion.velocity']),
+    ('posture.bends', []),
+    ('posture.eccentricity', []),
+    ('posture.amplitude_and_wavelength', ['posture.eccentricity']),
+    ('posture.kinks', []),
+    ('posture.coils', ['locomotion.velocity']),
+    ('posture.directions', []),
+    ('posture.skeleton', []),
+    ('posture.eigen_projection', []),
+    ('path.range', []),
+    ('path.duration', []),
+    ('path.coordinates', []),
+    ('path.curvature', [])])
+
+FEATURE_SECTIONS = ['morphology', 'locomotion', 'posture', 'path']
+
+
 class FeatureProcessingOptions(object):
     
     def __init__(self,fps):    
@@ -39,23 +76,108 @@ class FeatureProcessingOptions(object):
         #NOTE: There are a few instances where this is not supported such that
         #the behavior will not match even if this value is set to True.
         self.mimic_old_behaviour = True
+        
+        #The floating point type of the pre-features and of the worm data
+        #that the features are computed from. Using np.float32 halves the 
+        #memory used by the worm's data (and the amount of data moved 
+        #around) at the cost of some precision. See 
+        #worm_features.get_precision_report for how much the features change.
+        #
+        #NOTE: Only the inputs of the features are of this type. The feature
+        #code allocates many of its own arrays, and combines the data with
+        #double precision constants, so many of the computed features (and 
+        #their intermediates) are still np.float64.
+        #
+        #Used by: NormalizedWorm.calculate_pre_features, WormFeatures
+        self.dtype = np.float64
+        
+        #The # of workers used to compute the sections of the features 
+        #(morphology, locomotion, posture and path) at the same time. None
+        #computes them one after another. The results are the same either 
+        #way.
+        #
+        #Used by: WormFeatures
+        self.n_workers = None
+        
+        #'thread' or 'process', the kind of workers used with n_workers. 
+        #Most of the time is spent in NumPy, which releases the GIL, so 
+        #threads can run at the same time without copying the worm to 
+        #other processes.
+        self.executor_type = 'thread'
+        
+        #If True, the peak memory of each part of the feature processing is
+        #measured with tracemalloc (Python 3.4+), which slows it down.
+        #
+        #Used by: WormFeatures.timer, see FeatureTimer
+        self.track_memory = False
     
+        self.pre_features = PreFeaturesOptions()
         self.locomotion = LocomotionOptions(fps)
         self.posture = PostureOptions(fps)
         
-        #TODO: Implement this
-        #This is not yet implemented. The idea is to support not 
-        #computing certain features. We might also allow disabling certain 
-        #groups of feature.
+        #The features to compute, None for all of them. Features needed to 
+        #compute these are also computed. Names may be features or sections,
+        #e.g. 'locomotion.velocity' or 'path', see FEATURE_DEPENDENCIES.
+        self.features_to_compute = None
+        
+        #Features that should not be computed, even if another feature needs
+        #them (in which case that feature isn't computed either). Names are
+        #as for features_to_compute.
+        #
+        #NOTE: These lists should be replaced rather than modified in place,
+        #as the features they resolve to are only recomputed when either of
+        #them is set, see get_features_to_compute.
         self.features_to_ignore = []
     
+    def __setattr__(self,name,value):
+        if name in ('features_to_compute','features_to_ignore'):
+            self.__dict__.pop('_features_to_compute_set',None)
+        object.__setattr__(self,name,value)
+    
     def should_compute_feature(self,feature_name,worm_features):
         """
+        Features that are not computed are set to None.
+        
+        Parameters
+        ----------
+        feature_name : str
+            e.g. 'posture.coils', see FEATURE_DEPENDENCIES
+        worm_features : WormFeatures
+            Currently unused
+        """
+        to_compute = self.__dict__.get('_features_to_compute_set')
+        if to_compute is None:
+            to_compute = self.get_features_to_compute()
+            self._features_to_compute_set = to_compute
+        return feature_name in to_compute
+    
+    def get_features_to_compute(self):
+        """
+        Resolves features_to_compute and features_to_ignore into the set 
+        of features that will be computed.
+        """
+        ignored = h__expandFeatureNames(self.features_to_ignore)
         
-        """        
+        #Features that neither are ignored nor need an ignored feature
+        computable = set()
+        for name, dependencies in FEATURE_DEPENDENCIES.items():
+            if name not in ignored and \
+                    all(dep in computable for dep in dependencies):
+                computable.add(name)
         
-        #TODO: Implement this ...        
-        return True
+        if self.features_to_compute is None:
+            requested = list(FEATURE_DEPENDENCIES)
+        else:
+            requested = h__expandFeatureNames(self.features_to_compute)
+        
+        #Add the dependencies, going back from the last feature so that 
+        #dependencies of dependencies are included
+        to_compute = set(name for name in requested if name in computable)
+        for name in reversed(list(FEATURE_DEPENDENCIES)):
+            if name in to_compute:
+                to_compute.update(FEATURE_DEPENDENCIES[name])
+                
+        return to_compute
     
     def disable_contour_features(self):
         """
@@ -96,10 +218,7 @@ class FeatureProcessingOptions(object):
         fpo.disable_feature_sections(['morphology','locomotion'])
         
         """
-        new_ignores = []
-        f = IgnorableFeatures()
-        for section in section_names:
-            new_ignores.extend(getattr(f,section))
+        new_ignores = list(h__expandFeatureNames(section_names))
             
         self.features_to_ignore = list(set(self.features_to_ignore + new_ignores))
 
@@ -107,6 +226,21 @@ class FeatureProcessingOptions(object):
         return utils.print_object(self)
          
 
+class PreFeaturesOptions(object):
+    
+    def __init__(self):
+        self.max_contour_points = None #If not None, each side of the 
+        #contour is resampled to this # of points (evenly spaced along its 
+        #length, at least 2) when it has more points than this. This greatly speeds up
+        #computing the widths for high resolution contours. 200 points seems 
+        #to be a good #. See WormParsing.downsampleContours for how much the
+        #results may change.
+        #
+        #Used by: NormalizedWorm.calculate_pre_features
+        
+    def __repr__(self):
+        return utils.print_object(self)
+
 class PostureOptions(object):
     
     def __init__(self,fps):
@@ -247,30 +381,21 @@ class LocomotionCrawlingBends(object):
         self.initial_max_I_pct = 0.5
         
     def __repr__(self):
-        return utils.print_object(self)        
- 
-class IgnorableFeatures:
-    """
-    I'm not thrilled with where this is placed, but placing it in WormFeatures
-    creates a circular dependency
-    """
-    def __init__(self):
-
-        temp = ['length','width','area','area_per_length','width_per_length']
-        self.morphology =  ['morphology.' + s for s in temp]
-        #None of these are implemented ...        
+        return utils.print_object(self)
 
-        temp = ['velocity','motion_events','motion_mode','crawling_bends','foraging_bends','turns']      
-        self.locomotion = ['locomotion.' + s for s in temp]
-        #locomotion
-        #crawling_bends: Done
-        #turns: Done
- 
-        temp = ['bends','eccentricity', 'amplitude_and_wavelength','kinks','coils','directions','eigen_projection'] 
-        self.posture = ['posture.' + s for s in temp]
-        #None of these are implemented ... 
 
-        
-       
-        
-        
\ No newline at end of file
+def h__expandFeatureNames(names):
+    """
+    Returns the set of features given by names, in which sections 
+    (e.g. 'posture') stand for all of their features.
+    """
+    expanded = set()
+    for name in names:
+        if name in FEATURE_DEPENDENCIES:
+            expanded.add(name)
+        elif name in FEATURE_SECTIONS:
+            expanded.update(feature for feature in FEATURE_DEPENDENCIES 
+                            if feature.startswith(name + '.'))
+        else:
+            raise ValueError('Unrecognized feature name: %s' % name)
+    return expanded
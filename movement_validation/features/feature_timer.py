@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+This module defines the FeatureTimer class, which records how long each
+part of the feature processing takes.
+
+"""
+
+import collections
+import contextlib
+import csv
+import json
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python < 3.4
+    tracemalloc = None
+
+from .. import utils
+
+#The CPU time of the current thread where available, so that the spans of
+#sections that are computed at the same time don't include each other's
+#time
+if hasattr(time, 'thread_time'):
+    _cpu_time = time.thread_time
+elif hasattr(time, 'process_time'):
+    _cpu_time = time.process_time
+else:
+    _cpu_time = time.clock
+
+SUMMARY_FIELDS = ['path', 'count', 'wall_time', 'cpu_time', 'peak_memory',
+                  'frames_per_second']
+
+
+class FeatureTimer(object):
+
+    """
+    Records spans of feature processing. Spans can be nested, in which case
+    a span's path is the names of the spans that contain it, e.g.
+    'posture/posture.eccentricity'.
+
+    Usage
+    -----
+    timer = features_ref.timer
+    with timer.span('name of feature being processed'):
+        #Run the feature processing code
+
+    timer.summarize()
+    timer.save_to_CSV('timing.csv')
+
+    The older tic/toc calls are also supported, and can be nested:
+
+    timer.tic()
+    #Run the feature processing code
+    timer.toc('name of feature being processed')
+
+    Spans within a thread are nested. Each thread has its own spans, so
+    sections computed at the same time don't nest in each other.
+
+    Attributes
+    ----------
+    n_frames : int
+        The # of frames processed, used for the frames per second. May be
+        None.
+    track_memory : bool
+        If True, the peak memory allocated in each span is measured with
+        tracemalloc. This slows everything down. When spans run at the same
+        time in different threads, the memory of each includes the others'.
+    spans : [OrderedDict]
+        One for each span, with the fields in SPAN_FIELDS. Spans are added
+        when the outermost span that contains them ends.
+    names : [str]
+        The path of each span
+    times : [float]
+        The wall time of each span, in seconds
+
+    """
+
+    SPAN_FIELDS = ['name', 'path', 'depth', 'wall_time', 'cpu_time',
+                   'peak_memory']
+
+    def __init__(self, n_frames=None, track_memory=False):
+        self.n_frames = n_frames
+        self.track_memory = track_memory and tracemalloc is not None
+        self.spans = []
+        self.names = []
+        self.times = []
+
+        #The open spans of each thread, as sections may be computed at the
+        #same time
+        self.open_spans = {}
+        self._n_open_spans = 0
+        self._started_tracemalloc = False
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """
+        Times the code in a with block
+        """
+        self.tic(name)
+        try:
+            yield
+        finally:
+            self.toc()
+
+    def tic(self, name=None):
+        """
+        Starts a span. The name may instead be given to toc.
+        """
+        stack = self.open_spans.setdefault(threading.current_thread().ident,
+                                           [])
+
+        start = {'name': name, 'wall_time': time.time(), 
+                 'cpu_time': _cpu_time(), 'children': []}
+
+        if self.track_memory:
+            if self._n_open_spans == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]['peak_memory'] = \
+                    max(stack[-1]['peak_memory'], peak)
+            self.h__resetPeakMemory()
+            start['memory'] = current
+            start['peak_memory'] = current
+
+        stack.append(start)
+        self._n_open_spans += 1
+
+    def toc(self, name=None):
+        """
+        Ends the most recently started span (of this thread)
+        """
+        wall_time = time.time()
+        cpu_time = _cpu_time()
+
+        stack = self.open_spans[threading.current_thread().ident]
+        start = stack.pop()
+        self._n_open_spans -= 1
+        if name is None:
+            name = start['name']
+
+        peak_memory = None
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(start['peak_memory'], peak)
+            peak_memory = peak - start['memory']
+            if stack:
+                stack[-1]['peak_memory'] = max(stack[-1]['peak_memory'], peak)
+            self.h__resetPeakMemory()
+            if self._n_open_spans == 0 and self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+
+        span = collections.OrderedDict([
+            ('name', name),
+            ('path', name),
+            ('depth', 0),
+            ('wall_time', wall_time - start['wall_time']),
+            ('cpu_time', cpu_time - start['cpu_time']),
+            ('peak_memory', peak_memory)])
+
+        #Spans that ended within this one are put under its name (which 
+        #wasn't known when they ended if it was given to toc)
+        spans = start['children']
+        for child in spans:
+            child['path'] = name + '/' + child['path']
+            child['depth'] += 1
+        spans.append(span)
+
+        if stack:
+            stack[-1]['children'].extend(spans)
+        else:
+            self.spans.extend(spans)
+            self.names.extend(child['path'] for child in spans)
+            self.times.extend(child['wall_time'] for child in spans)
+
+    def h__resetPeakMemory(self):
+        # Python < 3.9 can't reset the peak, in which case the peak memory
+        # of a span may include that of earlier spans
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    def merge(self, other):
+        """
+        Adds the spans recorded by another timer
+        """
+        self.spans.extend(other.spans)
+        self.names.extend(other.names)
+        self.times.extend(other.times)
+
+    def get_summary(self):
+        """
+        Combines the spans with the same path.
+
+        Returns
+        -------
+        OrderedDict
+            Keys are the paths, in the order that they were first recorded.
+            Values are OrderedDicts with the fields in SUMMARY_FIELDS. The
+            times are totals over all of the calls, and the peak memory is
+            the largest of the calls.
+        """
+        summary = collections.OrderedDict()
+        for span in self.spans:
+            path = span['path']
+            if path not in summary:
+                summary[path] = collections.OrderedDict([
+                    ('path', path), ('count', 0), ('wall_time', 0.0),
+                    ('cpu_time', 0.0), ('peak_memory', None),
+                    ('frames_per_second', None)])
+            entry = summary[path]
+            entry['count'] += 1
+            entry['wall_time'] += span['wall_time']
+            entry['cpu_time'] += span['cpu_time']
+            if span['peak_memory'] is not None:
+                entry['peak_memory'] = max(entry['peak_memory'] or 0,
+                                           span['peak_memory'])
+
+        if self.n_frames is not None:
+            for entry in summary.values():
+                if entry['wall_time'] > 0:
+                    entry['frames_per_second'] = \
+                        self.n_frames / entry['wall_time']
+
+        return summary
+
+    def save_to_JSON(self, JSON_path):
+        """
+        Saves the summary (see get_summary) and each of the spans.
+        """
+        data = collections.OrderedDict([
+            ('n_frames', self.n_frames),
+            ('summary', list(self.get_summary().values())),
+            ('spans', self.spans)])
+
+        with open(JSON_path, 'w') as outfile:
+            json.dump(data, outfile, indent=2)
+
+    def save_to_CSV(self, csv_path):
+        """
+        Saves the summary (see get_summary), one row per path. The columns
+        are SUMMARY_FIELDS.
+        """
+        with open(csv_path, 'w') as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(SUMMARY_FIELDS)
+            for entry in self.get_summary().values():
+                writer.writerow(['' if entry[field] is None else entry[field]
+                                 for field in SUMMARY_FIELDS])
+
+    def __repr__(self):
+        return utils.print_object(self)
+
+    def summarize(self):
+        """
+        This can be called to display each logged function and how long it
+        took to run
+        """
+        for entry in self.get_summary().values():
+            depth = entry['path'].count('/')
+            name = entry['path'].split('/')[-1]
+            text = '%s%s: %0.3fs (cpu %0.3fs' % ('  ' * depth, name,
+                                                 entry['wall_time'],
+                                                 entry['cpu_time'])
+            if entry['count'] > 1:
+                text += ', %d calls' % entry['count']
+            if entry['peak_memory'] is not None:
+                text += ', peak %0.1f MB' % (entry['peak_memory'] / 1e6)
+            print(text + ')')
@@ -53,6 +53,13 @@ class LocomotionBend(object):
         self.name = name
         
         return self    
+
+    def to_disk(self, bend_ref):
+        """
+        The inverse of from_disk
+        """
+        utils._write_time_to_disk(bend_ref, 'amplitude', self.amplitude)
+        utils._write_time_to_disk(bend_ref, 'frequency', self.frequency)
    
     def __repr__(self):
         return utils.print_object(self)
@@ -173,16 +180,63 @@ class LocomotionCrawlingBends(object):
 
         """
 
-        options = features_ref.options.locomotion.crawling_bends
-        
         if not features_ref.options.should_compute_feature('locomotion.crawling_bends',features_ref):
             self.head = None
             self.midbody = None
             self.tail = None
             return
 
-        timer = features_ref.timer
-        timer.tic()
+        avg_bend_angles = self.get_average_bend_angles(features_ref, 
+                                                       bend_angles)
+
+        self.h__computeBends(features_ref, avg_bend_angles, is_paused, 
+                             is_segmented_mask)
+
+    @classmethod
+    def from_average_bend_angles(cls, features_ref, avg_bend_angles, 
+                                 is_paused, is_segmented_mask):
+        """
+        Computes the bends from average bend angles that were already 
+        computed, see get_average_bend_angles. This is used when the angles
+        are computed for windows of a recording, see chunked_features.
+        """
+        self = cls.__new__(cls)
+        self.h__computeBends(features_ref, avg_bend_angles, is_paused, 
+                             is_segmented_mask)
+        return self
+
+    @classmethod
+    def get_average_bend_angles(cls, features_ref, bend_angles):
+        """
+        Parameters
+        ----------
+        features_ref : WormFeatures
+        bend_angles : numpy.array
+            [49 x n_frames]
+
+        Returns
+        -------
+        dict
+            The mean bend angle of each partition in bend_names, in each 
+            frame ([n_frames])
+        """
+        options = features_ref.options.locomotion.crawling_bends
+
+        avg_bend_angles = {}
+        for cur_partition_name in cls.bend_names:
+            s = slice(*options.bends_partitions[cur_partition_name])
+
+            # Suppress RuntimeWarning: Mean of empty slice
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                avg_bend_angles[cur_partition_name] = \
+                    np.nanmean(bend_angles[s, :], axis=0)
+
+        return avg_bend_angles
+
+    def h__computeBends(self, features_ref, all_avg_bend_angles, is_paused, 
+                        is_segmented_mask):
+        options = features_ref.options.locomotion.crawling_bends
 
         fps = features_ref.video_info.fps
 
@@ -200,15 +254,9 @@ class LocomotionCrawlingBends(object):
             return
 
         for cur_partition_name in self.bend_names:
-            # Find the mean bend angle for the current partition, across all
+            # The mean bend angle for the current partition, across all
             # frames
-        
-            s = slice(*options.bends_partitions[cur_partition_name])
-
-            # Suppress RuntimeWarning: Mean of empty slice
-            with warnings.catch_warnings():
-                warnings.simplefilter('ignore', category=RuntimeWarning)
-                avg_bend_angles = np.nanmean(bend_angles[s, :], axis=0)
+            avg_bend_angles = all_avg_bend_angles[cur_partition_name]
 
             # Ensure there are both data and gaps if we are going to
             # interpolate - i.e.:
@@ -227,8 +275,6 @@ class LocomotionCrawlingBends(object):
 
             setattr(self,cur_partition_name,LocomotionBend(amplitude,frequency,cur_partition_name))
 
-        timer.toc('locomotion.crawling_bends')
-
 
     def h__getBendData(self, avg_bend_angles, bound_info, options, cur_partition, fps):
         """
@@ -435,6 +481,13 @@ class LocomotionCrawlingBends(object):
 
         return self
 
+    def to_disk(self, bend_ref):
+        """
+        The inverse of from_disk
+        """
+        for name in ('head', 'midbody', 'tail'):
+            getattr(self, name).to_disk(bend_ref.create_group(name))
+
     def __repr__(self):
         return utils.print_object(self)
         
@@ -491,25 +544,46 @@ class LocomotionForagingBends(object):
 
         """
         
-        options = features_ref.options.locomotion.foraging_bends        
-
         if not features_ref.options.should_compute_feature('locomotion.foraging_bends',features_ref):
             self.amplitude = None
             self.angle_speed = None
-            return        
-        
-        timer = features_ref.timer
-        timer.tic()
-        
-        
-        # self.amplitude  = None  # DEBUG
-        # self.angleSpeed = None # DEBUG
+            return
 
-        nw  = features_ref.nw
-        
-        
+        nose_bends = self.get_nose_bend_angles(features_ref)
 
-        fps = features_ref.video_info.fps
+        self.h__computeForaging(features_ref, nose_bends, ventral_mode)
+
+    @classmethod
+    def from_nose_bend_angles(cls, features_ref, nose_bends, ventral_mode):
+        """
+        Computes the foraging from nose bend angles that were already 
+        computed, see get_nose_bend_angles. This is used when the angles 
+        are computed for windows of a recording, see chunked_features.
+
+        Parameters
+        ----------
+        features_ref : WormFeatures
+        nose_bends : numpy.array
+            [n_frames]
+        ventral_mode : int
+        """
+        self = cls.__new__(cls)
+        self.h__computeForaging(features_ref, nose_bends, ventral_mode)
+        return self
+
+    @classmethod
+    def get_nose_bend_angles(cls, features_ref):
+        """
+        Returns the angle between the nose and the neck in each frame, in 
+        degrees, which the foraging is computed from. Gaps of up to 
+        max_samples_interp_nose frames in the nose and neck are 
+        interpolated, so an angle depends on the frames up to that far away.
+        """
+        self = cls.__new__(cls)
+
+        options = features_ref.options.locomotion.foraging_bends
+
+        nw  = features_ref.nw
 
         nose_x, nose_y = nw.get_partition('head_tip', data_key='skeleton',
                                           split_spatial_dimensions=True)
@@ -555,6 +629,13 @@ class LocomotionForagingBends(object):
         #---------------------------------------
         nose_bends = self.h__computeNoseBends(nose_xi, nose_yi, neck_xi, neck_yi)
 
+        return nose_bends
+
+    def h__computeForaging(self, features_ref, nose_bends, ventral_mode):
+        options = features_ref.options.locomotion.foraging_bends
+
+        fps = features_ref.video_info.fps
+
         # Step 3:
         #---------------------------------------
         [nose_amps, nose_freqs] = \
@@ -567,8 +648,6 @@ class LocomotionForagingBends(object):
         self.amplitude   = nose_amps
         self.angle_speed = nose_freqs
 
-        timer.toc('locomotion.foraging_bends')
-
 
     def h__computeNoseBends(self, nose_x, nose_y, neck_x, neck_y):
         """
@@ -774,6 +853,14 @@ class LocomotionForagingBends(object):
         self.angle_speed = utils._extract_time_from_disk(foraging_ref,'angleSpeed')
         
         return self
+
+    def to_disk(self, foraging_ref):
+        """
+        The inverse of from_disk
+        """
+        utils._write_time_to_disk(foraging_ref, 'amplitude', self.amplitude)
+        utils._write_time_to_disk(foraging_ref, 'angleSpeed', 
+                                  self.angle_speed)
         
     def __repr__(self):
         return utils.print_object(self)
@@ -60,6 +60,13 @@ class LocomotionVelocityElement(object):
         
         return self
 
+    def to_disk(self, parent_ref):
+        """
+        The inverse of from_disk
+        """
+        utils._write_time_to_disk(parent_ref, 'speed', self.speed)
+        utils._write_time_to_disk(parent_ref, 'direction', self.direction)
+
 class LocomotionVelocity(object):
     
     """
@@ -99,9 +106,6 @@ class LocomotionVelocity(object):
         
         nw = features_ref.nw
 
-        timer = features_ref.timer
-        timer.tic()
-
         all_options = features_ref.options
     
         locomotion_options = all_options.locomotion
@@ -141,12 +145,11 @@ class LocomotionVelocity(object):
             speed, direction = velocity_module.compute_velocity(fps, x, y,
                                             avg_body_angle,
                                             sample_time_values[attribute_key],
-                                            ventral_mode)[0:2]
+                                            ventral_mode,
+                                            nw.get_partition_stat(data_key))[0:2]
                                             
             setattr(self,attribute_key,LocomotionVelocityElement(attribute_key,speed,direction))                                
 
-        timer.toc('locomotion.velocity')
-
     def get_midbody_distance(self):
 
         """
@@ -175,6 +178,10 @@ class LocomotionVelocity(object):
     @classmethod
     def from_disk(cls, parent_ref):
         
+        if 'velocity' not in parent_ref:
+            # e.g. the velocity was not computed when the file was written
+            return None
+
         self = cls.__new__(cls)
 
         velocity_ref = parent_ref['velocity']
@@ -194,6 +201,17 @@ class LocomotionVelocity(object):
                     LocomotionVelocityElement.from_disk(local_ref,key))      
         return self
 
+    def to_disk(self, parent_ref):
+        """
+        The inverse of from_disk, using the MRC names
+        """
+        velocity_ref = parent_ref.create_group('velocity')
+
+        old_keys = {'head_tip': 'headTip', 'tail_tip': 'tailTip'}
+        for key in self.attribute_keys:
+            local_ref = velocity_ref.create_group(old_keys.get(key, key))
+            getattr(self, key).to_disk(local_ref)
+
 class MotionEvents(object):
     
     """
@@ -239,9 +257,6 @@ class MotionEvents(object):
     
         """
 
-        timer = features_ref.timer
-        timer.tic()
-
         fps = features_ref.video_info.fps        
         
         locomotion_options = features_ref.options.locomotion        
@@ -340,8 +355,6 @@ class MotionEvents(object):
             self._mode[event_mask] = frame_values[motion_type]
               
 
-        timer.toc('locomotion.motion_events')
-
 
     def get_motion_mode(self):
         return self._mode
@@ -349,6 +362,11 @@ class MotionEvents(object):
     @classmethod
     def from_disk(cls, parent_ref):
 
+        if 'motion' not in parent_ref:
+            # e.g. the motion events were not computed when the file was 
+            # written
+            return None
+
         self = cls.__new__(cls)
         
         motion_ref = parent_ref['motion']
@@ -360,6 +378,17 @@ class MotionEvents(object):
 
         return self
 
+    def to_disk(self, parent_ref):
+        """
+        The inverse of from_disk
+        """
+        motion_ref = parent_ref.create_group('motion')
+
+        for key in self.attribute_keys:
+            getattr(self, key).to_disk(motion_ref.create_group(key))
+
+        utils._write_time_to_disk(motion_ref, 'mode', self._mode)
+
     def __eq__(self, other):
         motion_events_same = [self.__dict__[x].test_equality(
             other.__dict__[x], 'locomotion.motion_events.' + x)
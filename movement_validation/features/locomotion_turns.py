@@ -93,21 +93,86 @@ class LocomotionTurns(object):
 
         """
 
-        nw = features_ref.nw
-
         if not features_ref.options.should_compute_feature('locomotion.turns',features_ref):
             self.omegas = None
             self.upsilons = None
             return
 
+        turn_values = self.get_turn_values(features_ref, bend_angles)
+
+        self.h__computeTurns(features_ref, turn_values, is_stage_movement,
+                             midbody_distance)
+
+    @classmethod
+    def from_turn_values(cls, features_ref, turn_values, is_stage_movement,
+                         midbody_distance):
+        """
+        Computes the turns from per-frame values that were already computed,
+        see get_turn_values. This is used when the values are computed for 
+        windows of a recording, see chunked_features.
+        """
+        self = cls.__new__(cls)
+        self.h__computeTurns(features_ref, turn_values, is_stage_movement,
+                             midbody_distance)
+        return self
+
+    @classmethod
+    def get_turn_values(cls, features_ref, bend_angles):
+        """
+        Parameters
+        ----------
+        features_ref : WormFeatures
+        bend_angles : numpy.array
+            [49 x n_frames]
+
+        Returns
+        -------
+        dict
+            The values of each frame ([n_frames]) that the turns are 
+            computed from:
+            - 'head_angles', 'body_angles', 'tail_angles' : the mean bend 
+              angle of each third of the worm
+            - 'head_x', 'head_y', 'tail_x', 'tail_y' : the mean position of
+              the head and tail, see OmegaTurns.h_getHeadTailDirectionChange
+        """
+        nw = features_ref.nw
+
+        # NOTE: For some reason the first and last few angles are NaN, so we use
+        # nanmean instead of mean.  We could probably avoid this for the body.
+        if bend_angles is nw.angles:
+            # Shared with the posture bends
+            def get_mean(subset):
+                return np.array(nw.get_partition_stat(subset, 'angles', 
+                                                      'nanmean'))
+        else:
+            def get_mean(subset):
+                mask = nw.get_subset_partition_mask(subset)
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', category=RuntimeWarning)
+                    return np.nanmean(bend_angles[mask, :], axis=0)
+
+        turn_values = {'head_angles': get_mean('first_third'),
+                       'body_angles': get_mean('second_third'),
+                       'tail_angles': get_mean('last_third')}
+
+        # Take the mean across the partition, so that we are left with a 
+        # single value for each frame (i.e. 1-d an array of length n_frames)
+        (turn_values['head_x'], 
+         turn_values['head_y']) = nw.get_partition_stat('head', 'skeleton', 
+                                                        'nanmean')
+        (turn_values['tail_x'], 
+         turn_values['tail_y']) = nw.get_partition_stat('tail', 'skeleton', 
+                                                        'nanmean')
+
+        return turn_values
+
+    def h__computeTurns(self, features_ref, turn_values, is_stage_movement,
+                        midbody_distance):
         options = features_ref.options.locomotion.locomotion_turns
 
         fps = features_ref.video_info.fps
 
-        timer = features_ref.timer
-        timer.tic()
-
-        n_frames = bend_angles.shape[1]
+        n_frames = len(turn_values['body_angles'])
 
         angles = collections.namedtuple('angles',
                                         ['head_angles',
@@ -116,20 +181,11 @@ class LocomotionTurns(object):
                                          'body_angles_with_long_nans',
                                          'is_stage_movement'])
 
-        first_third  = nw.get_subset_partition_mask('first_third')
-        second_third = nw.get_subset_partition_mask('second_third')
-        last_third   = nw.get_subset_partition_mask('last_third')
-
-        # NOTE: For some reason the first and last few angles are NaN, so we use
-        # nanmean instead of mean.  We could probably avoid this for the body.
-        # Suppress RuntimeWarning: Mean of empty slice for those frames 
-        # that are ALL NaN.
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore', category=RuntimeWarning)
-            angles.head_angles = np.nanmean(bend_angles[first_third, :], axis=0)
-            angles.body_angles = np.nanmean(bend_angles[second_third, :], axis=0)
-            angles.tail_angles = np.nanmean(bend_angles[last_third, :], axis=0)
-            angles.is_stage_movement = is_stage_movement
+        # These are copies as the angles are interpolated in place below
+        angles.head_angles = np.array(turn_values['head_angles'])
+        angles.body_angles = np.array(turn_values['body_angles'])
+        angles.tail_angles = np.array(turn_values['tail_angles'])
+        angles.is_stage_movement = is_stage_movement
 
         # Deep copy.
         # To @JimHokanson from @MichaelCurrie: what does "ht" stand for?
@@ -209,7 +265,7 @@ class LocomotionTurns(object):
         # Calculate the events from the frame values
         self.omegas   = OmegaTurns.create(options,
                                    frames.omega_frames,
-                                   nw,
+                                   turn_values,
                                    body_angles_for_ht_change,
                                    midbody_distance,
                                    fps)
@@ -218,8 +274,6 @@ class LocomotionTurns(object):
                                      midbody_distance,
                                      fps)
 
-        timer.toc('locomotion.turns')
-
     @classmethod
     def from_disk(cls, turns_ref):
 
@@ -230,6 +284,13 @@ class LocomotionTurns(object):
         
         return self
 
+    def to_disk(self, turns_ref):
+        """
+        The inverse of from_disk
+        """
+        self.omegas.to_disk(turns_ref.create_group('omegas'))
+        self.upsilons.to_disk(turns_ref.create_group('upsilons'))
+
     def __eq__(self, other):
         return \
             self.upsilons.test_equality(other.upsilons,'locomotion.turns.upsilons') and \
@@ -516,8 +577,8 @@ class OmegaTurns(object):
 
     """
 
-    def __init__(self, options, omega_frames_from_angles, nw, body_angles,
-                 midbody_distance, fps):
+    def __init__(self, options, omega_frames_from_angles, turn_values, 
+                 body_angles, midbody_distance, fps):
         """
         Initialiser for the OmegaTurns class.
 
@@ -526,8 +587,9 @@ class OmegaTurns(object):
         omega_frames_from_angles: [1 x n_frames]
           Each frame has the value 0, 1, or -1, 
 
-        nw: NormalizedWorm instance
-          We only use it for its skeleton.
+        turn_values: dict
+          We only use the mean head and tail positions, see 
+          LocomotionTurns.get_turn_values
 
         body_angles
           average bend angle of the middle third of the worm
@@ -564,7 +626,8 @@ class OmegaTurns(object):
 
         self.omegas = None  # DEBUG: remove once the below code is ready
 
-        omega_frames_from_th_change = self.h_getHeadTailDirectionChange(nw, fps)
+        omega_frames_from_th_change = \
+            self.h_getHeadTailDirectionChange(turn_values, fps)
             
         # Filter:
         # This is to be consistent with the old code. We filter then merge, then
@@ -590,10 +653,10 @@ class OmegaTurns(object):
 
 
     @staticmethod
-    def create(options, omega_frames_from_angles, nw, body_angles, midbody_distance, fps):
+    def create(options, omega_frames_from_angles, turn_values, body_angles, midbody_distance, fps):
         
-        temp = OmegaTurns(options, omega_frames_from_angles, nw, body_angles,
-                 midbody_distance, fps)
+        temp = OmegaTurns(options, omega_frames_from_angles, turn_values, 
+                 body_angles, midbody_distance, fps)
 
         return temp.value
 
@@ -603,13 +666,15 @@ class OmegaTurns(object):
 
         return events.EventListWithFeatures.from_disk(turns_ref['omegas'], 'MRC')  
 
-    def h_getHeadTailDirectionChange(self, nw, FPS):
+    def h_getHeadTailDirectionChange(self, turn_values, FPS):
         """
 
 
         Parameters
         ---------------------------------------    
-        nw: A NormalizedWorm instance
+        turn_values: dict
+          With the mean head and tail positions in each frame, see 
+          LocomotionTurns.get_turn_values
 
         FPS: int
           Frames Per Second
@@ -646,23 +711,10 @@ class OmegaTurns(object):
 
         # Compute tail direction
         #----------------------------------------------------
-        head_x, head_y = nw.get_partition('head',
-                                          data_key='skeleton',
-                                          split_spatial_dimensions=True)
-        tail_x, tail_y = nw.get_partition('tail',
-                                          data_key='skeleton',
-                                          split_spatial_dimensions=True)
-
-        # Take the mean across the partition, so that we are left with a single
-        # value for each frame (i.e. 1-d an array of length n_frames)
-        # Suppress RuntimeWarning: Mean of empty slice for those frames 
-        # that are ALL NaN.
-        with warnings.catch_warnings():
-            warnings.simplefilter('ignore', category=RuntimeWarning)
-            head_x = np.nanmean(head_x, axis=0)
-            head_y = np.nanmean(head_y, axis=0)
-            tail_x = np.nanmean(tail_x, axis=0)
-            tail_y = np.nanmean(tail_y, axis=0)
+        head_x = turn_values['head_x']
+        head_y = turn_values['head_y']
+        tail_x = turn_values['tail_x']
+        tail_y = turn_values['tail_y']
 
         th_angle = np.arctan2(head_y - tail_y, head_x - tail_x) * (180 / np.pi)
 
@@ -4,8 +4,6 @@ morphology_features.py
 
 """
 
-import numpy as np
-
 from .. import utils
 
 from . import feature_comparisons as fc
@@ -33,7 +31,7 @@ class Widths(object):
         nw = features_ref.nw
     
         for partition in self.fields:
-            setattr(self,partition, np.mean(nw.get_partition(partition, 'widths'),0))
+            setattr(self,partition, nw.get_partition_stat(partition, 'widths'))
     
     @classmethod
     def from_disk(cls,width_ref):
@@ -45,6 +43,14 @@ class Widths(object):
     
         return self
         
+    def to_disk(self, width_ref):
+        """
+        The inverse of from_disk
+        """
+        for partition in self.fields:
+            utils._write_time_to_disk(width_ref, partition, 
+                                      getattr(self, partition))
+        
     def __eq__(self, other):
         return fc.corr_value_high(self.head, other.head, 'morph.width.head') and \
             fc.corr_value_high(self.midbody, other.midbody, 'morph.width.midbody') and \
@@ -13,6 +13,9 @@ from . import feature_comparisons as fc
 # import this as 'velocity_module':
 from . import velocity as velocity_module 
 
+#The time (s) over which the velocity used for the curvature is computed
+CURVATURE_BODY_DIFF = 0.5
+
 
 class Coordinates(object):
     
@@ -40,6 +43,13 @@ class Coordinates(object):
         self.y = c_data['y'].value[:, 0]
 
         return self
+
+    def to_disk(self, c_data):
+        """
+        The inverse of from_disk
+        """
+        utils._write_time_to_disk(c_data, 'x', self.x)
+        utils._write_time_to_disk(c_data, 'y', self.y)
         
     def __eq__(self, other):
         return \
@@ -56,16 +66,47 @@ class Range(object):
     """
 
     def __init__(self, contour_x, contour_y):
+        """
+        Parameters
+        ----------
+        contour_x, contour_y : numpy.array
+            [n_points x n_frames], or [n_worms x n_points x n_frames] for 
+            many worms at once (see WormBatch)
+        """
+
+        mean_cx, mean_cy = self.get_contour_centroid(contour_x, contour_y)
+
+        self.h__computeRange(mean_cx, mean_cy)
 
+    @classmethod
+    def from_contour_centroid(cls, mean_cx, mean_cy):
+        """
+        Computes the range from contour centroids that were already 
+        computed, see get_contour_centroid. This is used when the centroids
+        are computed for windows of a recording, see chunked_features.
+        """
+        self = cls.__new__(cls)
+        self.h__computeRange(mean_cx, mean_cy)
+        return self
+
+    @staticmethod
+    def get_contour_centroid(contour_x, contour_y):
+        """
+        Returns
+        -------
+        (numpy.array, numpy.array)
+            The mean x and y of the contour in each frame, [n_frames] (or 
+            [n_worms x n_frames])
+        """
         # Get average per frame
         #------------------------------------------------
-        mean_cx = contour_x.mean(axis=0)
-        mean_cy = contour_y.mean(axis=0)
+        return contour_x.mean(axis=-2), contour_y.mean(axis=-2)
 
-        # Average over all frames for subtracting
+    def h__computeRange(self, mean_cx, mean_cy):
+        # Average over all frames (of each worm) for subtracting
         #-------------------------------------------------
-        x_centroid_cx = np.nanmean(mean_cx)
-        y_centroid_cy = np.nanmean(mean_cy)
+        x_centroid_cx = np.nanmean(mean_cx, axis=-1)[..., np.newaxis]
+        y_centroid_cy = np.nanmean(mean_cy, axis=-1)[..., np.newaxis]
 
         self.value = np.sqrt(
             (mean_cx - x_centroid_cx) ** 2 + (mean_cy - y_centroid_cy) ** 2)
@@ -73,6 +114,10 @@ class Range(object):
     @classmethod
     def from_disk(cls,path_var):
 
+        if 'range' not in path_var:
+            # e.g. the range was not computed when the file was written
+            return None
+
         self = cls.__new__(cls)
 
         # NOTE: This is of size nx1 for Matlab versions, might want to fix on loading
@@ -80,6 +125,12 @@ class Range(object):
 
         return self
 
+    def to_disk(self, path_var):
+        """
+        The inverse of from_disk
+        """
+        utils._write_time_to_disk(path_var, 'range', self.value)
+
     def __repr__(self):
         return utils.print_object(self)
 
@@ -270,6 +321,14 @@ class Duration(object):
 
         return self
 
+    def to_disk(self, duration_group):
+        """
+        The inverse of from_disk
+        """
+        self.arena.to_disk(duration_group.create_group('arena'))
+        for name in ('worm', 'head', 'midbody', 'tail'):
+            getattr(self, name).to_disk(duration_group.create_group(name))
+
 
 class DurationElement(object):
 
@@ -308,6 +367,15 @@ class DurationElement(object):
 
         return self
 
+    def to_disk(self, saved_duration_elem):
+        """
+        The inverse of from_disk. The values are saved as [1 x n].
+        """
+        utils._write_time_to_disk(saved_duration_elem, 'indices', 
+                                  self.indices.reshape(1, -1), is_matrix=True)
+        utils._write_time_to_disk(saved_duration_elem, 'times', 
+                                  self.times.reshape(1, -1), is_matrix=True)
+
 
 class Arena(object):
 
@@ -360,6 +428,19 @@ class Arena(object):
 
         return self
 
+    def to_disk(self, saved_arena_elem):
+        """
+        The inverse of from_disk
+        """
+        utils._write_time_to_disk(saved_arena_elem, 'height', self.height)
+        utils._write_time_to_disk(saved_arena_elem, 'width', self.width)
+        for name in ('min', 'max'):
+            limit_ref = saved_arena_elem.create_group(name)
+            utils._write_time_to_disk(limit_ref, 'x', 
+                                      getattr(self, name + '_x'))
+            utils._write_time_to_disk(limit_ref, 'y', 
+                                      getattr(self, name + '_y'))
+
 
 def worm_path_curvature(features_ref):
     """
@@ -370,7 +451,7 @@ def worm_path_curvature(features_ref):
 
     """
 
-    BODY_DIFF = 0.5
+    BODY_DIFF = CURVATURE_BODY_DIFF
 
     nw = features_ref.nw
     x = nw.skeleton_x
@@ -42,6 +42,15 @@ class Skeleton(object):
         self.y = y_temp.transpose()
         
         return self
+
+    def to_disk(self, skeleton_ref):
+        """
+        The inverse of from_disk
+        """
+        utils._write_time_to_disk(skeleton_ref, 'x', self.x.transpose(), 
+                                  is_matrix=True)
+        utils._write_time_to_disk(skeleton_ref, 'y', self.y.transpose(), 
+                                  is_matrix=True)
      
     def __repr__(self):
         return utils.print_object(self) 
@@ -77,27 +86,19 @@ class Bends(object):
         p = nw.get_partition_subset('normal')
 
         for partition_key in p.keys():
-            # Retrieve the part of the worm we are currently looking at:
-            bend_angles = nw.get_partition(partition_key, 'angles')
-
+            # Statistics of the part of the worm we are currently looking at,
             # shape = (n):
+            temp_mean = nw.get_partition_stat(partition_key, 'angles', 
+                                              'nanmean')
+            
+            # A copy, as the shared value is read-only
+            temp_std = nw.get_partition_stat(partition_key, 'angles', 
+                                             'nanstd').copy()
 
-            # Suppress RuntimeWarning: Mean of empty slice for those frames 
-            # that are ALL NaN.
-            with warnings.catch_warnings():
-                warnings.simplefilter('ignore', category=RuntimeWarning)                
-
-                # Throws warning on taking the mean of an empty slice
-                temp_mean = np.nanmean(a=bend_angles, axis=0)
-                
-                # Throws warning when degrees of freedom <= 0 for slice
-                temp_std = np.nanstd(a=bend_angles, axis=0)
-
-                # Sign the standard deviation (to provide the bend's 
-                # dorsal/ventral orientation)
-                temp_std[temp_mean < 0] *= -1
+            # Sign the standard deviation (to provide the bend's 
+            # dorsal/ventral orientation)
+            temp_std[temp_mean < 0] *= -1
 
-                
 
             setattr(self, partition_key, 
                     BendSection(temp_mean, temp_std, partition_key))
@@ -105,7 +106,7 @@ class Bends(object):
     @classmethod
     def create(self,features_ref):
         options = features_ref.options
-        if options.should_compute_feature('locomotion.bends',features_ref):
+        if options.should_compute_feature('posture.bends',features_ref):
             return Bends(features_ref)
         else:
             return None
@@ -136,6 +137,13 @@ class Bends(object):
 
         return self
 
+    def to_disk(self, bend_ref):
+        """
+        The inverse of from_disk
+        """
+        for partition_key, bend_section in vars(self).items():
+            bend_section.to_disk(bend_ref.create_group(partition_key))
+
 
 class BendSection(object):
 
@@ -169,6 +177,13 @@ class BendSection(object):
 
         return self
 
+    def to_disk(self, bend_ref):
+        """
+        The inverse of from_disk, using the MRC names
+        """
+        utils._write_time_to_disk(bend_ref, 'mean', self.mean)
+        utils._write_time_to_disk(bend_ref, 'stdDev', self.std_dev)
+
     def __repr__(self):
         return utils.print_object(self)
 
@@ -246,8 +261,6 @@ def get_eccentricity_and_orientation(features_ref):
     nw  = features_ref.nw
     options = features_ref.options
     posture_options = options.posture
-    timer = features_ref.timer
-    timer.tic()
 
     if not options.should_compute_feature('posture.eccentricity',features_ref):
         return (None, None)
@@ -312,8 +325,6 @@ def get_eccentricity_and_orientation(features_ref):
     orientation = orientation_fixed;
 
 
-    timer.toc('posture.eccentricity_and_orientation')
-  
     return (eccentricity, orientation)
 
 def h__getEccentricityAndOrientation(x_mc,y_mc,xRange_all,yRange_all,gridAspectRatio_all,N_GRID_POINTS,eccentricity,orientation,run_mask):
@@ -845,7 +856,7 @@ class AmplitudeAndWavelength(object):
         #TODO: I think this would be better as a class
         
         
-        if not features_ref.options.should_compute_feature('locomotion.amplitude_and_wavelength',features_ref):
+        if not features_ref.options.should_compute_feature('posture.amplitude_and_wavelength',features_ref):
             self.amplitude_max = None
             self.amplitude_ratio = None
             self.primary_wavelength = None
@@ -854,9 +865,6 @@ class AmplitudeAndWavelength(object):
             return
         
         
-        timer = features_ref.timer;
-        timer.tic()
-        
         options = features_ref.options    
         
         #TODO: Check if we should even compute this code    
@@ -1035,8 +1043,6 @@ class AmplitudeAndWavelength(object):
         self.secondary_wavelength = secondary_wavelength
         self.track_length = track_length
     
-        timer.toc('posture.amplitude_and_wavelength')
-
 """
 
 Old Vs New Code:
@@ -1064,8 +1070,6 @@ def get_worm_kinks(features_ref):
     # https://github.com/JimHokanson/SegwormMatlabClasses/blob/master/%2Bseg_worm/%2Bfeatures/%40posture/getWormKinks.m
 
     nw = features_ref.nw
-    timer = features_ref.timer
-    timer.tic()
 
     options = features_ref.options
 
@@ -1154,8 +1158,6 @@ def get_worm_kinks(features_ref):
 
         n_kinks_all[iFrame] = np.sum(lengths >= length_threshold)
 
-    timer.toc('posture.kinks')
-
     return n_kinks_all
 
 
@@ -1176,12 +1178,9 @@ def get_worm_coils(features_ref, midbody_distance):
     
     options = features_ref.options
     posture_options = options.posture
-    timer = features_ref.timer
     
     fps = features_ref.video_info.fps     
     
-    timer.tic()    
-    
     frame_code = features_ref.nw.frame_code
     
 
@@ -1229,14 +1228,12 @@ def get_worm_coils(features_ref, midbody_distance):
             coil_frame_start = iFrame
 
     if options.mimic_old_behaviour:
-        if (len(starts) > 0) & (ends[-1] == len(frame_code) - 1):
+        if (len(starts) > 0) and (ends[-1] == len(frame_code) - 1):
             ends[-1] += -1
             starts[-1] += -1
 
     temp = events.EventList(np.transpose(np.vstack((starts, ends))))
 
-    timer.toc('posture.coils')  
-
     return events.EventListWithFeatures(fps, temp, midbody_distance)
 
 
@@ -1264,36 +1261,21 @@ class Directions(object):
 
         """
 
-        timer = features_ref.timer
-        timer.tic()
-
         nw = features_ref.nw
         
-        sx = nw.skeleton_x
-        sy = nw.skeleton_y
-        wp = nw.worm_partitions
-
         # For each set of indices, compute the centroids of the tip and tail then
         # compute a direction vector between them (tip - tail)
 
-        # I - "indices" - really a tuple of start,stop
-        TIP_I = [wp['head'], wp['head_tip'], wp['tail_tip']]
-        TAIL_I = [wp['tail'], wp['head_base'], wp['tail_base']]
-
-        TIP_S = [slice(*x) for x in TIP_I]  # S - slice
-        TAIL_S = [slice(*x) for x in TAIL_I]
+        TIP_KEYS = ['head', 'head_tip', 'tail_tip']
+        TAIL_KEYS = ['tail', 'head_base', 'tail_base']
 
         for iVector, attribute_name in enumerate(self.direction_keys):
-            tip_x = np.mean(sx[TIP_S[iVector], :], axis=0)
-            tip_y = np.mean(sy[TIP_S[iVector], :], axis=0)
-            tail_x = np.mean(sx[TAIL_S[iVector], :], axis=0)
-            tail_y = np.mean(sy[TAIL_S[iVector], :], axis=0)
+            tip_x, tip_y = nw.get_partition_stat(TIP_KEYS[iVector])
+            tail_x, tail_y = nw.get_partition_stat(TAIL_KEYS[iVector])
 
             dir_value = 180 / np.pi * np.arctan2(tip_y - tail_y, tip_x - tail_x)
             setattr(self, attribute_name, dir_value)
 
-        timer.toc('posture.directions')
-
 
     @classmethod
     def from_disk(cls, data):
@@ -1306,6 +1288,13 @@ class Directions(object):
 
         return self
 
+    def to_disk(self, data):
+        """
+        The inverse of from_disk
+        """
+        for key in self.direction_keys:
+            utils._write_time_to_disk(data, key, getattr(self, key))
+
     def __repr__(self):
         return utils.print_object(self)
 
@@ -1367,9 +1356,6 @@ def get_eigenworms(features_ref):
     posture_options = features_ref.options.posture
     N_EIGENWORMS_USE = posture_options.n_eigenworms_use    
     
-    timer = features_ref.timer
-    timer.toc    
-    
     #eigen_worms: [7,48]  
     eigen_worms = load_eigen_worms()    
     
@@ -1417,6 +1403,5 @@ def get_eigenworms(features_ref):
     angles = angles - np.mean(angles, axis=0)
 
     eigen_projections = np.dot(eigen_worms[0:N_EIGENWORMS_USE,:],angles)
-    timer.toc('posture.eigenworms')
 
     return eigen_projections
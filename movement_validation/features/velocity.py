@@ -320,7 +320,8 @@ def h__getVelocityIndices(frames_per_sample, good_frames_mask):
 
 
 
-def compute_velocity(fps, sx, sy, avg_body_angle, sample_time, ventral_mode=0):
+def compute_velocity(fps, sx, sy, avg_body_angle, sample_time, ventral_mode=0,
+                     centroid=None):
     """
     The velocity is computed not using the nearest values but values
     that are separated by a sufficient time (sample_time). 
@@ -347,6 +348,10 @@ def compute_velocity(fps, sx, sy, avg_body_angle, sample_time, ventral_mode=0):
         1 = clockwise
         2 = anticlockwise
 
+    centroid: (optional) numpy array of shape (2, n)
+      The mean of sx and sy over the partition, if already known 
+      (see WormPartition.get_partition_stat)
+
     Returns
     -------
     Three numpy arrays of shape (n), speed, angular_speed, motion_direction
@@ -388,8 +393,11 @@ def compute_velocity(fps, sx, sy, avg_body_angle, sample_time, ventral_mode=0):
     # NOTE: In Matlab this is done only over a certain range of the body
     # TODO: Who calls this, can we just hard code mimic old behavior here???
 
-    x_mean = np.mean(sx, 0)
-    y_mean = np.mean(sy, 0)
+    if centroid is None:
+        x_mean = np.mean(sx, 0)
+        y_mean = np.mean(sy, 0)
+    else:
+        x_mean, y_mean = centroid
 
     dX = x_mean[right_I] - x_mean[left_I]
     dY = y_mean[right_I] - y_mean[left_I]
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+This module defines the WormBatch class
+
+"""
+
+import numpy as np
+
+from .. import utils
+from ..NormalizedWorm import NormalizedWorm
+
+from . import feature_processing_options as fpo
+from . import locomotion_features
+from . import path_features
+from . import posture_features
+from . import velocity as velocity_module
+from .worm_features import WormFeatures
+from .feature_timer import FeatureTimer
+
+
+class WormBatch(object):
+    """
+    Many normalized worms (e.g. all of the worms on a plate), with their data
+    stacked into arrays that have a leading worm dimension. Worms with fewer
+    frames are padded with NaN.
+
+    Features that are just array math can then be computed for all of the
+    worms in one call, rather than creating a WormFeatures for each worm.
+    The results have the same shape as for one worm, with the worm
+    dimension first, e.g. [n_worms x n_frames].
+
+    Features that only depend on each frame are computed with the feature
+    code for one worm, run on all of the frames of all of the worms one
+    after another. Between worms there is a gap of NaN frames, which is
+    longer than the windows used by the velocity, so the worms don't
+    affect each other.
+
+    Attributes
+    ----------
+    n_worms : int
+    n_frames : numpy.array
+        [n_worms], the # of frames of each worm
+    skeleton : numpy.array
+        [n_worms x 49 x 2 x max n_frames]
+    vulva_contour : numpy.array
+        [n_worms x 49 x 2 x max n_frames]
+    non_vulva_contour : numpy.array
+        [n_worms x 49 x 2 x max n_frames]
+    angles : numpy.array
+        [n_worms x 49 x max n_frames]
+    widths : numpy.array
+        [n_worms x 49 x max n_frames]
+    length : numpy.array
+        [n_worms x max n_frames]
+
+    Attributes that some of the worms don't have are None.
+
+    Usage
+    -----
+    batch = WormBatch(list_of_normalized_worms, video_info)
+    directions = batch.get_directions()
+    directions.head #[n_worms x n_frames]
+
+    """
+
+    stacked_names = ['skeleton', 'vulva_contour', 'non_vulva_contour',
+                     'angles', 'widths', 'length']
+
+    def __init__(self, worms, video_info, processing_options=None):
+        """
+        Parameters
+        ----------
+        worms : [movement_validation.NormalizedWorm]
+        video_info : movement_validation.video_info
+            All of the worms are assumed to be from videos with the same
+            frame rate
+        processing_options : FeatureProcessingOptions (optional)
+
+        """
+        if processing_options is None:
+            processing_options = fpo.FeatureProcessingOptions(video_info.fps)
+
+        self.video_info = video_info
+        self.options = processing_options
+        self.n_worms = len(worms)
+        self.n_frames = np.array([nw.num_frames for nw in worms], dtype=int)
+        max_n_frames = self.n_frames.max() if self.n_worms > 0 else 0
+
+        for name in self.stacked_names:
+            values = [getattr(nw, name, None) for nw in worms]
+            if self.n_worms == 0 or any(value is None for value in values):
+                setattr(self, name, None)
+                continue
+
+            stacked = np.full((self.n_worms,) + values[0].shape[:-1] +
+                              (max_n_frames,), np.NaN)
+            for iWorm, value in enumerate(values):
+                stacked[iWorm, ..., :value.shape[-1]] = value
+            setattr(self, name, stacked)
+
+        # The velocities of a frame use frames up to this far away
+        locomotion_options = processing_options.locomotion
+        self.gap_frames = max(velocity_module.get_frames_per_sample(
+                                video_info.fps, sample_time) for sample_time
+                              in (locomotion_options.velocity_tip_diff,
+                                  locomotion_options.velocity_body_diff))
+
+        self._features_ref = None
+
+    def __len__(self):
+        return self.n_worms
+
+    def get_directions(self):
+        """
+        Returns
+        -------
+        posture_features.Directions
+            Each attribute is [n_worms x n_frames]
+        """
+        return self.h__computeByFrame(posture_features.Directions)
+
+    def get_bends(self):
+        """
+        Returns
+        -------
+        posture_features.Bends
+            The mean and std_dev of each section are [n_worms x n_frames]
+        """
+        return self.h__computeByFrame(posture_features.Bends)
+
+    def get_eigen_projection(self):
+        """
+        Returns
+        -------
+        numpy.array
+            [n_worms x n_eigenworms x n_frames], see
+            posture_features.get_eigenworms
+        """
+        return self.h__computeByFrame(posture_features.get_eigenworms)
+
+    def get_velocity(self):
+        """
+        Returns
+        -------
+        locomotion_features.LocomotionVelocity
+            The speed and direction of each body part are
+            [n_worms x n_frames]
+        """
+        return self.h__computeByFrame(locomotion_features.LocomotionVelocity)
+
+    def get_path_range(self):
+        """
+        Returns
+        -------
+        path_features.Range
+            The value is [n_worms x n_frames]
+        """
+        vc = self.vulva_contour
+        nvc = self.non_vulva_contour
+
+        # See NormalizedWorm.contour_x
+        contour_x = np.concatenate((vc[:, :, 0], nvc[:, -2:0:-1, 0]), axis=1)
+        contour_y = np.concatenate((vc[:, :, 1], nvc[:, -2:0:-1, 1]), axis=1)
+
+        return path_features.Range(contour_x, contour_y)
+
+    def h__computeByFrame(self, feature_function):
+        """
+        Runs the feature code for one worm on all of the worms' frames, one
+        after another, and then splits the results back up by worm.
+
+        Parameters
+        ----------
+        feature_function :
+            Takes a WormFeatures, see h__getFeaturesRef
+        """
+        features_ref = self.h__getFeaturesRef()
+        with features_ref.timer.span(feature_function.__name__):
+            result = feature_function(features_ref)
+        return self.h__splitByWorm(result)
+
+    def h__getFeaturesRef(self):
+        """
+        Returns a WormFeatures without any features, whose normalized worm
+        has the frames of all of the worms one after another, with
+        gap_frames NaN frames after each worm.
+        """
+        if self._features_ref is not None:
+            return self._features_ref
+
+        nw = NormalizedWorm()
+        for name in self.stacked_names:
+            value = getattr(self, name)
+            if value is not None:
+                value = self.h__joinWorms(value)
+            setattr(nw, name, value)
+
+        features_ref = WormFeatures.__new__(WormFeatures)
+        features_ref.video_info = self.video_info
+        features_ref.options = self.options
+        features_ref.nw = nw
+        features_ref.cache = None
+        features_ref.timer = FeatureTimer()
+
+        self._features_ref = features_ref
+        return features_ref
+
+    def h__joinWorms(self, stacked):
+        """
+        [n_worms x ... x n_frames] to [... x n_worms*(n_frames + gap)]
+        """
+        gap = np.full(stacked.shape[:-1] + (self.gap_frames,), np.NaN)
+        padded = np.concatenate((stacked, gap), axis=-1)
+
+        # Move the worm dimension next to the frames
+        padded = np.rollaxis(padded, 0, padded.ndim - 1)
+
+        return padded.reshape(padded.shape[:-2] + (-1,))
+
+    def h__splitByWorm(self, result):
+        """
+        The inverse of h__joinWorms, for a feature result. Arrays with a
+        value for each of the joined frames are split up by worm, as are the
+        arrays of any objects, recursively.
+        """
+        n_joined = self.n_worms * (self.n_frames.max() + self.gap_frames)
+
+        if isinstance(result, np.ndarray):
+            if result.ndim == 0 or result.shape[-1] != n_joined:
+                return result
+            split = result.reshape(result.shape[:-1] + (self.n_worms, -1))
+            split = split[..., :-self.gap_frames]
+            return np.rollaxis(split, split.ndim - 2, 0)
+        elif hasattr(result, '__dict__'):
+            for name, value in vars(result).items():
+                setattr(result, name, self.h__splitByWorm(value))
+            return result
+        else:
+            return result
+
+    def __repr__(self):
+        return utils.print_object(self)
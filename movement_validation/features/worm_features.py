@@ -26,7 +26,8 @@ SegwormMatlabClasses/+seg_worm/@feature_calculator/features.m
 import h5py  # For loading from disk
 import numpy as np
 import collections  # For namedtuple
-import time #For FeatureTimer
+import concurrent.futures
+import copy
 
 from .. import utils
 
@@ -39,6 +40,7 @@ from . import locomotion_features
 from . import locomotion_bends
 from . import locomotion_turns
 from . import morphology_features
+from .feature_timer import FeatureTimer
 
 #TODO: This is being used when importing movement_validation
 #This should probably be changed
@@ -48,6 +50,11 @@ try:
 except ImportError:
      raise Exception("user_config.py not found, copy the user_config_example.txt in the 'movement_validation' package to user_config.py in the same directory and edit the values")
 
+#The version of the layout of the files written by WormFeatures.write_to_disk,
+#saved as an attribute of the 'worm' group. The Schafer lab files don't have
+#this attribute.
+FEATURE_SCHEMA_VERSION = 1
+
 
 """
 ===============================================================================
@@ -55,7 +62,88 @@ except ImportError:
 """
 
 
-class WormMorphology(object):
+class FeatureSection(object):
+
+    """
+    Base class of the sections of WormFeatures, e.g. WormMorphology.
+
+    The features of a section are computed by the methods listed in 
+    compute_methods. Usually all of the features are computed when the 
+    section is created. A lazy section instead computes each feature the
+    first time it's accessed, along with any features it needs, and then
+    keeps it.
+
+    Features that aren't computed are None, see 
+    FeatureProcessingOptions.should_compute_feature
+
+    """
+
+    #[(feature name, attribute names, method name)], in the order that the 
+    #features are computed. Each method takes features_ref and sets the 
+    #attributes listed with it. Feature names are as in 
+    #feature_processing_options.FEATURE_DEPENDENCIES
+    compute_methods = []
+
+    def h__computeFeatures(self, features_ref, lazy):
+        """
+        Features that are already set (e.g. ones passed to the constructor)
+        aren't computed again.
+        """
+        if lazy:
+            self._features_ref = features_ref
+            return
+
+        for feature_name, names, method_name in self.compute_methods:
+            if names[0] not in self.__dict__:
+                self.h__computeFeature(features_ref, feature_name, names, 
+                                       method_name)
+
+    def h__computeFeature(self, features_ref, feature_name, names, 
+                          method_name):
+        if not features_ref.options.should_compute_feature(feature_name, 
+                                                           features_ref):
+            for name in names:
+                setattr(self, name, None)
+            return
+
+        cache = features_ref.cache
+        if cache is not None:
+            values = cache.load(features_ref, feature_name)
+            if values is not None:
+                for name, value in values.items():
+                    setattr(self, name, value)
+                return
+
+        with features_ref.timer.span(feature_name):
+            getattr(self, method_name)(features_ref)
+            for name in names:
+                setattr(self, name, 
+                        h__convertFeatureFloats(self.__dict__.get(name), 
+                                                features_ref.options.dtype))
+
+        if cache is not None:
+            cache.store(features_ref, feature_name, 
+                        dict((name, self.__dict__.get(name)) 
+                             for name in names))
+
+    def __getattr__(self, name):
+        """
+        This is only called when an attribute is not found normally, which
+        is how the features of a lazy section are computed on access.
+        """
+        features_ref = self.__dict__.get('_features_ref')
+        if features_ref is not None:
+            for feature_name, names, method_name in self.compute_methods:
+                if name in names:
+                    self.h__computeFeature(features_ref, feature_name, names,
+                                           method_name)
+                    return self.__dict__[name]
+
+        raise AttributeError("'%s' object has no attribute '%s'" % 
+                             (type(self).__name__, name))
+
+
+class WormMorphology(FeatureSection):
 
     """
     The worm's morphology features class.
@@ -89,33 +177,52 @@ class WormMorphology(object):
 
     """
 
-    def __init__(self, features_ref):
+    compute_methods = [
+        ('morphology.length', ['length'], 'h__computeLength'),
+        ('morphology.width', ['width'], 'h__computeWidth'),
+        ('morphology.area', ['area'], 'h__computeArea'),
+        ('morphology.area_per_length', ['area_per_length'], 
+         'h__computeAreaPerLength'),
+        ('morphology.width_per_length', ['width_per_length'], 
+         'h__computeWidthPerLength')]
+
+    def __init__(self, features_ref, lazy=False):
         """
         
         Parameters:
         -----------
         features_ref : WormFeatures
+        lazy : bool
+            If True, features are computed when they are first accessed,
+            see FeatureSection
         
         """
         print('Calculating Morphology Features')
 
-        nw = features_ref.nw
+        self.h__computeFeatures(features_ref, lazy)
 
-        self.length = nw.length
+    def h__computeLength(self, features_ref):
+        self.length = features_ref.nw.length
         
+    def h__computeWidth(self, features_ref):
         self.width = morphology_features.Widths(features_ref)
 
+    def h__computeArea(self, features_ref):
         #TODO: This should eventually be calculated from the contour and skeleton
         #
         #This work is currently ongoing in the constructor for NormalizedWorm
         #
         #Eventually those methods will probably move to here ...
+        nw = features_ref.nw
         self.area = nw.tail_area + \
             nw.head_area + \
             nw.vulva_area + \
             nw.non_vulva_area
 
+    def h__computeAreaPerLength(self, features_ref):
         self.area_per_length = self.area / self.length
+            
+    def h__computeWidthPerLength(self, features_ref):
         self.width_per_length = self.width.midbody / self.length
 
     @classmethod
@@ -123,14 +230,30 @@ class WormMorphology(object):
         
         self = cls.__new__(cls)
 
-        self.length = utils._extract_time_from_disk(m_var, 'length')
-        self.width = morphology_features.Widths.from_disk(m_var['width'])
-        self.area = utils._extract_time_from_disk(m_var, 'area')
-        self.area_per_length = utils._extract_time_from_disk(m_var, 'areaPerLength')
-        self.width_per_length = utils._extract_time_from_disk(m_var, 'widthPerLength')
+        self.length = h__extractIfPresent(m_var, 'length')
+        self.width = h__readIfPresent(morphology_features.Widths, m_var, 
+                                      'width')
+        self.area = h__extractIfPresent(m_var, 'area')
+        self.area_per_length = h__extractIfPresent(m_var, 'areaPerLength')
+        self.width_per_length = h__extractIfPresent(m_var, 'widthPerLength')
 
         return self
 
+    def to_disk(self, m_var):
+        """
+        The inverse of from_disk. Features that weren't computed aren't saved.
+        """
+        if self.length is not None:
+            utils._write_time_to_disk(m_var, 'length', self.length)
+        if self.width is not None:
+            self.width.to_disk(m_var.create_group('width'))
+        for name, old_name in [('area', 'area'), 
+                               ('area_per_length', 'areaPerLength'),
+                               ('width_per_length', 'widthPerLength')]:
+            value = getattr(self, name)
+            if value is not None:
+                utils._write_time_to_disk(m_var, old_name, value)
+
     def __eq__(self, other):
 
         return \
@@ -155,7 +278,7 @@ class WormMorphology(object):
 """
 
 
-class WormLocomotion(object):
+class WormLocomotion(FeatureSection):
 
     """
     The worm's locomotion features class.
@@ -171,37 +294,65 @@ class WormLocomotion(object):
 
     """
 
-    def __init__(self, features_ref):
+    compute_methods = [
+        ('locomotion.velocity', ['velocity'], 'h__computeVelocity'),
+        ('locomotion.motion_events', ['motion_events'], 
+         'h__computeMotionEvents'),
+        ('locomotion.motion_mode', ['motion_mode'], 'h__computeMotionMode'),
+        ('locomotion.crawling_bends', ['crawling_bends'], 
+         'h__computeCrawlingBends'),
+        ('locomotion.foraging_bends', ['foraging_bends'], 
+         'h__computeForagingBends'),
+        ('locomotion.turns', ['turns'], 'h__computeTurns')]
+
+    def __init__(self, features_ref, velocity=None, lazy=False):
         """
         Initialization method for WormLocomotion
 
         Parameters
         ----------
         features_ref : WormFeatures
+        velocity : locomotion_features.LocomotionVelocity (optional)
+            Computed here if not given
+        lazy : bool
+            If True, features are computed when they are first accessed,
+            see FeatureSection
 
         """
         print('Calculating Locomotion Features')    
 
-        nw  = features_ref.nw
+        if velocity is not None:
+            self.velocity = velocity
 
+        self.h__computeFeatures(features_ref, lazy)
+
+    def h__computeVelocity(self, features_ref):
         self.velocity = locomotion_features.LocomotionVelocity(features_ref)
 
+    def h__computeMotionEvents(self, features_ref):
         self.motion_events = \
             locomotion_features.MotionEvents(features_ref,
                                              self.velocity.midbody.speed,
-                                             nw.length)
+                                             features_ref.nw.length)
 
+    def h__computeMotionMode(self, features_ref):
         self.motion_mode = self.motion_events.get_motion_mode()
 
+    def h__computeCrawlingBends(self, features_ref):
+        nw = features_ref.nw
         self.crawling_bends = locomotion_bends.LocomotionCrawlingBends(
             features_ref,
             nw.angles,
             self.motion_events.is_paused,
             nw.is_segmented)
 
+    def h__computeForagingBends(self, features_ref):
+        nw = features_ref.nw
         self.foraging_bends = locomotion_bends.LocomotionForagingBends(
             features_ref,nw.is_segmented,nw.ventral_mode)
 
+    def h__computeTurns(self, features_ref):
+        nw = features_ref.nw
         is_stage_movement = nw.segmentation_status == 'm'
 
         self.turns = locomotion_turns.LocomotionTurns(features_ref, 
@@ -271,17 +422,45 @@ class WormLocomotion(object):
 
         self.motion_events = locomotion_features.MotionEvents.from_disk(m_var)
 
-        self.motion_mode = self.motion_events.get_motion_mode()
-
-        bend_ref = m_var['bends']
-        self.crawling_bends = locomotion_bends.LocomotionCrawlingBends.from_disk(bend_ref)
-        
-        self.foraging_bends = locomotion_bends.LocomotionForagingBends.from_disk(bend_ref['foraging'])
+        if self.motion_events is None:
+            self.motion_mode = None
+        else:
+            self.motion_mode = self.motion_events.get_motion_mode()
+
+        self.crawling_bends = None
+        self.foraging_bends = None
+        if 'bends' in m_var:
+            bend_ref = m_var['bends']
+            if 'head' in bend_ref:
+                self.crawling_bends = locomotion_bends.LocomotionCrawlingBends.from_disk(bend_ref)
+            self.foraging_bends = h__readIfPresent(
+                locomotion_bends.LocomotionForagingBends, bend_ref, 'foraging')
         
-        self.turns    = locomotion_turns.LocomotionTurns.from_disk(m_var['turns'])
+        self.turns = h__readIfPresent(locomotion_turns.LocomotionTurns, 
+                                      m_var, 'turns')
 
         return self
 
+    def to_disk(self, m_var):
+        """
+        The inverse of from_disk. Features that weren't computed aren't saved.
+        """
+        if self.velocity is not None:
+            self.velocity.to_disk(m_var)
+
+        if self.motion_events is not None:
+            self.motion_events.to_disk(m_var)
+
+        if self.crawling_bends is not None or self.foraging_bends is not None:
+            bend_ref = m_var.create_group('bends')
+            if self.crawling_bends is not None:
+                self.crawling_bends.to_disk(bend_ref)
+            if self.foraging_bends is not None:
+                self.foraging_bends.to_disk(bend_ref.create_group('foraging'))
+
+        if self.turns is not None:
+            self.turns.to_disk(m_var.create_group('turns'))
+
 
 """
 ===============================================================================
@@ -289,7 +468,7 @@ class WormLocomotion(object):
 """
 
 
-class WormPosture(object):
+class WormPosture(FeatureSection):
 
     """
     Worm posture feature class.
@@ -316,28 +495,57 @@ class WormPosture(object):
 
     """
 
-    def __init__(self, features_ref, midbody_distance):
+    compute_methods = [
+        ('posture.bends', ['bends'], 'h__computeBends'),
+        ('posture.eccentricity', ['eccentricity', '_orientation'], 
+         'h__computeEccentricity'),
+        ('posture.amplitude_and_wavelength', 
+         ['amplitude_max', 'amplitude_ratio', 'primary_wavelength', 
+          'secondary_wavelength', 'track_length'], 
+         'h__computeAmplitudeAndWavelength'),
+        ('posture.kinks', ['kinks'], 'h__computeKinks'),
+        ('posture.coils', ['coils'], 'h__computeCoils'),
+        ('posture.directions', ['directions'], 'h__computeDirections'),
+        ('posture.skeleton', ['skeleton'], 'h__computeSkeleton'),
+        ('posture.eigen_projection', ['eigen_projection'], 
+         'h__computeEigenProjection')]
+
+    def __init__(self, features_ref, midbody_distance=None, lazy=False):
         """
         Initialization method for WormPosture
 
         Parameters
         ----------  
         normalized_worm: a NormalizedWorm instance
+        midbody_distance : numpy.array
+            Needed for the coils. If this isn't given it's taken from
+            features_ref.locomotion.
+        lazy : bool
+            If True, features are computed when they are first accessed,
+            see FeatureSection
 
         """
         print('Calculating Posture Features')            
         
-        # Let's use a shorthand
-        nw  = features_ref.nw
-        ##options = features_ref.options
-        
+        self._midbody_distance = midbody_distance
+
+        self.h__computeFeatures(features_ref, lazy)
+
+        if not lazy:
+            del self._midbody_distance
+            
+    def h__computeBends(self, features_ref):
         self.bends = posture_features.Bends.create(features_ref)
 
-        self.eccentricity, orientation = \
+    def h__computeEccentricity(self, features_ref):
+        #The orientation is only kept until the amplitude is computed
+        self.eccentricity, self._orientation = \
             posture_features.get_eccentricity_and_orientation(features_ref)
 
+    def h__computeAmplitudeAndWavelength(self, features_ref):
         amp_wave_track = posture_features.AmplitudeAndWavelength(
-            orientation, features_ref)
+            self._orientation, features_ref)
+        del self._orientation
 
         self.amplitude_max = amp_wave_track.amplitude_max
         self.amplitude_ratio = amp_wave_track.amplitude_ratio
@@ -345,15 +553,26 @@ class WormPosture(object):
         self.secondary_wavelength = amp_wave_track.secondary_wavelength
         self.track_length = amp_wave_track.track_length
 
+    def h__computeKinks(self, features_ref):
         self.kinks = posture_features.get_worm_kinks(features_ref)
 
-        self.coils = posture_features.get_worm_coils(features_ref, midbody_distance)
+    def h__computeCoils(self, features_ref):
+        midbody_distance = self._midbody_distance
+        if midbody_distance is None:
+            velocity = features_ref.locomotion.velocity
+            midbody_distance = velocity.get_midbody_distance()
+            
+        self.coils = posture_features.get_worm_coils(features_ref, 
+                                                     midbody_distance)
 
+    def h__computeDirections(self, features_ref):
         self.directions = posture_features.Directions(features_ref)
 
+    def h__computeSkeleton(self, features_ref):
         #TODO: I'd rather this be a formal class
         self.skeleton = posture_features.Skeleton(features_ref)
 
+    def h__computeEigenProjection(self, features_ref):
         self.eigen_projection = posture_features.get_eigenworms(features_ref)
 
     @classmethod
@@ -361,35 +580,89 @@ class WormPosture(object):
 
         self = cls.__new__(cls)
         
-        self.bends = posture_features.Bends.from_disk(p_var['bends'])
+        self.bends = h__readIfPresent(posture_features.Bends, p_var, 'bends')
 
-        temp_amp = p_var['amplitude']
+        if 'amplitude' in p_var:
+            temp_amp = p_var['amplitude']
 
-        self.amplitude_max = utils._extract_time_from_disk(temp_amp, 'max')
-        self.amplitude_ratio = utils._extract_time_from_disk(temp_amp, 'ratio')
+            self.amplitude_max = utils._extract_time_from_disk(temp_amp, 'max')
+            self.amplitude_ratio = utils._extract_time_from_disk(temp_amp, 'ratio')
 
-        temp_wave = p_var['wavelength']
-        self.primary_wavelength = utils._extract_time_from_disk(temp_wave, 'primary')
-        self.secondary_wavelength = utils._extract_time_from_disk(temp_wave, 'secondary')
+            temp_wave = p_var['wavelength']
+            self.primary_wavelength = utils._extract_time_from_disk(temp_wave, 'primary')
+            self.secondary_wavelength = utils._extract_time_from_disk(temp_wave, 'secondary')
+        else:
+            self.amplitude_max = None
+            self.amplitude_ratio = None
+            self.primary_wavelength = None
+            self.secondary_wavelength = None
 
-        self.track_length = utils._extract_time_from_disk(p_var, 'tracklength')
-        self.eccentricity = utils._extract_time_from_disk(p_var, 'eccentricity')
-        self.kinks = utils._extract_time_from_disk(p_var, 'kinks')
+        self.track_length = h__extractIfPresent(p_var, 'tracklength')
+        self.eccentricity = h__extractIfPresent(p_var, 'eccentricity')
+        self.kinks = h__extractIfPresent(p_var, 'kinks')
 
-        self.coils = events.EventListWithFeatures.from_disk(p_var['coils'], 'MRC')
+        if 'coils' in p_var:
+            self.coils = events.EventListWithFeatures.from_disk(p_var['coils'], 'MRC')
+        else:
+            self.coils = None
 
-        self.directions = posture_features.Directions.from_disk(p_var['directions'])
+        self.directions = h__readIfPresent(posture_features.Directions, 
+                                           p_var, 'directions')
 
         # TODO: Add contours
 
-        self.skeleton = posture_features.Skeleton.from_disk(p_var['skeleton'])
+        self.skeleton = h__readIfPresent(posture_features.Skeleton, p_var, 
+                                         'skeleton')
         
-        temp_eigen_projection = utils._extract_time_from_disk(p_var,'eigenProjection',is_matrix=True)        
+        temp_eigen_projection = h__extractIfPresent(p_var, 'eigenProjection',
+                                                    is_matrix=True)
         
-        self.eigen_projection = temp_eigen_projection.transpose()
+        if temp_eigen_projection is None:
+            self.eigen_projection = None
+        else:
+            self.eigen_projection = temp_eigen_projection.transpose()
 
         return self
 
+    def to_disk(self, p_var):
+        """
+        The inverse of from_disk. Features that weren't computed aren't saved.
+        """
+        if self.bends is not None:
+            self.bends.to_disk(p_var.create_group('bends'))
+
+        if self.amplitude_max is not None:
+            temp_amp = p_var.create_group('amplitude')
+            utils._write_time_to_disk(temp_amp, 'max', self.amplitude_max)
+            utils._write_time_to_disk(temp_amp, 'ratio', self.amplitude_ratio)
+
+            temp_wave = p_var.create_group('wavelength')
+            utils._write_time_to_disk(temp_wave, 'primary', 
+                                      self.primary_wavelength)
+            utils._write_time_to_disk(temp_wave, 'secondary', 
+                                      self.secondary_wavelength)
+
+            utils._write_time_to_disk(p_var, 'tracklength', self.track_length)
+
+        if self.eccentricity is not None:
+            utils._write_time_to_disk(p_var, 'eccentricity', self.eccentricity)
+        if self.kinks is not None:
+            utils._write_time_to_disk(p_var, 'kinks', self.kinks)
+
+        if self.coils is not None:
+            self.coils.to_disk(p_var.create_group('coils'))
+
+        if self.directions is not None:
+            self.directions.to_disk(p_var.create_group('directions'))
+
+        if self.skeleton is not None:
+            self.skeleton.to_disk(p_var.create_group('skeleton'))
+
+        if self.eigen_projection is not None:
+            utils._write_time_to_disk(p_var, 'eigenProjection', 
+                                      self.eigen_projection.transpose(),
+                                      is_matrix=True)
+
     def __repr__(self):
         return utils.print_object(self)
 
@@ -460,7 +733,7 @@ class WormPosture(object):
 """
 
 
-class WormPath(object):
+class WormPath(FeatureSection):
 
     """
     Worm posture feature class.
@@ -479,26 +752,39 @@ class WormPath(object):
 
     """
 
-    def __init__(self, features_ref):
+    compute_methods = [
+        ('path.range', ['range'], 'h__computeRange'),
+        ('path.duration', ['duration'], 'h__computeDuration'),
+        ('path.coordinates', ['coordinates'], 'h__computeCoordinates'),
+        ('path.curvature', ['curvature'], 'h__computeCurvature')]
+
+    def __init__(self, features_ref, lazy=False):
         """
         Initialization method for WormPosture
 
         Parameters:
         -----------
         features_ref: a WormFeatures instance
+        lazy : bool
+            If True, features are computed when they are first accessed,
+            see FeatureSection
         """
         print('Calculating Path Features')        
 
-        nw = features_ref.nw
+        self.h__computeFeatures(features_ref, lazy)
 
+    def h__computeRange(self, features_ref):
+        nw = features_ref.nw
         self.range = path_features.Range(nw.contour_x, nw.contour_y)
 
+    def h__computeDuration(self, features_ref):
         # Duration (aka Dwelling)
         self.duration = path_features.Duration(features_ref)
 
+    def h__computeCoordinates(self, features_ref):
         self.coordinates = path_features.Coordinates(features_ref)
 
-        #Curvature
+    def h__computeCurvature(self, features_ref):
         self.curvature = path_features.worm_path_curvature(features_ref)
 
     # TODO: Move to class in path_features
@@ -513,15 +799,33 @@ class WormPath(object):
         self = cls.__new__(cls)
 
         self.range = path_features.Range.from_disk(path_var)
-        self.duration = path_features.Duration.from_disk(path_var['duration'])
+        self.duration = h__readIfPresent(path_features.Duration, path_var, 
+                                         'duration')
 
-        self.coordinates = path_features.Coordinates.from_disk(path_var['coordinates'])
+        self.coordinates = h__readIfPresent(path_features.Coordinates, 
+                                            path_var, 'coordinates')
 
         #Make a call to utils loader
-        self.curvature = path_var['curvature'].value[:, 0]
+        if 'curvature' in path_var:
+            self.curvature = path_var['curvature'].value[:, 0]
+        else:
+            self.curvature = None
 
         return self
 
+    def to_disk(self, path_var):
+        """
+        The inverse of from_disk. Features that weren't computed aren't saved.
+        """
+        if self.range is not None:
+            self.range.to_disk(path_var)
+        if self.duration is not None:
+            self.duration.to_disk(path_var.create_group('duration'))
+        if self.coordinates is not None:
+            self.coordinates.to_disk(path_var.create_group('coordinates'))
+        if self.curvature is not None:
+            utils._write_time_to_disk(path_var, 'curvature', self.curvature)
+
     def __repr__(self):
         return utils.print_object(self)
 
@@ -562,14 +866,36 @@ class WormFeatures(object):
     video_info : movement_validation.video_info
     options : movement_validation.features.feature_processing_options
     nw : movement_validation.NormalizedWorm
+    cache : movement_validation.FeatureCache
+        May be None
     morphology : WormMorphology
     locomotion : WormLocomotion
     posture : WormPosture
     path : WormPath
 
+    With lazy=True, nothing is computed (or loaded, with from_disk) until
+    it's accessed. The sections are created on first access, and the 
+    features of each section are computed as they're accessed.
+
+    With a cache, features that were computed before for the same worm and
+    options are loaded from the cache rather than computed.
+
+    Usage
+    -----
+    wf = WormFeatures(nw, video_info, lazy=True)
+    wf.posture.eccentricity #Only the eccentricity is computed
+
+    wf = WormFeatures(nw, video_info, cache=FeatureCache('/path/to/cache'))
+
     """
 
-    def __init__(self, nw, video_info, processing_options=None):
+    section_classes = collections.OrderedDict([('morphology', WormMorphology),
+                                               ('locomotion', WormLocomotion),
+                                               ('posture', WormPosture),
+                                               ('path', WormPath)])
+
+    def __init__(self, nw, video_info, processing_options=None, lazy=False,
+                 cache=None):
         """
         
         Parameters
@@ -577,6 +903,10 @@ class WormFeatures(object):
         nw : movement_validation.NormalizedWorm
         video_info : movement_validation.video_info
         processing_options : movement_validation.features.feature_processing_options
+        lazy : bool
+            If True, features are computed when they are first accessed
+        cache : movement_validation.FeatureCache (optional)
+            Where computed features are stored and loaded from
 
         """
         
@@ -585,38 +915,212 @@ class WormFeatures(object):
         if processing_options is None:
             processing_options = fpo.FeatureProcessingOptions(video_info.fps)
 
+        #The features are computed with the precision given in the options
+        #(a copy is only made if the worm's data are of another type), and
+        #their values are stored with it, see h__convertFeatureFloats
+        nw = nw.astype(processing_options.dtype)
+
         #These are saved locally for reference by others when processing
         self.video_info = video_info
         self.options = processing_options
         self.nw = nw
-        self.timer = FeatureTimer()
+        self.cache = cache
+        self.timer = FeatureTimer(nw.num_frames, 
+                                  processing_options.track_memory)
+        
+        if lazy:
+            #The sections are created on access, see __getattr__
+            self._is_lazy = True
+            return
         
-        self.morphology = WormMorphology(self)
-        self.locomotion = WormLocomotion(self)
-        self.posture = WormPosture(self, 
-                                   self.locomotion.velocity.get_midbody_distance())
-        self.path = WormPath(self)
+        #The velocity is needed by both the locomotion and the posture 
+        #features, so it is computed first. After that each section only
+        #depends on the normalized worm.
+        if processing_options.should_compute_feature('locomotion.velocity', 
+                                                     self):
+            velocity = self.h__getVelocity()
+            midbody_distance = velocity.get_midbody_distance()
+        else:
+            velocity = None
+            midbody_distance = None
+        
+        sections = [('morphology', WormMorphology, ()),
+                    ('locomotion', WormLocomotion, (velocity,)),
+                    ('posture', WormPosture, (midbody_distance,)),
+                    ('path', WormPath, ())]
+
+        if processing_options.n_workers is None:
+            for name, section_class, args in sections:
+                section, timer = compute_section(self, name, section_class, 
+                                                 args)
+                setattr(self, name, section)
+        else:
+            self.h__computeSectionsConcurrently(sections)
+
+    def h__getVelocity(self):
+        """
+        Computes the velocity, or loads it from the cache. This is stored 
+        in the cache as the locomotion's velocity, see FeatureSection.
+        """
+        if self.cache is not None:
+            values = self.cache.load(self, 'locomotion.velocity')
+            if values is not None:
+                return values['velocity']
+
+        with self.timer.span('locomotion.velocity'):
+            velocity = h__convertFeatureFloats(
+                locomotion_features.LocomotionVelocity(self), 
+                self.options.dtype)
+
+        if self.cache is not None:
+            self.cache.store(self, 'locomotion.velocity', 
+                             {'velocity': velocity})
+
+        return velocity
+
+    def h__computeSectionsConcurrently(self, sections):
+        """
+        Computes the sections at the same time, with the workers given by 
+        the processing options.
+        
+        Parameters
+        ----------
+        sections : [(name, class, args)]
+            Each section is created as class(self, *args)
+        """
+        options = self.options
+        if options.executor_type == 'thread':
+            executor_class = concurrent.futures.ThreadPoolExecutor
+            features_ref = self
+        elif options.executor_type == 'process':
+            executor_class = concurrent.futures.ProcessPoolExecutor
+            #Each process logs times to its own copy of this empty timer,
+            #which are then merged into this one
+            features_ref = copy.copy(self)
+            features_ref.timer = FeatureTimer(self.timer.n_frames, 
+                                              self.timer.track_memory)
+        else:
+            raise ValueError('Unrecognized executor type: %s' % 
+                             options.executor_type)
+        
+        with executor_class(options.n_workers) as executor:
+            futures = [executor.submit(compute_section, features_ref, name, 
+                                       section_class, args) 
+                       for name, section_class, args in sections]
+            
+            for (name, section_class, args), future in zip(sections, futures):
+                section, timer = future.result()
+                setattr(self, name, section)
+                if timer is not self.timer:
+                    self.timer.merge(timer)
 
     @classmethod
-    def from_disk(cls, file_path):
+    def from_disk(cls, file_path, lazy=False):
 
         """
         This from disk method is currently focused on loading the features
         files as computed by the Schafer lab. Alternative loading methods
         should be possible 
+        
+        Parameters
+        ----------
+        file_path : str
+        lazy : bool
+            If True, each section (e.g. 'posture') is only read from the 
+            file when it's first accessed. The file is kept open until all of
+            the sections have been read, or until close() is called (the 
+            features can be used in a with statement to do this).
+            
+        Usage
+        -----
+        with WormFeatures.from_disk(file_path, lazy=True) as wf:
+            wf.posture.coils #Only the posture section is read
         """
         h = h5py.File(file_path, 'r')
-        worm = h['worm']
-
-        self = cls.__new__(cls)
+        try:
+            worm = h['worm']
+
+            schema_version = worm.attrs.get('schema_version', 0)
+            if schema_version > FEATURE_SCHEMA_VERSION:
+                raise Exception('%s was written with a newer version of the '
+                                'features file format (%d) than is supported '
+                                '(%d)' % (file_path, schema_version, 
+                                          FEATURE_SCHEMA_VERSION))
+
+            self = cls.__new__(cls)
+
+            if lazy:
+                #The sections are read on access, see __getattr__
+                self._lazy_disk_group = worm
+                return self
+
+            for name, section_class in self.section_classes.items():
+                setattr(self, name, 
+                        h__readIfPresent(section_class, worm, name))
+        except:
+            h.close()
+            raise
+
+        h.close()
+        return self
 
-        self.morphology = WormMorphology.from_disk(worm['morphology'])
-        self.locomotion = WormLocomotion.from_disk(worm['locomotion'])
-        self.posture = WormPosture.from_disk(worm['posture'])
-        self.path = WormPath.from_disk(worm['path'])
+    def close(self):
+        """
+        Closes the file of features loaded with from_disk(lazy=True). 
+        Sections that haven't been read by then are no longer available.
+        """
+        group = self.__dict__.pop('_lazy_disk_group', None)
+        if group is not None:
+            group.file.close()
 
+    def __enter__(self):
         return self
 
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_to_disk(self, file_path):
+        """
+        Saves the features in the layout that from_disk reads, i.e. that of
+        the Schafer lab files. Event frames are saved as arrays rather than
+        as a Matlab structure array. Features that weren't computed aren't
+        saved.
+
+        Parameters
+        ----------
+        file_path : str
+            The HDF5 file to create. An existing file is overwritten.
+        """
+        with h5py.File(file_path, 'w') as h:
+            worm = h.create_group('worm')
+            worm.attrs['schema_version'] = FEATURE_SCHEMA_VERSION
+
+            for name in self.section_classes:
+                getattr(self, name).to_disk(worm.create_group(name))
+
+    def __getattr__(self, name):
+        """
+        This is only called when an attribute is not found normally, which
+        is how the sections of lazy features are created on access.
+        """
+        if name in self.section_classes:
+            section_class = self.section_classes[name]
+            if '_lazy_disk_group' in self.__dict__:
+                section = h__readIfPresent(section_class, 
+                                           self._lazy_disk_group, name)
+                setattr(self, name, section)
+                #The file isn't needed once all of the sections are read
+                if all(x in self.__dict__ for x in self.section_classes):
+                    self.close()
+                return section
+            elif self.__dict__.get('_is_lazy', False):
+                section = section_class(self, lazy=True)
+                setattr(self, name, section)
+                return section
+            
+        raise AttributeError("'%s' object has no attribute '%s'" % 
+                             (type(self).__name__, name))
+
     def __repr__(self):
         return utils.print_object(self)
 
@@ -633,42 +1137,196 @@ class WormFeatures(object):
              same_locomotion and \
              same_posture and \
              same_path
-                      
-            
-        
-class FeatureTimer(object):
 
+
+def get_precision_report(nw, video_info, dtype=np.float32, 
+                         processing_options=None, high_corr_value=0.999):
     """
-    This class is meant to be called in the following way by code that is 
-    processing a feature.
+    Computes the features of a worm in double precision and in a reduced 
+    precision, and compares each feature value.
     
-    timer = features_ref.timer
-    timer.tic()
-    #Run the feature processing code
-    timer.toc('name of feature being processed')    
+    Parameters
+    ----------
+    nw : movement_validation.NormalizedWorm
+    video_info : movement_validation.video_info
+    dtype : 
+        The reduced precision type, see FeatureProcessingOptions.dtype
+    processing_options : FeatureProcessingOptions (optional)
+        Used for both computations, apart from the dtype
+    high_corr_value : float
+        The correlation that a value must have with the double precision
+        value to pass, as in feature_comparisons.corr_value_high
         
+    Returns
+    -------
+    OrderedDict
+        Keys are the feature values, e.g. 'posture.bends.head.mean'. Values
+        are dicts of:
+        - 'max_abs_error' : the largest absolute difference
+        - 'max_rel_error' : max_abs_error relative to the largest absolute
+          double precision value
+        - 'n_nan_mismatches' : the # of elements that are NaN in only one 
+          of the two
+        - 'correlation' : between the two, over the elements that aren't 
+          NaN in either. None if the values are identical or constant, or
+          there are fewer than 2 elements.
+        - 'passes' : True if the values are identical or constant, or the
+          correlation is above high_corr_value. Values whose shapes differ
+          (e.g. a different # of events) don't pass.
+    
     """
+    if processing_options is None:
+        processing_options = fpo.FeatureProcessingOptions(video_info.fps)
+    
+    options = copy.deepcopy(processing_options)
+    options.dtype = np.float64
+    reference = WormFeatures(nw, video_info, options)
+    
+    options = copy.deepcopy(processing_options)
+    options.dtype = dtype
+    reduced = WormFeatures(nw, video_info, options)
+    
+    reference_values = collections.OrderedDict()
+    reduced_values = collections.OrderedDict()
+    for section in WormFeatures.section_classes:
+        h__getFeatureValues(getattr(reference, section), section, 
+                            reference_values)
+        h__getFeatureValues(getattr(reduced, section), section, 
+                            reduced_values)
+
+    report = collections.OrderedDict()
+    for name, value in reference_values.items():
+        report[name] = h__compareValues(value, reduced_values.get(name), 
+                                        high_corr_value)
+    
+    return report
 
-    def __init__(self):    
-        self.names = []
-        self.times = []
-        
-    def tic(self):
-        self.start_time = time.time()
+
+def h__getFeatureValues(value, name, values):
+    """
+    Adds the numeric values (arrays and numbers) of a feature, or of the
+    objects that it holds, to values, keyed by their names
+    """
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind in 'biuf':
+            values[name] = value
+    elif isinstance(value, (np.number, float, int)) and \
+            not isinstance(value, bool):
+        values[name] = value
+    elif isinstance(value, (list, tuple)):
+        for index, x in enumerate(value):
+            h__getFeatureValues(x, '%s[%d]' % (name, index), values)
+    elif isinstance(value, dict):
+        for key, x in value.items():
+            h__getFeatureValues(x, '%s.%s' % (name, key), values)
+    elif hasattr(value, '__dict__') and not isinstance(value, type):
+        for key, x in vars(value).items():
+            if not key.startswith('_'):
+                h__getFeatureValues(x, '%s.%s' % (name, key), values)
+
+
+def h__compareValues(x, y, high_corr_value):
+    """
+    Compares a double precision value x with a reduced precision value y,
+    see get_precision_report
+    """
+    result = {'max_abs_error': None, 'max_rel_error': None, 
+              'n_nan_mismatches': None, 'correlation': None, 
+              'passes': False}
     
-    def toc(self,name):
-        self.times.append(time.time() - self.start_time)
-        self.names.append(name)
-        
-    def __repr__(self):
-        return utils.print_object(self)
+    x = np.asarray(x, dtype=np.float64)
+    if y is None:
+        return result
+    y = np.asarray(y, dtype=np.float64)
+    if x.shape != y.shape:
+        return result
+    
+    x_nan = np.isnan(x)
+    y_nan = np.isnan(y)
+    keep_mask = ~(x_nan | y_nan)
+    xn = x[keep_mask]
+    yn = y[keep_mask]
+    
+    result['n_nan_mismatches'] = int(np.sum(x_nan != y_nan))
+    if xn.size > 0:
+        max_abs_error = np.max(np.abs(xn - yn))
+        scale = np.max(np.abs(xn))
+        result['max_abs_error'] = float(max_abs_error)
+        result['max_rel_error'] = \
+            float(max_abs_error / scale) if scale > 0 else float(max_abs_error)
+    
+    if np.array_equal(xn, yn) or xn.size < 2 or \
+            np.all(xn == xn[0]) or np.all(yn == yn[0]):
+        result['passes'] = True
+    else:
+        result['correlation'] = float(np.corrcoef(xn, yn)[1, 0])
+        result['passes'] = result['correlation'] > high_corr_value
+    
+    return result
+                      
+            
         
-    def summarize(self):
-        """
-        This can be called to display each logged function and how long it
-        took to run
-        """
-        for (name,time) in zip(self.names,self.times):
-            print('%s: %0.3fs' %(name,time))
+def compute_section(features_ref, name, section_class, args):
+    """
+    Creates one section of the features (e.g. a WormPosture). This is a 
+    module function so that it can be run in another process.
+    
+    Returns
+    -------
+    (section, FeatureTimer)
+        The timer is the one that the section's times were logged to
+    """
+    with features_ref.timer.span(name):
+        section = section_class(features_ref, *args)
+    return section, features_ref.timer
+
 
             
+
+
+def h__convertFeatureFloats(value, dtype):
+    """
+    Converts the floating point arrays of a computed feature to dtype (see 
+    FeatureProcessingOptions.dtype). Objects (e.g. event lists) are changed 
+    in place. Intermediate values of the feature code aren't affected, so 
+    with np.float32 the features still need as much memory while they're 
+    computed, but half as much once they are.
+    """
+    if dtype == np.float64:
+        # What the feature code computes anyway
+        return value
+    elif isinstance(value, np.ndarray):
+        if np.issubdtype(value.dtype, np.floating):
+            return value.astype(dtype, copy=False)
+        return value
+    elif isinstance(value, list):
+        return [h__convertFeatureFloats(x, dtype) for x in value]
+    elif isinstance(value, dict):
+        return dict((key, h__convertFeatureFloats(x, dtype)) 
+                    for key, x in value.items())
+    elif hasattr(value, '__dict__') and not isinstance(value, type):
+        for name, x in list(vars(value).items()):
+            setattr(value, name, h__convertFeatureFloats(x, dtype))
+        return value
+    else:
+        return value
+
+
+def h__readIfPresent(reader_class, parent_ref, name):
+    """
+    Returns reader_class.from_disk(parent_ref[name]), or None if the file 
+    doesn't have name, e.g. because the feature wasn't computed when the 
+    file was written (see WormFeatures.write_to_disk)
+    """
+    if name not in parent_ref:
+        return None
+    return reader_class.from_disk(parent_ref[name])
+
+
+def h__extractIfPresent(parent_ref, name, is_matrix=False):
+    """
+    As utils._extract_time_from_disk, but None if the file doesn't have name
+    """
+    if name not in parent_ref:
+        return None
+    return utils._extract_time_from_disk(parent_ref, name, is_matrix)
@@ -9,13 +9,118 @@ import numpy as np
 
 from . import config
 
-from scipy.signal import savgol_filter as sgolay
-#Why didn't this work?
-#import scipy.signal.savgol_filter as sgolay
-#http://stackoverflow.com/questions/29324814/what-are-the-rules-for-importing-with-as-in-python-without-using-from
+from scipy.signal import savgol_coeffs
+from scipy.ndimage import convolve1d
 
 from . import utils
+from .ragged_frames import RaggedFrames
 
+#computeWidths constants
+#----------------------------------
+FRACTION_WORM_SMOOTH = 1.0/12.0
+SMOOTHING_ORDER = 3
+PERCENT_BACK_SEARCH = 0.3
+PERCENT_FORWARD_SEARCH = 0.3
+END_S1_WALK_PCT = 0.15
+
+#The # of frames that computeWidths processes at once. Memory use is roughly 
+#proportional to this value times the square of the # of contour points.
+DEFAULT_FRAMES_PER_BATCH = 100
+
+#The approximate # of elements in the temporary arrays used when resampling 
+#frames, see h__normalizeFramesBatch
+RESAMPLE_BLOCK_SIZE = 10**7
+
+
+class ContourDistances(object):
+    
+    """
+    Distances between the points on the two sides of a contour, computed
+    as they are requested.
+    
+    d[I1,I2] gives the same value as the full len(s1) x len(s2) distance 
+    matrix (d_across in computeWidths) would, without creating that matrix.
+    
+    """
+    
+    def __init__(self,s1,s2):
+        self.s1 = s1
+        self.s2 = s2
+        
+    def __getitem__(self,key):
+        I1,I2 = key
+        return np.sqrt((self.s1[0,I1] - self.s2[0,I2])**2 + \
+                       (self.s1[1,I1] - self.s2[1,I2])**2)
+
+
+class ChainCodeCache(object):
+    
+    """
+    Holds the chain code lengths of recently seen sets of frames so that 
+    the lengths are computed only once when several values defined on the 
+    same points are normalized (e.g. a skeleton and its angles).
+    
+    Entries are matched by the object holding the points (i.e. by 
+    identity, like WormPartition.get_partition_stat), so the lengths are
+    recomputed if the points are replaced, but not if they are modified
+    in place.
+    
+    Usage
+    -----
+    cache = ChainCodeCache()
+    angles = WormParsing.calculateAngles(skeletons,cache)
+    skeletons = WormParsing.normalizeAllFramesXY(skeletons,cache)
+    
+    """
+    
+    def __init__(self,max_entries=4):
+        self.max_entries = max_entries
+        self.entries = []
+        self.n_hits = 0
+        self.n_misses = 0
+        
+    def get(self,xy_data,x,y,n):
+        """
+        
+        Parameters
+        ----------
+        xy_data : 
+            The points before being packed, see WormParsing.h__packPolylines
+        x,y,n :
+            Packed points, see WormParsing.h__packPolylines
+            
+        Returns
+        -------
+        numpy.array
+            [n_frames x max_n_points], see 
+            WormParsing.h__chainCodeLengthsBatch
+        """
+        for I,entry in enumerate(self.entries):
+            if self.h__isMatch(entry,xy_data,x,n):
+                #Most recently used entries are kept at the end
+                self.entries.append(self.entries.pop(I))
+                self.n_hits += 1
+                return entry[3]
+                
+        self.n_misses += 1
+        cc = WormParsing.h__chainCodeLengthsBatch(x,y)
+        #The points are referenced, not copied
+        self.entries.append((xy_data,x.shape,n,cc))
+        if len(self.entries) > self.max_entries:
+            self.entries.pop(0)
+            
+        return cc
+    
+    def clear(self):
+        self.entries = []
+
+    @staticmethod
+    def h__isMatch(entry,xy_data,x,n):
+        old_xy_data,old_shape,old_n,_ = entry
+        #The # of points per frame is cheap to check and catches lists 
+        #that have been appended to
+        return old_xy_data is xy_data and old_shape == x.shape and \
+            np.array_equal(old_n,n)
 
 
 class WormParsing(object):
@@ -73,10 +178,22 @@ class WormParsing(object):
         right_I = np.ceil(right_pct*n2)
         left_I[left_I < 0] = 0;
         right_I[right_I >= n2] = n2-1
-        return left_I,right_I
+        return left_I.astype(int),right_I.astype(int)
     
     @staticmethod
     def h__getMatches(s1,s2,norm_x,norm_y,dx_across,dy_across,d_across,left_I,right_I):
+        """
+        
+        Parameters
+        ----------
+        dx_across, dy_across, d_across : [n1 x n2] or None
+            Normalized differences and distances between all points on
+            side 1 and all points on side 2. If None, only the values within
+            each point's search window (left_I to right_I) are computed, as 
+            they are needed. This band-limited approach gives the same 
+            result using memory that is linear in the # of contour points.
+            
+        """
         
         n_s1 = s1.shape[1]
         match_I = np.zeros(n_s1,dtype=np.int)
@@ -85,12 +202,19 @@ class WormParsing(object):
         
         dp_values = np.zeros(n_s1)
         all_signs_used = np.zeros(n_s1)
+        
+        def get_window(I,lb,rb):
+            if d_across is None:
+                return WormParsing.h__getAcrossWindow(s1,s2,I,lb,rb)
+            else:
+                return (dx_across[I,lb:rb],dy_across[I,lb:rb],d_across[I,lb:rb])
 
         #There is no need to do the first and last point
         for I,(lb,rb) in enumerate(zip(left_I[1:-1],right_I[1:-1])):
 
             I = I + 1
-            [abs_dp_value,dp_I,sign_used] = WormParsing.h__getProjectionIndex(norm_x[I],norm_y[I],dx_across[I,lb:rb],dy_across[I,lb:rb],lb,d_across[I,lb:rb],0)
+            dx_window,dy_window,d_window = get_window(I,lb,rb)
+            [abs_dp_value,dp_I,sign_used] = WormParsing.h__getProjectionIndex(norm_x[I],norm_y[I],dx_window,dy_window,lb,d_window,0)
             all_signs_used[I] = sign_used
             dp_values[I] = abs_dp_value
             match_I[I] = dp_I
@@ -106,13 +230,26 @@ class WormParsing(object):
             for I in I_bad:    
                 lb = left_I[I]
                 rb = right_I[I]
-                [abs_dp_value,dp_I,sign_used] = WormParsing.h__getProjectionIndex(norm_x[I],norm_y[I],dx_across[I,lb:rb],dy_across[I,lb:rb],lb,d_across[I,lb:rb],sign_use)
+                dx_window,dy_window,d_window = get_window(I,lb,rb)
+                [abs_dp_value,dp_I,sign_used] = WormParsing.h__getProjectionIndex(norm_x[I],norm_y[I],dx_window,dy_window,lb,d_window,sign_use)
                 all_signs_used[I] = sign_used
                 dp_values[I] = abs_dp_value
                 match_I[I] = dp_I    
 
 
         return (dp_values,match_I)
+
+    @staticmethod
+    def h__getAcrossWindow(s1,s2,I,lb,rb):
+        """
+        Computes one row of dx_across, dy_across and d_across (see 
+        computeWidths) for the side 2 points lb to rb.
+        """
+        dx_across = s1[0,I] - s2[0,lb:rb]
+        dy_across = s1[1,I] - s2[1,lb:rb]
+        d_across = np.sqrt(dx_across**2 + dy_across**2)
+        
+        return (dx_across/d_across,dy_across/d_across,d_across)
     
     @staticmethod
     def h__getProjectionIndex(vc_dx_ortho,vc_dy_ortho,dx_across_worm,dy_across_worm,left_I,d_across,sign_use):
@@ -157,7 +294,7 @@ class WormParsing(object):
         
         Ip = utils.find(possible)
         if len(Ip) == 1:
-            dp_I = Ip+1
+            dp_I = Ip[0]+1
             dp_value = dp[dp_I]
         elif len(Ip) > 1:
             temp_I = np.argmin(d_across[Ip])
@@ -178,7 +315,8 @@ class WormParsing(object):
         
         Parameters
         ----------
-        d_across
+        d_across : [n1 x n2] or ContourDistances
+            Only d_across[I1,I2] indexing is used
         match_I1
         s1
         s2
@@ -193,7 +331,7 @@ class WormParsing(object):
         n_s2 = s2.shape[1]       
         
         
-        end_s1_walk_I = np.ceil(n_s1*END_S1_WALK_PCT)
+        end_s1_walk_I = int(np.ceil(n_s1*END_S1_WALK_PCT))
         end_s2_walk_I = 2*end_s1_walk_I
         p1_I,p2_I = WormParsing.h__getPartnersViaWalk(0,end_s1_walk_I,0,end_s2_walk_I,d_across,s1,s2)
         
@@ -246,9 +384,10 @@ class WormParsing(object):
     #%
 
 
-        #TODO: remove hardcode
-        p1_I = np.zeros(200,dtype=np.int)
-        p2_I = np.zeros(200,dtype=np.int)
+        #Each step advances at least one of the two indices towards its end
+        max_n_pairs = max(int(abs(e1-s1) + abs(e2-s2)),1)
+        p1_I = np.zeros(max_n_pairs,dtype=np.int)
+        p2_I = np.zeros(max_n_pairs,dtype=np.int)
     
         c1 = s1 #current 1 index
         c2 = s2 #current 2 index
@@ -344,9 +483,23 @@ class WormParsing(object):
 
 
     @staticmethod
-    def computeWidths(vulva_contours, non_vulva_contours):
+    def computeWidths(vulva_contours, non_vulva_contours, 
+                      frames_per_batch=DEFAULT_FRAMES_PER_BATCH):
         """
         
+        Parameters
+        ----------
+        vulva_contours : [ndarray] or RaggedFrames
+            List length: # of frames. Each element is [2 x n_points] or None.
+            NOTE: Contours are smoothed in place.
+        non_vulva_contours : [ndarray]
+            Same format as vulva_contours.
+        frames_per_batch : int or None (optional)
+            The # of frames to process at once. Larger values are faster but
+            use more memory. If None, each frame is processed on its own
+            using the original per-frame code. Both approaches give identical
+            results.
+        
         Returns
         -------
         (widths_all,s_all) tuple
@@ -389,13 +542,199 @@ class WormParsing(object):
         #Widths are simply the distance between two "corresponding" sides of
         #the contour. The question is how to get these two locations. 
 
-        FRACTION_WORM_SMOOTH = 1.0/12.0
-        SMOOTHING_ORDER = 3
-        PERCENT_BACK_SEARCH = 0.3;
-        PERCENT_FORWARD_SEARCH = 0.3;
-        END_S1_WALK_PCT = 0.15;
+        if frames_per_batch is None:
+            return WormParsing.h__computeWidthsByFrame(vulva_contours, 
+                                                       non_vulva_contours)
+
+        n_frames = len(vulva_contours)
+        s_all = [None]*n_frames
+        widths_all = [None]*n_frames
+        
+        valid_I = [iFrame for iFrame, s1 in enumerate(vulva_contours) 
+                   if s1 is not None]
+                   
+        for start_I in range(0,len(valid_I),frames_per_batch):
+            batch_I = valid_I[start_I:start_I+frames_per_batch]
+            widths, skeletons = WormParsing.h__computeWidthsBatch(
+                                    [vulva_contours[I] for I in batch_I],
+                                    [non_vulva_contours[I] for I in batch_I])
+            for iFrame, cur_widths, cur_skeleton in zip(batch_I,widths,skeletons):
+                widths_all[iFrame] = cur_widths
+                s_all[iFrame] = cur_skeleton
+
+        return (widths_all,s_all)
+                
+        """
+            import matplotlib.pyplot as plt
+            plt.scatter(vc[0,:],vc[1,:])
+            plt.scatter(nvc[0,:],nvc[1,:])
+            plt.gca().set_aspect('equal', adjustable='box')
+            plt.show()
+            
+            plt.plot(x_plot,y_plot)
+            plt.show()
+            
+            plt.scatter(s1[0,:],s1[1,:])
+            plt.scatter(s2[0,:],s2[1,:])
+            plt.scatter(skeleton_x,skeleton_y)
+            plt.show()
+        """
+
+    @staticmethod
+    def downsampleContours(contours,max_n_points):
+        """
+        Resamples frames that have more than max_n_points points to 
+        max_n_points points, evenly spaced along the chain code length. 
+        This is meant to be used on each side of a contour before 
+        computeWidths, whose run time grows quickly with the # of points.
+        
+        Each new point lies on the original contour, and the first and last 
+        points are kept. The new points are d = (contour length)/(max_n_points-1)
+        apart along the contour.
+        
+        The widths and skeleton are computed from a different pairing of the
+        points on the two sides, with a different # of skeleton points, so 
+        they can't be compared point by point. Compared at the same fractions
+        of the skeleton's length (the skeleton normalized to 49 points, and 
+        the widths interpolated at those points), the largest change in a 
+        frame, as a fraction of d, was:
+        
+        Each side of the contour         max_n_points   skeleton    widths
+                                                        p95   max   p95   max
+        get_example_contours in the      50 to 125      0.05  0.05  0.16  0.19
+        tests (120-165 points)
+        synthetic, 600-1000 points,      100            0.13  0.14  0.18  0.19
+        0.7 px noise, rounded to pixels  200            0.19  0.28  0.26  0.27
+                                         400            0.28  0.36  0.30  0.32
+        as above, with 3 px noise        100            0.14  0.16  0.12  0.13
+                                         200            0.27  0.32  0.23  0.29
+                                         400            0.55  0.59  0.29  0.59
+        
+        (p95 is over frames.) The changes are within d/2 unless d gets close
+        to the noise of the contour (noise also makes the contour longer, 
+        which increases d). No bound holds for all contours, as moving a 
+        point slightly can change which points are paired.
+        
+        Parameters
+        ----------
+        contours : [numpy.array] or RaggedFrames
+            Each frame is [2 x n_points] or None
+        max_n_points : int
+        
+        Returns
+        -------
+        [numpy.array] or RaggedFrames
+            Same type as the input. Frames that are not resampled are not 
+            copied.
+        """
+        # With fewer points the spacing d isn't defined
+        if max_n_points < 2:
+            raise ValueError('max_n_points must be at least 2, not %s' % 
+                             max_n_points)
+        
+        n = np.array([0 if s is None else s.shape[1] for s in contours])
+        frame_I = utils.find(n > max_n_points)
+        
+        resampled = list(contours)
+        if frame_I.size > 0:
+            x,y,n_long = WormParsing.h__packPolylines([contours[I] for I in frame_I])
+            new_xy = WormParsing.h__normalizeFramesBatch(x,y,n_long,[x,y],
+                                                         n_norm=max_n_points)
+            for I,cur_xy in zip(frame_I,np.transpose(new_xy,(2,1,0))):
+                resampled[I] = np.ascontiguousarray(cur_xy)
+        
+        if isinstance(contours,RaggedFrames):
+            return RaggedFrames.from_list(resampled)
+        else:
+            return resampled
+
+    @staticmethod
+    def h__smoothContour(s):
+        """
+        Savitzky-Golay smoothing of a single [2 x n_points] contour, in place.
+        """
+        filter_width = int(WormParsing.h__roundToOdd(s.shape[1]*FRACTION_WORM_SMOOTH))
+        s[:,:] = WormParsing.h__sgolay(s,filter_width,SMOOTHING_ORDER)
+
+    @staticmethod
+    def h__smoothContoursBatch(contours):
+        """
+        Smooths a list of [2 x n_points] contours in place. Contours with the
+        same # of points are smoothed together.
+        """
+        n = np.array([s.shape[1] for s in contours])
+        for cur_n in np.unique(n):
+            frame_I = utils.find(n == cur_n)
+            filter_width = int(WormParsing.h__roundToOdd(cur_n*FRACTION_WORM_SMOOTH))
+            data = np.vstack([contours[I] for I in frame_I])
+            data = WormParsing.h__sgolay(data,filter_width,SMOOTHING_ORDER)
+            for I,row_I in zip(frame_I,range(0,data.shape[0],2)):
+                contours[I][:,:] = data[row_I:row_I+2,:]
+
+    _sgolay_coeffs = {}
+
+    @staticmethod
+    def h__sgolay(data,window_length,polyorder):
+        """
+        Savitzky-Golay filtering of each row of data. 
+        
+        This gives the same result as scipy's savgol_filter with its default
+        'interp' mode (to within floating point rounding). Unlike that 
+        function the result for a given row does not depend on what other 
+        rows are filtered with it, which lets us smooth many frames at once
+        and still get exactly what smoothing frame by frame would give.
         
+        Parameters
+        ----------
+        data : [n_rows x n_points]
+        window_length : int
+        polyorder : int
+        """
+        key = (window_length,polyorder)
+        if key not in WormParsing._sgolay_coeffs:
+            half_length = window_length//2
+            #Filter coefficients for the center of the window and for 
+            #evaluating the polynomial fit at each of the edge points
+            WormParsing._sgolay_coeffs[key] = (
+                savgol_coeffs(window_length,polyorder),
+                np.array([savgol_coeffs(window_length,polyorder,pos=I,use='dot') 
+                          for I in range(half_length)]),
+                np.array([savgol_coeffs(window_length,polyorder,pos=I,use='dot') 
+                          for I in range(window_length-half_length,window_length)]))
+        
+        coeffs,left_coeffs,right_coeffs = WormParsing._sgolay_coeffs[key]
+        half_length = left_coeffs.shape[0]
+        
+        if window_length > data.shape[1]:
+            raise ValueError("window_length must be less than or equal to the size of data")
+
+        #NOTE: The products are summed along the last (contiguous) axis so 
+        #that each row is summed the same way regardless of the # of rows
+        smoothed = convolve1d(data,coeffs,axis=1,mode='constant')
+        smoothed[:,:half_length] = np.sum(
+            left_coeffs*data[:,None,:window_length],axis=2)
+        smoothed[:,data.shape[1]-half_length:] = np.sum(
+            right_coeffs*data[:,None,-window_length:],axis=2)
+
+        return smoothed
 
+    @staticmethod
+    def h__computeWidthsByFrame(vulva_contours, non_vulva_contours, banded=True):
+        """
+        The original frame by frame version of computeWidths. 
+        
+        Parameters
+        ----------
+        banded : bool (optional)
+            If False the full len(s1) x len(s2) distance matrices are 
+            computed for each frame. If True only the distances within the 
+            search windows are computed. The results are the same.
+        
+        See Also
+        --------
+        computeWidths
+        h__computeWidthsBatch
+        """
         s_all = []
         widths_all = []
 
@@ -410,22 +749,25 @@ class WormParsing(object):
                 continue
             
             #Step 1: filter
-            filter_width_s1 = WormParsing.h__roundToOdd(s1.shape[1]*FRACTION_WORM_SMOOTH)    
-            s1[0,:] = sgolay(s1[0,:],filter_width_s1,SMOOTHING_ORDER)
-            s1[1,:] = sgolay(s1[1,:],filter_width_s1,SMOOTHING_ORDER)
-
-            filter_width_s2 = WormParsing.h__roundToOdd(s2.shape[1]*FRACTION_WORM_SMOOTH)    
-            s2[0,:] = sgolay(s2[0,:],filter_width_s2,SMOOTHING_ORDER)
-            s2[1,:] = sgolay(s2[1,:],filter_width_s2,SMOOTHING_ORDER)
-
-            #TODO: Allow downsampling if the # of points is rediculous
-            #200 points seems to be a good #
-            #This operation gives us a matrix that is len(s1) x len(s2)
-            dx_across = np.transpose(s1[0:1,:]) - s2[0,:]
-            dy_across = np.transpose(s1[1:2,:]) - s2[1,:]
-            d_across = np.sqrt(dx_across**2 + dy_across**2)
-            dx_across = dx_across/d_across
-            dy_across = dy_across/d_across
+            WormParsing.h__smoothContour(s1)
+            WormParsing.h__smoothContour(s2)
+
+            #Contours with a rediculous # of points can be downsampled
+            #beforehand, see downsampleContours
+            if banded:
+                #Only the needed distances are computed, see h__getMatches
+                dx_across = None
+                dy_across = None
+                d_across = None
+                d_walk = ContourDistances(s1,s2)
+            else:
+                #This operation gives us a matrix that is len(s1) x len(s2)
+                dx_across = np.transpose(s1[0:1,:]) - s2[0,:]
+                dy_across = np.transpose(s1[1:2,:]) - s2[1,:]
+                d_across = np.sqrt(dx_across**2 + dy_across**2)
+                dx_across = dx_across/d_across
+                dy_across = dy_across/d_across
+                d_walk = d_across
             
             #All s1 matching to s2
             #---------------------------------------
@@ -437,7 +779,7 @@ class WormParsing(object):
             #%For each point on side 1, find which side 2 the point pairs with
             dp_values1,match_I1 = WormParsing.h__getMatches(s1,s2,norm_x,norm_y,dx_across,dy_across,d_across,left_I,right_I)
 
-            I_1,I_2 = WormParsing.h__updateEndsByWalking(d_across,match_I1,s1,s2,END_S1_WALK_PCT)
+            I_1,I_2 = WormParsing.h__updateEndsByWalking(d_walk,match_I1,s1,s2,END_S1_WALK_PCT)
 
             #TODO: Make this a function
             #------------------------------------
@@ -467,28 +809,400 @@ class WormParsing(object):
             
 
         return (widths_all,s_all)
-                
+
+    """
+    ===========================================================================
+    Batched width computation
+    ===========================================================================
+    The functions below mirror the per-frame helpers above but work on many
+    frames at once. Frames are packed into NaN padded arrays that are 
+    [n_frames x max_n_points], along with the # of valid points per frame.
+    
+    The arithmetic is kept the same as in the per-frame code so that the
+    results are identical, not just close.
+    """
+
+    @staticmethod
+    def h__computeWidthsBatch(s1_all, s2_all):
         """
-            import matplotlib.pyplot as plt
-            plt.scatter(vc[0,:],vc[1,:])
-            plt.scatter(nvc[0,:],nvc[1,:])
-            plt.gca().set_aspect('equal', adjustable='box')
-            plt.show()
+        Parameters
+        ----------
+        s1_all : [ndarray]
+            Vulva contours, each [2 x n_points], none of which can be None
+        s2_all : [ndarray]
+            Non-vulva contours
+        
+        Returns
+        -------
+        (widths_all,s_all) tuple
+            See computeWidths
+        
+        """
+        WormParsing.h__smoothContoursBatch(s1_all)
+        WormParsing.h__smoothContoursBatch(s2_all)
+        
+        x1,y1,n1 = WormParsing.h__packFrames(s1_all)
+        x2,y2,n2 = WormParsing.h__packFrames(s2_all)
+        
+        norm_x,norm_y = WormParsing.h__computeNormalVectorsBatch(x1,y1,n1)
+        
+        dp_values1,match_I1 = WormParsing.h__getMatchesBatch(
+                                    x1,y1,n1,x2,y2,n2,norm_x,norm_y,
+                                    PERCENT_BACK_SEARCH,PERCENT_FORWARD_SEARCH)
+        
+        keep_mask = WormParsing.h__updateEndsByWalkingBatch(
+                                    match_I1,x1,y1,n1,x2,y2,n2,END_S1_WALK_PCT)
+        
+        #Flatten the kept matches of all frames into one long list. Since 
+        #np.nonzero works in row order the points of a frame stay together
+        #and in order.
+        frame_I,I_1 = np.nonzero(keep_mask)
+        I_2 = match_I1[frame_I,I_1]
+        
+        n_kept = np.sum(keep_mask,axis=1)
+        end_I = np.cumsum(n_kept)
+        start_I = end_I - n_kept
+        
+        #Same ordering check as the per-frame code. The first and last 
+        #point of each frame are always kept.
+        is_good = np.zeros(I_2.size,dtype=bool)
+        is_good[1:-1] = (I_2[1:-1] <= I_2[2:]) & (I_2[1:-1] >= I_2[:-2])
+        is_good[start_I] = True
+        is_good[end_I-1] = True
+        
+        frame_I = frame_I[is_good]
+        I_1 = I_1[is_good]
+        I_2 = I_2[is_good]
+        
+        s1_x  = x1[frame_I,I_1]
+        s1_y  = y1[frame_I,I_1]
+        s1_px = x2[frame_I,I_2]
+        s1_py = y2[frame_I,I_2]
+        
+        widths = np.sqrt((s1_px-s1_x)**2 + (s1_py - s1_y)**2)
+        skeletons = np.vstack((0.5*(s1_x + s1_px),0.5*(s1_y + s1_py)))
+
+        split_I = np.cumsum(np.bincount(frame_I,minlength=len(s1_all)))[:-1]
+        
+        return (np.split(widths,split_I), np.split(skeletons,split_I,axis=1))
+        
+    @staticmethod
+    def h__packFrames(frames):
+        """
+        Packs a list of [2 x n_points] arrays into NaN padded arrays.
+        
+        Returns
+        -------
+        (x,y,n) tuple
+        x : [n_frames x max_n_points]
+        y : [n_frames x max_n_points]
+        n : [n_frames] 
+            # of points in each frame
+        """
+        n = np.array([frame.shape[1] for frame in frames],dtype=int)
+        n_frames = n.size
+        x = np.full((n_frames,n.max()),np.NaN)
+        y = np.full((n_frames,n.max()),np.NaN)
+        
+        all_xy = np.hstack(frames)
+        row_I = np.repeat(np.arange(n_frames),n)
+        col_I = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n,n)
+        x[row_I,col_I] = all_xy[0,:]
+        y[row_I,col_I] = all_xy[1,:]
+        
+        return x,y,n
+
+    @staticmethod
+    def h__computeNormalVectorsBatch(x,y,n):
+        """
+        Batch version of h__computeNormalVectors. 
+        
+        np.gradient can't be used directly since the last valid point of 
+        each frame needs a one-sided difference.
+        """
+        frame_I = np.arange(n.size)
+        last_I = n - 1
+        
+        dx = np.empty_like(x)
+        dy = np.empty_like(y)
+        for data,d_data in ((x,dx),(y,dy)):
+            d_data[:,1:-1] = (data[:,2:] - data[:,:-2])/2.0
+            d_data[:,0] = data[:,1] - data[:,0]
+            d_data[frame_I,last_I] = data[frame_I,last_I] - data[frame_I,last_I-1]
             
-            plt.plot(x_plot,y_plot)
-            plt.show()
+        dx_norm = dy
+        dy_norm = -dx
+        
+        vc_d_magnitude = np.sqrt(dx_norm**2 + dy_norm**2)
+        
+        norm_x = dx_norm/vc_d_magnitude
+        norm_y = dy_norm/vc_d_magnitude
+        
+        return norm_x,norm_y
+
+    @staticmethod
+    def h__getMatchesBatch(x1,y1,n1,x2,y2,n2,norm_x,norm_y,p_left,p_right):
+        """
+        Batch version of h__getMatches.
+        
+        Only the side 2 points within each point's search window are 
+        considered. Points (across all frames) are grouped by the size of 
+        their search window so that each group can be processed as a 
+        regular [n_points_in_group x window_size] array. 
+        
+        Returns
+        -------
+        (dp_values,match_I) tuple
+            Each is [n_frames x max_n1]
+        """
+        n_frames,max_n1 = x1.shape
+        frame_I = np.arange(n_frames)
+        
+        #h__getBounds for all frames
+        #---------------------------------
+        pct = np.zeros(x1.shape)
+        for cur_n1 in np.unique(n1):
+            pct[n1 == cur_n1,:cur_n1] = np.linspace(0,1,cur_n1)
+        
+        n2_col = n2[:,None]
+        left_I = np.floor((pct - p_left)*n2_col)
+        right_I = np.ceil((pct + p_right)*n2_col)
+        left_I[left_I < 0] = 0
+        right_I = np.where(right_I >= n2_col, n2_col - 1, right_I)
+        left_I = left_I.astype(int)
+        right_I = right_I.astype(int)
+        
+        #There is no need to do the first and last point
+        col_I = np.arange(max_n1)
+        is_interior = (col_I >= 1) & (col_I < n1[:,None]-1)
+        point_frame_I,point_I = np.nonzero(is_interior)
+        point_left_I = left_I[point_frame_I,point_I]
+        window_sizes = right_I[point_frame_I,point_I] - point_left_I
+        
+        #For each point, the match when dp is used as is (sign of -1) and
+        #when it is flipped (sign of 1) 
+        n_points = point_I.size
+        dp_I_neg = np.zeros(n_points,dtype=int)
+        dp_I_pos = np.zeros(n_points,dtype=int)
+        dp_value_neg = np.zeros(n_points)
+        dp_value_pos = np.zeros(n_points)
+        is_flipped = np.zeros(n_points,dtype=bool)
+        
+        for window_size in np.unique(window_sizes):
+            group_I = np.flatnonzero(window_sizes == window_size)
+            f_I = point_frame_I[group_I]
+            p_I = point_I[group_I]
+            cols = point_left_I[group_I,None] + np.arange(window_size)
             
-            plt.scatter(s1[0,:],s1[1,:])
-            plt.scatter(s2[0,:],s2[1,:])
-            plt.scatter(skeleton_x,skeleton_y)
-            plt.show()
+            dx_across = x1[f_I,p_I][:,None] - x2[f_I[:,None],cols]
+            dy_across = y1[f_I,p_I][:,None] - y2[f_I[:,None],cols]
+            d_across = np.sqrt(dx_across**2 + dy_across**2)
+            dx_across = dx_across/d_across
+            dy_across = dy_across/d_across
+            
+            dp = dx_across*norm_x[f_I,p_I][:,None] + dy_across*norm_y[f_I,p_I][:,None]
+            
+            #NOTE: Each row is a contiguous block of the same length as in 
+            #the per-frame code so the sums (and thus the signs) match exactly
+            is_flipped[group_I] = np.sum(dp,axis=1) > 0
+            dp_I_neg[group_I],dp_value_neg[group_I] = \
+                WormParsing.h__getProjectionIndexBatch(dp,d_across)
+            dp_I_pos[group_I],dp_value_pos[group_I] = \
+                WormParsing.h__getProjectionIndexBatch(-1*dp,d_across)
+        
+        #Sign handling, see h__getProjectionIndex and h__getMatches
+        #--------------------------------------------------------------
+        all_signs_used = np.zeros(x1.shape)
+        all_signs_used[point_frame_I,point_I] = np.where(is_flipped,1,-1)
+        
+        is_mixed = np.any(is_interior & (all_signs_used != all_signs_used[:,1:2]),axis=1)
+        sign_use = np.where(np.sum(all_signs_used,axis=1) > 0, 1, -1)
+        
+        use_mixed_fix = is_mixed[point_frame_I]
+        point_sign = np.where(use_mixed_fix,sign_use[point_frame_I],
+                              all_signs_used[point_frame_I,point_I])
+        
+        use_flipped = point_sign == 1
+        
+        match_I = np.zeros(x1.shape,dtype=int)
+        match_I[point_frame_I,point_I] = point_left_I + \
+                                np.where(use_flipped,dp_I_pos,dp_I_neg)
+        match_I[frame_I,n1-1] = n2
+        
+        dp_values = np.zeros(x1.shape)
+        dp_values[point_frame_I,point_I] = \
+                                np.where(use_flipped,dp_value_pos,dp_value_neg)
+        
+        return (dp_values,match_I)
+
+    @staticmethod
+    def h__getProjectionIndexBatch(dp,d_across):
+        """
+        Batch version of the selection logic in h__getProjectionIndex. Each
+        row of dp is a separate search window with the sign already applied.
+        
+        Returns
+        -------
+        (dp_I,dp_value) tuple
+            Indices are relative to the start of each window.
         """
+        n_rows = dp.shape[0]
+        
+        #See h__getProjectionIndex regarding the odd indexing
+        possible = (dp[:,1:-2] < dp[:,2:-1]) & (dp[:,1:-2] < dp[:,0:-3])
+        
+        dp_I = np.argmin(dp,axis=1)
+        if possible.shape[1] > 0:
+            #With one possible point this returns that point. With more than
+            #one the point with the smallest distance is used. As in the 
+            #per-frame code the distances are indexed without the +1.
+            has_possible = np.any(possible,axis=1)
+            possible_d = np.where(possible,d_across[:,:possible.shape[1]],np.Inf)
+            dp_I[has_possible] = np.argmin(possible_d[has_possible],axis=1) + 1
+        
+        dp_value = dp[np.arange(n_rows),dp_I]
+        
+        return (dp_I,dp_value)
 
+    @staticmethod
+    def h__updateEndsByWalkingBatch(match_I1,x1,y1,n1,x2,y2,n2,END_S1_WALK_PCT):
+        """
+        Batch version of h__updateEndsByWalking
+        
+        match_I1 is updated in place.
+        
+        Returns
+        -------
+        keep_mask : [n_frames x max_n1]
+        """
+        n_frames,max_n1 = x1.shape
+        frame_I = np.arange(n_frames)
+        zeros = np.zeros(n_frames,dtype=int)
+        
+        end_s1_walk_I = np.ceil(n1*END_S1_WALK_PCT).astype(int)
+        end_s2_walk_I = 2*end_s1_walk_I
+        
+        end_s1_walk_backwards = n1 - end_s1_walk_I + 1
+        end_s2_walk_backwards = n2 - end_s2_walk_I + 1
+        
+        walks = [WormParsing.h__getPartnersViaWalkBatch(
+                    zeros,end_s1_walk_I,zeros,end_s2_walk_I,x1,y1,x2,y2),
+                 WormParsing.h__getPartnersViaWalkBatch(
+                    n1-1,end_s1_walk_backwards,n2-1,end_s2_walk_backwards,
+                    x1,y1,x2,y2)]
+                    
+        keep_mask = np.zeros(x1.shape,dtype=bool)
+        
+        #The pairs are applied in the order they were found so that when 
+        #a side 1 point is paired more than once the last pairing wins, as
+        #with match_I1[p1_I] = p2_I in the per-frame code.
+        for p1_I,p2_I,n_pairs in walks:
+            for cur_p_I in range(p1_I.shape[0]):
+                f_I = frame_I[cur_p_I < n_pairs]
+                match_I1[f_I,p1_I[cur_p_I,f_I]] = p2_I[cur_p_I,f_I]
+                keep_mask[f_I,p1_I[cur_p_I,f_I]] = True
+        
+        #anything in between we'll use the projection appproach
+        col_I = np.arange(max_n1)
+        keep_mask |= (col_I >= end_s1_walk_I[:,None] + 1) & \
+                     (col_I < end_s1_walk_backwards[:,None])
+                     
+        #Always keep ends
+        keep_mask[:,0] = True
+        keep_mask[frame_I,n1-1] = True
+        
+        match_I1[:,0] = 0
+        match_I1[frame_I,n1-1] = n2-1
+        
+        return keep_mask
 
+    @staticmethod
+    def h__getPartnersViaWalkBatch(s1,e1,s2,e2,x1,y1,x2,y2):
+        """
+        Batch version of h__getPartnersViaWalk. All frames take a step
+        together until every frame is done walking.
+        
+        Parameters
+        ----------
+        s1,e1,s2,e2 : [n_frames]
+            Start and end indices for each frame, see h__getPartnersViaWalk
+        
+        Returns
+        -------
+        (p1_I,p2_I,n_pairs) tuple
+        p1_I : [n_steps x n_frames]
+        p2_I : [n_steps x n_frames]
+        n_pairs : [n_frames]
+            # of valid pairs for each frame. Like the per-frame code the
+            last pair found is dropped.
+        """
+        n_frames = s1.size
+        frame_I = np.arange(n_frames)
+        
+        #Each step advances at least one of the two indices towards its end
+        max_steps = max(np.max(np.abs(e1-s1) + np.abs(e2-s2)),1)
+        
+        p1_I = np.zeros((max_steps,n_frames),dtype=int)
+        p2_I = np.zeros((max_steps,n_frames),dtype=int)
+        n_steps = np.zeros(n_frames,dtype=int)
+        
+        direction = np.where(e1 < s1,-1,1)        
+        
+        c1 = s1.copy() #current 1 index
+        c2 = s2.copy() #current 2 index
+        is_walking = (c1 != e1) & (c2 != e2)
+        
+        def get_d(f_I,I1,I2):
+            return np.sqrt((x1[f_I,I1] - x2[f_I,I2])**2 + \
+                           (y1[f_I,I1] - y2[f_I,I2])**2)
+        
+        cur_p_I = -1 #current pair index
+        while np.any(is_walking):
+            cur_p_I += 1
+            
+            f_I = frame_I[is_walking]
+            cur1 = c1[f_I]
+            cur2 = c2[f_I]
+            next1 = cur1 + direction[f_I]
+            next2 = cur2 + direction[f_I]
+            
+            d_n1n2 = get_d(f_I,next1,next2)
+            d_n1c2 = get_d(f_I,next1,cur2)
+            d_n2c1 = get_d(f_I,cur1,next2)
+            
+            #contours go similar directions
+            is_similar = ((x1[f_I,next1] - x1[f_I,cur1])*(x2[f_I,next2] - x2[f_I,cur2]) > 0) | \
+                         ((y1[f_I,next1] - y1[f_I,cur1])*(y2[f_I,next2] - y2[f_I,cur2]) > 0)
+            
+            #The per-frame code reads the previous pair even on the first 
+            #step, where it gets the unset pair (0,0). On the second step
+            #the previous width is taken as 0.
+            if cur_p_I == 0:
+                prev_width = get_d(f_I,0*f_I,0*f_I)
+            elif cur_p_I == 1:
+                prev_width = np.zeros(f_I.size)
+            else:
+                prev_width = get_d(f_I,p1_I[cur_p_I-1,f_I],p2_I[cur_p_I-1,f_I])
+            
+            advance_both = (d_n1c2 == d_n2c1) | ((d_n1n2 <= d_n1c2) & (d_n1n2 <= d_n2c1))
+            advance_both |= ~is_similar & (d_n1c2 > prev_width) & (d_n2c1 > prev_width)
+            advance_1 = advance_both | (d_n1c2 < d_n2c1)
+            advance_2 = advance_both | ~(d_n1c2 < d_n2c1)
+            
+            c1[f_I] = np.where(advance_1,next1,cur1)
+            c2[f_I] = np.where(advance_2,next2,cur2)
+            
+            p1_I[cur_p_I,f_I] = c1[f_I]
+            p2_I[cur_p_I,f_I] = c2[f_I]
+            n_steps[f_I] += 1
+            
+            is_walking[f_I] = (c1[f_I] != e1[f_I]) & (c2[f_I] != e2[f_I])
+            
+        return (p1_I,p2_I,n_steps-1)
 
 
     @staticmethod
-    def computeSkeletonLengths(xy_all):
+    def computeSkeletonLengths(xy_all,cache=None):
         """
 
         Computes the running length (cumulative distance from start - head?) 
@@ -497,22 +1211,20 @@ class WormParsing(object):
         
         Parameters
         ----------
-        xy_all : [numpy.array]
+        xy_all : [numpy.array], RaggedFrames or numpy.array
             Contains the skeleton positions for each frame.
             List length: # of frames
-            Each element contains a numpy array of size [n_points x 2]
+            Each element contains a numpy array of size [2 x n_points]
+            or None. An array of size [n_points x 2 x n_frames] may also
+            be used.
             Skeleton 
+        cache : ChainCodeCache (optional)
         """
-        n_frames = len(xy_all)
-        data = np.full([config.N_POINTS_NORMALIZED,n_frames],np.NaN)
-        for iFrame, cur_xy in enumerate(xy_all):
-            if cur_xy is not None:
-                sx = cur_xy[0,:]
-                sy = cur_xy[1,:]
-                cc = WormParsing.computeChainCodeLengths(sx,sy)
-                data[:,iFrame] = WormParsing.normalizeParameter(cc,cc)
-                
-        return data
+        x,y,n = WormParsing.h__packPolylines(xy_all)
+        cc = WormParsing.h__getChainCodeLengths(xy_all,x,y,n,cache)
+        
+        #Resampling the chain code lengths themselves
+        return WormParsing.h__normalizeFramesBatch(x,y,n,[cc],cc)[:,0,:]
 
     @staticmethod
     def computeChainCodeLengths(x,y):
@@ -535,36 +1247,56 @@ class WormParsing(object):
         return np.cumsum(distances)
 
     @staticmethod
-    def normalizeAllFramesXY(prop_to_normalize):
+    def normalizeAllFramesXY(prop_to_normalize,cache=None):
+        """
+        Resamples each frame's x,y points to N_POINTS_NORMALIZED points 
+        evenly spaced along the chain code length.
+        
+        Parameters
+        ----------
+        prop_to_normalize : [numpy.array], RaggedFrames or numpy.array
+            List of [2 x n_points] arrays (or None), the same as a 
+            RaggedFrames, or an array of size [n_points x 2 x n_frames]
+        cache : ChainCodeCache (optional)
             
-        n_frames = len(prop_to_normalize)
-        norm_data = np.full([config.N_POINTS_NORMALIZED,2,n_frames],np.NaN)
-        for iFrame, cur_frame_value in enumerate(prop_to_normalize):
-            if cur_frame_value is not None:
-                sx = cur_frame_value[0,:]
-                sy = cur_frame_value[1,:]
-                cc = WormParsing.computeChainCodeLengths(sx,sy)
-                norm_data[:,0,iFrame] = WormParsing.normalizeParameter(sx,cc)
-                norm_data[:,1,iFrame] = WormParsing.normalizeParameter(sy,cc)
+        Returns
+        -------
+        numpy.array
+            [N_POINTS_NORMALIZED x 2 x n_frames], NaN for missing frames
+        """
+        x,y,n = WormParsing.h__packPolylines(prop_to_normalize)
+        cc = WormParsing.h__getChainCodeLengths(prop_to_normalize,x,y,n,cache)
         
-        return norm_data            
+        return WormParsing.h__normalizeFramesBatch(x,y,n,[x,y],cc)
     
     @staticmethod
-    def normalizeAllFrames(prop_to_normalize,xy_data):
+    def normalizeAllFrames(prop_to_normalize,xy_data,cache=None):
+        """
+        Resamples a value that is defined at each x,y point, using the
+        x,y points to compute the chain code lengths.
+        
+        Parameters
+        ----------
+        prop_to_normalize : [numpy.array], RaggedFrames or numpy.array
+            List of [n_points] arrays, the same as a RaggedFrames, or an 
+            array of size [n_points x n_frames]
+        xy_data : 
+            See normalizeAllFramesXY
+        cache : ChainCodeCache (optional)
             
-        n_frames = len(prop_to_normalize)
-        norm_data = np.full([config.N_POINTS_NORMALIZED,n_frames],np.NaN)
-        for iFrame, (cur_frame_value,cur_xy) in enumerate(zip(prop_to_normalize,xy_data)):
-            if cur_xy is not None:
-                sx = cur_xy[0,:]
-                sy = cur_xy[1,:]
-                cc = WormParsing.computeChainCodeLengths(sx,sy)
-                norm_data[:,iFrame] = WormParsing.normalizeParameter(cur_frame_value,cc)
+        Returns
+        -------
+        numpy.array
+            [N_POINTS_NORMALIZED x n_frames], NaN for missing frames
+        """
+        x,y,n = WormParsing.h__packPolylines(xy_data)
+        cc = WormParsing.h__getChainCodeLengths(xy_data,x,y,n,cache)
+        values = WormParsing.h__packValues(prop_to_normalize,n)
         
-        return norm_data 
+        return WormParsing.h__normalizeFramesBatch(x,y,n,[values],cc)[:,0,:]
 
     @staticmethod
-    def calculateAngles(skeletons):
+    def calculateAngles(skeletons,cache=None):
     
         """
         #Angles
@@ -592,56 +1324,138 @@ class WormParsing(object):
         #   temp_   
         """                  
 
-        temp_angle_list = []
-                      
-        for iFrame, cur_frame_value in enumerate(skeletons):
-            if cur_frame_value is None:
-                temp_angle_list.append([])
-            else:
-                sx = cur_frame_value[0,:]
-                sy = cur_frame_value[1,:]
-                cc = WormParsing.computeChainCodeLengths(sx,sy)
-    
-                #This is from the old code
-                edge_length = cc[-1]/12               
-                
-                #We want all vertices to be defined, and if we look starting
-                #at the left_I for a vertex, rather than vertex for left and right
-                #then we could miss all middle points on worms being vertices
+        x,y,n = WormParsing.h__packPolylines(skeletons)
+        cc = WormParsing.h__getChainCodeLengths(skeletons,x,y,n,cache)
+        
+        #Frames with the same # of points (e.g. normalized skeletons) are 
+        #processed together
+        if np.unique(n[n > 0]).size <= 1:
+            angles = WormParsing.h__calculateAnglesBatch(x,y,n,cc)
+        else:
+            angles = WormParsing.h__calculateAnglesByFrame(x,y,n,cc)
                 
-                left_lengths = cc - edge_length
-                right_lengths = cc + edge_length
+        return WormParsing.h__normalizeFramesBatch(x,y,n,[angles],cc)[:,0,:]
     
-                valid_vertices_I = utils.find((left_lengths > cc[0]) & (right_lengths < cc[-1]))
-                
-                left_lengths = left_lengths[valid_vertices_I]
-                right_lengths = right_lengths[valid_vertices_I]                
-                
-                left_x = np.interp(left_lengths,cc,sx)
-                left_y = np.interp(left_lengths,cc,sy)
+    @staticmethod
+    def h__calculateAnglesByFrame(x,y,n,cc_all):
+        """
+        Computes the angles one frame at a time, see calculateAngles.
+        
+        Parameters
+        ----------
+        x,y,n : 
+            Packed skeletons, see h__packPolylines
+        cc_all : [n_frames x max_n_points]
             
-                right_x = np.interp(right_lengths,cc,sx)
-                right_y = np.interp(right_lengths,cc,sy)
-    
-                d2_y = sy[valid_vertices_I] - right_y
-                d2_x = sx[valid_vertices_I] - right_x
-                d1_y = left_y - sy[valid_vertices_I]
-                d1_x = left_x - sx[valid_vertices_I] 
-    
-                frame_angles = np.arctan2(d2_y,d2_x) - np.arctan2(d1_y,d1_x)
-                
-                frame_angles[frame_angles > np.pi] -= 2*np.pi
-                frame_angles[frame_angles < -np.pi] += 2*np.pi
-                
-                frame_angles *= 180/np.pi
-                
-                all_frame_angles = np.full_like(cc,np.NaN)
-                all_frame_angles[valid_vertices_I] = frame_angles
-                
-                temp_angle_list.append(all_frame_angles)
-                
-        return WormParsing.normalizeAllFrames(temp_angle_list,skeletons)
-    
+        Returns
+        -------
+        numpy.array
+            [n_frames x max_n_points], the angle at each skeleton point
+        """
+        angles = np.full(x.shape,np.NaN)
+        
+        for iFrame in utils.find(n):
+            sx = x[iFrame,:n[iFrame]]
+            sy = y[iFrame,:n[iFrame]]
+            cc = cc_all[iFrame,:n[iFrame]]
+
+            #This is from the old code
+            edge_length = cc[-1]/12               
+            
+            #We want all vertices to be defined, and if we look starting
+            #at the left_I for a vertex, rather than vertex for left and right
+            #then we could miss all middle points on worms being vertices
+            
+            left_lengths = cc - edge_length
+            right_lengths = cc + edge_length
+
+            valid_vertices_I = utils.find((left_lengths > cc[0]) & (right_lengths < cc[-1]))
+            
+            left_lengths = left_lengths[valid_vertices_I]
+            right_lengths = right_lengths[valid_vertices_I]                
+            
+            left_x = np.interp(left_lengths,cc,sx)
+            left_y = np.interp(left_lengths,cc,sy)
+        
+            right_x = np.interp(right_lengths,cc,sx)
+            right_y = np.interp(right_lengths,cc,sy)
+
+            d2_y = sy[valid_vertices_I] - right_y
+            d2_x = sx[valid_vertices_I] - right_x
+            d1_y = left_y - sy[valid_vertices_I]
+            d1_x = left_x - sx[valid_vertices_I] 
+
+            frame_angles = np.arctan2(d2_y,d2_x) - np.arctan2(d1_y,d1_x)
+            
+            frame_angles[frame_angles > np.pi] -= 2*np.pi
+            frame_angles[frame_angles < -np.pi] += 2*np.pi
+            
+            frame_angles *= 180/np.pi
+            
+            angles[iFrame,valid_vertices_I] = frame_angles
+            
+        return angles
+
+    @staticmethod
+    def h__calculateAnglesBatch(x,y,n,cc):
+        """
+        Batch version of h__calculateAnglesByFrame for frames that all have 
+        the same # of points (or are missing). The results are identical.
+        """
+        n_frames,n_points = x.shape
+        angles = np.full(x.shape,np.NaN)
+        
+        #The search below compares each point with every other point 
+        #in its frame
+        block_size = max(1,RESAMPLE_BLOCK_SIZE//(n_points*n_points))
+        for start_I in range(0,n_frames,block_size):
+            frame_I = np.arange(start_I,min(start_I + block_size,n_frames))
+            frame_I = frame_I[n[frame_I] > 0]
+            if frame_I.size == 0:
+                continue
+            cur_cc = cc[frame_I]
+            
+            edge_length = cur_cc[:,-1:]/12
+            left_lengths = cur_cc - edge_length
+            right_lengths = cur_cc + edge_length
+            
+            is_valid = (left_lengths > cur_cc[:,:1]) & (right_lengths < cur_cc[:,-1:])
+            row_I,vertex_I = np.nonzero(is_valid)
+            
+            sx = x[frame_I[row_I],vertex_I]
+            sy = y[frame_I[row_I],vertex_I]
+            
+            xy_ends = []
+            for lengths in (left_lengths,right_lengths):
+                #np.interp(lengths,cc,sx) - valid lengths are strictly
+                #within the frame so there is always a point on either side.
+                #The right point is the first one past the length.
+                right_I = np.argmax(cur_cc[:,None,:] > lengths[:,:,None],axis=2)
+                right_I = right_I[is_valid]
+                lengths = lengths[is_valid]
+                I1 = (frame_I[row_I],right_I - 1)
+                I2 = (frame_I[row_I],right_I)
+                for data in (x,y):
+                    xy_ends.append(WormParsing.h__interpSegments(
+                        lengths,cc[I1],cc[I2],data[I1],data[I2]))
+            left_x,left_y,right_x,right_y = xy_ends
+                    
+            d2_y = sy - right_y
+            d2_x = sx - right_x
+            d1_y = left_y - sy
+            d1_x = left_x - sx 
+
+            frame_angles = np.arctan2(d2_y,d2_x) - np.arctan2(d1_y,d1_x)
+            
+            frame_angles[frame_angles > np.pi] -= 2*np.pi
+            frame_angles[frame_angles < -np.pi] += 2*np.pi
+            
+            frame_angles *= 180/np.pi
+            
+            angles[frame_I[row_I],vertex_I] = frame_angles
+            
+        return angles
+
     @staticmethod
     def normalizeParameter(orig_data,old_lengths):
         """
@@ -669,3 +1483,248 @@ class WormParsing(object):
         new_lengths = np.linspace(old_lengths[0],old_lengths[-1],config.N_POINTS_NORMALIZED)
                 
         return np.interp(new_lengths,old_lengths,orig_data)
+
+    """
+    ===========================================================================
+    Batched resampling
+    ===========================================================================
+    Frames are packed into NaN padded [n_frames x max_n_points] arrays. 
+    Missing frames have 0 points.
+    """
+
+    @staticmethod
+    def h__packPolylines(xy_data):
+        """
+        
+        Parameters
+        ----------
+        xy_data : [numpy.array], RaggedFrames or numpy.array
+            List of [2 x n_points] arrays (or None), the same as a 
+            RaggedFrames, or an array of size [n_points x 2 x n_frames]
+            
+        Returns
+        -------
+        (x,y,n) tuple
+        x : [n_frames x max_n_points]
+        y : [n_frames x max_n_points]
+        n : [n_frames]
+        """
+        if isinstance(xy_data,RaggedFrames):
+            n = xy_data.n_points
+            x,y = xy_data.to_padded(WormParsing.h__maxLength(n)).astype(float)
+            return x,y,n
+        elif isinstance(xy_data,np.ndarray):
+            n_points,_,n_frames = xy_data.shape
+            x = xy_data[:,0,:].T.copy()
+            y = xy_data[:,1,:].T.copy()
+            return x,y,np.full(n_frames,n_points,dtype=int)
+
+        n = np.array([0 if xy is None else xy.shape[1] for xy in xy_data],dtype=int)
+        is_valid = n > 0
+        x = np.full((n.size,WormParsing.h__maxLength(n)),np.NaN)
+        y = np.full(x.shape,np.NaN)
+        if np.any(is_valid):
+            x[is_valid],y[is_valid],_ = WormParsing.h__packFrames(
+                [xy for xy in xy_data if xy is not None])
+        
+        return x,y,n
+
+    @staticmethod
+    def h__packValues(values,n):
+        """
+        Packs per-point values to match the output of h__packPolylines.
+        
+        Parameters
+        ----------
+        values : [numpy.array], RaggedFrames or numpy.array
+            List of [n_points] arrays, the same as a RaggedFrames, or an 
+            array of size [n_points x n_frames]
+        n : [n_frames]
+        """
+        if isinstance(values,RaggedFrames):
+            return values.to_padded(WormParsing.h__maxLength(n)).astype(float)
+        elif isinstance(values,np.ndarray):
+            return np.ascontiguousarray(values.T)
+            
+        packed = np.full((n.size,WormParsing.h__maxLength(n)),np.NaN)
+        for iFrame in utils.find(n):
+            packed[iFrame,:n[iFrame]] = values[iFrame]
+            
+        return packed
+
+    @staticmethod
+    def h__maxLength(n):
+        """
+        The # of columns needed to pack frames with n points, at least 1.
+        """
+        if n.size == 0:
+            return 1
+        return max(np.max(n),1)
+
+    @staticmethod
+    def h__chainCodeLengthsBatch(x,y):
+        """
+        Batch version of computeChainCodeLengths. Values past the end of 
+        each frame are NaN.
+        """
+        dx = np.diff(x,axis=1)
+        dy = np.diff(y,axis=1)
+        
+        distances = np.hstack((np.zeros((x.shape[0],1)),np.sqrt(dx**2 + dy**2)))
+        return np.cumsum(distances,axis=1)
+
+    @staticmethod
+    def h__getChainCodeLengths(xy_data,x,y,n,cache):
+        """
+        Chain code lengths of packed points, from the cache if one is given.
+        """
+        if cache is None:
+            return WormParsing.h__chainCodeLengthsBatch(x,y)
+        return cache.get(xy_data,x,y,n)
+
+    @staticmethod
+    def h__getLeftIndices(cc,n,new_lengths,step):
+        """
+        For each new length, finds the index of the last old length that is
+        less than or equal to it, as the search in np.interp does.
+        
+        Parameters
+        ----------
+        cc : [n_frames x max_n_points]
+            Old lengths, non-decreasing in each frame
+        n : [n_frames]
+        new_lengths : [n_new x n_frames]
+            Evenly spaced new lengths, starting at 0
+        step : [n_frames]
+            Spacing of the new lengths
+            
+        Returns
+        -------
+        [n_new x n_frames], -1 if there is no such old length
+        """
+        n_new,n_frames = new_lengths.shape
+        frame_I,point_I = np.nonzero(np.arange(cc.shape[1]) < n[:,None])
+        old_lengths = cc[frame_I,point_I]
+        
+        #For each old length, the # of new lengths that are less than it.
+        #This is estimated using the even spacing and then corrected using
+        #the actual values.
+        with np.errstate(divide='ignore',invalid='ignore'):
+            n_less = np.ceil(old_lengths/step[frame_I])
+        n_less[~np.isfinite(n_less)] = 0
+        n_less = np.clip(n_less,0,n_new).astype(int)
+        while True:
+            is_low = n_less < n_new
+            is_low[is_low] = new_lengths[n_less[is_low],frame_I[is_low]] < old_lengths[is_low]
+            is_high = n_less > 0
+            is_high[is_high] = new_lengths[n_less[is_high]-1,frame_I[is_high]] >= old_lengths[is_high]
+            if not (np.any(is_low) or np.any(is_high)):
+                break
+            n_less[is_low] += 1
+            n_less[is_high] -= 1
+            
+        #An old length is <= the new length i if fewer than i+1 new lengths 
+        #are less than it
+        counts = np.bincount(frame_I*(n_new+1) + n_less,minlength=n_frames*(n_new+1))
+        counts = np.cumsum(counts.reshape((n_frames,n_new+1)),axis=1)[:,:n_new]
+        
+        return counts.T - 1
+
+    @staticmethod
+    def h__interpSegments(x,left_x,right_x,left_y,right_y):
+        """
+        The interpolation step of np.interp, once the points on either side
+        of each x value have been found (left_x <= x < right_x).
+        """
+        #Repeated points give 0/0, which np.interp handles silently
+        with np.errstate(divide='ignore',invalid='ignore'):
+            slope = (right_y - left_y)/(right_x - left_x)
+            values = slope*(x - left_x) + left_y
+        
+            #If we get nan in one direction, try the other
+            is_nan = np.isnan(values)
+            values[is_nan] = slope[is_nan]*(x[is_nan] - right_x[is_nan]) + right_y[is_nan]
+        is_nan &= np.isnan(values) & (left_y == right_y)
+        values[is_nan] = left_y[is_nan]
+        
+        is_exact = left_x == x
+        values[is_exact] = left_y[is_exact]
+        
+        return values
+
+    @staticmethod
+    def h__normalizeFramesBatch(x,y,n,all_data,cc_all=None,
+                                n_norm=config.N_POINTS_NORMALIZED):
+        """
+        Batch version of computeChainCodeLengths followed by 
+        normalizeParameter for each frame.
+        
+        This follows np.interp step by step so that the results are the same
+        as when processing frame by frame.
+        
+        Parameters
+        ----------
+        x,y : [n_frames x max_n_points]
+            The points that define the chain code lengths
+        n : [n_frames]
+            # of points in each frame, 0 for missing frames
+        all_data : [numpy.array]
+            The values to resample, each [n_frames x max_n_points]
+        cc_all : numpy.array (optional)
+            The chain code lengths of x,y if already known
+        n_norm : int (optional)
+            The # of points to resample to
+            
+        Returns
+        -------
+        numpy.array
+            [n_norm x len(all_data) x n_frames]
+        """
+        n_frames = n.size
+        norm_data = np.full((n_norm,len(all_data),n_frames),np.NaN)
+        
+        #Working on blocks of frames limits the size of temporary arrays
+        block_size = max(1,RESAMPLE_BLOCK_SIZE//(n_norm*x.shape[1]))
+        for start_I in range(0,n_frames,block_size):
+            frame_I = np.arange(start_I,min(start_I + block_size,n_frames))
+            frame_I = frame_I[n[frame_I] > 0]
+            if frame_I.size == 0:
+                continue
+            cur_n = n[frame_I]
+            if cc_all is None:
+                cc = WormParsing.h__chainCodeLengthsBatch(x[frame_I],y[frame_I])
+            else:
+                cc = cc_all[frame_I]
+            
+            #np.linspace(cc[0],cc[-1],n_norm), where cc[0] is always 0
+            #--------------------------------------------------------
+            last_cc = cc[np.arange(frame_I.size),cur_n-1]
+            step = last_cc/(n_norm-1)
+            temp_I = np.arange(n_norm,dtype=float)[:,None]
+            new_lengths = np.where(step == 0, temp_I/(n_norm-1)*last_cc, temp_I*step)
+            new_lengths += 0.0
+            new_lengths[-1,:] = last_cc
+            
+            #np.interp(new_lengths,cc,data)
+            #--------------------------------------------------------
+            left_I = WormParsing.h__getLeftIndices(cc,cur_n,new_lengths,step)
+            is_last = left_I >= cur_n - 1
+            left_I = np.minimum(left_I,cur_n - 2)
+            left_I[left_I < 0] = 0
+            right_I = np.minimum(left_I + 1,x.shape[1] - 1)
+            
+            col_I = np.broadcast_to(np.arange(frame_I.size),left_I.shape)
+            left_cc = cc[col_I,left_I]
+            right_cc = cc[col_I,right_I]
+            
+            for data_I,data in enumerate(all_data):
+                data = data[frame_I]
+                values = WormParsing.h__interpSegments(new_lengths,
+                        left_cc,right_cc,data[col_I,left_I],data[col_I,right_I])
+                values[is_last] = data[col_I[is_last],cur_n[col_I[is_last]]-1]
+                values[np.isnan(new_lengths)] = np.NaN
+
+                norm_data[:,data_I,frame_I] = values
+        
+        return norm_data
+
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+This module defines the RaggedFrames class
+
+"""
+
+import numpy as np
+
+
+class RaggedFrames(object):
+    """
+    Per-frame data with a varying # of points in each frame, such as the
+    contour of a worm in each frame of a video.
+
+    Rather than a list with an array (or None) for each frame, all of the
+    points are stored in one array. The points of frame i are:
+        data[..., offsets[i]:offsets[i+1]]
+
+    Indexing with an integer gives a view of a frame, or None for a missing
+    frame, so this can be used wherever a list of frames is expected.
+    Slicing gives a RaggedFrames for that range of frames, which also
+    shares the data.
+
+    Attributes
+    ----------
+    data : numpy.array
+        [... x total # of points], e.g. [2 x total # of points] for x,y data
+    offsets : numpy.array
+        [n_frames + 1], int
+    is_valid : numpy.array
+        [n_frames], bool. Missing frames have no points.
+
+    Usage
+    -----
+    contours = RaggedFrames.from_list(list_of_contours)
+    contours[10] #A [2 x n_points] view of frame 10, or None
+    contours[100:200] #Frames 100 - 199, as a RaggedFrames
+
+    """
+
+    def __init__(self, data, offsets, is_valid=None):
+        self.data = np.asarray(data)
+        self.offsets = np.asarray(offsets, dtype=int)
+        if is_valid is None:
+            is_valid = np.ones(len(self.offsets) - 1, dtype=bool)
+        self.is_valid = np.asarray(is_valid, dtype=bool)
+
+    @classmethod
+    def from_list(cls, frames):
+        """
+        Parameters
+        ----------
+        frames : [numpy.array]
+            Each element is an array of size [... x n_points] or None. All
+            elements should have the same # of dimensions.
+        """
+        valid_frames = [frame for frame in frames if frame is not None]
+        is_valid = np.array([frame is not None for frame in frames],
+                            dtype=bool)
+        n_points = np.zeros(len(frames), dtype=int)
+        n_points[is_valid] = [frame.shape[-1] for frame in valid_frames]
+
+        offsets = np.zeros(len(frames) + 1, dtype=int)
+        np.cumsum(n_points, out=offsets[1:])
+
+        if len(valid_frames) == 0:
+            data = np.zeros(0)
+        else:
+            data = np.concatenate(valid_frames, axis=-1)
+
+        return cls(data, offsets, is_valid)
+
+    def to_list(self):
+        """
+        Returns a list with a copy of each frame (or None).
+        """
+        return [None if frame is None else frame.copy() for frame in self]
+
+    def to_padded(self, n_columns=None, fill_value=np.NaN):
+        """
+        Copies the frames into an array with one row per frame.
+
+        Parameters
+        ----------
+        n_columns : int (optional)
+            Defaults to the largest # of points in a frame
+        fill_value :
+            Value used past the end of each frame and for missing frames
+
+        Returns
+        -------
+        numpy.array
+            [... x n_frames x n_columns]
+        """
+        n_points = self.n_points
+        if n_columns is None:
+            n_columns = n_points.max() if n_points.size else 0
+
+        n_frames = len(self)
+        padded = np.full(self.data.shape[:-1] + (n_frames, n_columns),
+                         fill_value, dtype=self.data.dtype)
+
+        frame_I = np.repeat(np.arange(n_frames), n_points)
+        point_I = np.arange(frame_I.size) - np.repeat(self.offsets[:-1] -
+                                                      self.offsets[0], n_points)
+        padded[..., frame_I, point_I] = \
+            self.data[..., self.offsets[0]:self.offsets[-1]]
+
+        return padded
+
+    @property
+    def n_points(self):
+        """
+        The # of points in each frame, 0 for missing frames
+        """
+        return np.diff(self.offsets)
+
+    def get_frame_range(self, start, stop):
+        """
+        Returns frames start through stop-1, sharing this object's data.
+        0 <= start <= stop <= len(self)
+        """
+        offsets = self.offsets[start:stop + 1]
+        data = self.data[..., offsets[0]:offsets[-1]]
+
+        return RaggedFrames(data, offsets - offsets[0],
+                            self.is_valid[start:stop])
+
+    def __len__(self):
+        return self.is_valid.size
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self.get_frame_range(start, max(start, stop))
+            return RaggedFrames.from_list([self[I] for I in
+                                           range(start, stop, step)])
+
+        if key < 0:
+            key += len(self)
+        if not self.is_valid[key]:
+            return None
+        return self.data[..., self.offsets[key]:self.offsets[key + 1]]
+
+    def __iter__(self):
+        for I in range(len(self)):
+            yield self[I]
+
+    def to_arrays(self):
+        """
+        Returns the arrays that make up this object, as a dictionary.
+
+        See Also
+        --------
+        from_arrays
+        """
+        return {'data': self.data[..., self.offsets[0]:self.offsets[-1]],
+                'offsets': self.offsets - self.offsets[0],
+                'is_valid': self.is_valid}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        The inverse of to_arrays
+        """
+        return cls(arrays['data'], arrays['offsets'], arrays['is_valid'])
+
+    def save(self, file_path):
+        """
+        Saves the arrays of this object to a .npz file.
+        """
+        np.savez(file_path, **self.to_arrays())
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Loads a file created by save()
+        """
+        with np.load(file_path) as arrays:
+            return cls.from_arrays(arrays)
+
+    def __eq__(self, other):
+        if not isinstance(other, RaggedFrames):
+            return False
+        this = self.to_arrays()
+        other = other.to_arrays()
+        return np.array_equal(this['offsets'], other['offsets']) and \
+               np.array_equal(this['is_valid'], other['is_valid']) and \
+               np.array_equal(this['data'], other['data'])
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return 'RaggedFrames: %d frames, %d points, data shape %s' % \
+               (len(self), self.offsets[-1] - self.offsets[0],
+                str(self.data.shape))
@@ -123,7 +123,10 @@ class HistogramManager(object):
         
         # :/ HACK: - @JimHokanson
         # Just get the size from the size of one of the pieces of data
-        num_samples = len(worm_features.morphology.length)
+        if worm_features.morphology.length is not None:
+            num_samples = len(worm_features.morphology.length)
+        else:
+            num_samples = worm_features.nw.num_frames
         
         e_hists = self.__event_histograms(worm_features, 
                                           specs.EventSpecs.getSpecs(), 
@@ -204,14 +207,6 @@ class HistogramManager(object):
         """
         motion_modes = worm_features.locomotion.motion_mode
         
-        num_frames = len(motion_modes)
-        
-        indices_use_mask = {}
-        indices_use_mask["all"]      = np.ones(num_frames, dtype=bool)
-        indices_use_mask["forward"]  = motion_modes == 1
-        indices_use_mask["backward"] = motion_modes == -1
-        indices_use_mask["paused"]   = motion_modes == 0
-
         # NOTE: motion types refers to the motion of the worm's midbody
         motion_types = ['all', 'forward', 'paused', 'backward']
         data_types = ['all', 'absolute', 'positive', 'negative']
@@ -222,18 +217,34 @@ class HistogramManager(object):
 
             cur_data = cur_spec.getData(worm_features)
 
+            # Features that weren't computed get None for each of their
+            # histograms, as do the motion types if the motion mode wasn't
+            # computed
+            n_hists_per_type = 4 if cur_spec.is_signed else 1
+            if cur_data is None:
+                movement_histograms.extend([None] * 
+                                           (n_hists_per_type * 
+                                            len(motion_types)))
+                continue
+
+            num_frames = cur_data.size
+            
+            indices_use_mask = {}
+            indices_use_mask["all"] = np.ones(num_frames, dtype=bool)
+            if motion_modes is not None:
+                indices_use_mask["forward"]  = motion_modes == 1
+                indices_use_mask["backward"] = motion_modes == -1
+                indices_use_mask["paused"]   = motion_modes == 0
+
             good_data_mask = ~utils.get_non_numeric_mask(cur_data).flatten()
             
             # Now let's create 16 histograms, for each element of
             # (motion_types x data_types)
             
             for cur_motion_type in motion_types:
-                if (good_data_mask.size != indices_use_mask[cur_motion_type].size):
-                    import pdb
-                    pdb.set_trace()
-                
-                #assert(good_data_mask.size == \
-                 #      indices_use_mask[cur_motion_type].size)
+                if cur_motion_type not in indices_use_mask:
+                    movement_histograms.extend([None] * n_hists_per_type)
+                    continue
 
                 cur_mask = indices_use_mask[cur_motion_type] & good_data_mask
                 assert(isinstance(cur_data, np.ndarray))
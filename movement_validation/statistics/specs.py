@@ -89,7 +89,8 @@ class Specs(object):
 
         Returns
         -------
-        A numpy array
+        A numpy array, or None if the feature wasn't computed (see
+        FeatureProcessingOptions.features_to_compute)
 
         """
         data = worm_features
@@ -98,9 +99,9 @@ class Specs(object):
         # e.g. if self.feature_field = 'posture.coils', we'll need to call
         #      getattr twice, first on 'posture', and second on 'coils'.
         for cur_feature_field in self.feature_field.split('.'):
+            if data is None:
+                return None
             if not hasattr(data, cur_feature_field):
-                import pdb
-                pdb.set_trace()
                 raise Exception("The WormFeatures instance passed does " + 
                                 "not have the feature: " + cur_feature_field + 
                                 ". Its full name is " + self.long_field)
@@ -278,7 +279,7 @@ class MovementSpecs(Specs):
         #       filtered according to the value of the data, not 
         #       according to the velocity of the midbody
         
-        if self.index != None and data != None:
+        if self.index is not None and data is not None:
             # This is for eigenprojections, i.e. for instances when 
             # self.feature_field = 'posture.eigen_projection'
             # In these cases the data is stored as a num_frames x 6 numpy 
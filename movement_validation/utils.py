@@ -485,7 +485,10 @@ def interpolate_with_threshold(array,
         # e.g. if threshold was 5, then x_runs would be [(3,1), (5,3)] so
         #      x would be [3, 5, 6, 7]
         # this give us the x-coordinates of the values to be interpolated:
-        x = np.concatenate([(i[0] + list(range(i[1]))) for i in x_runs])
+        if len(x_runs) == 0:
+            x = np.array([], dtype=int)
+        else:
+            x = np.concatenate([(i[0] + list(range(i[1]))) for i in x_runs])
 
     # The x-coordinates of the data points, must be increasing.
     xp = np.flatnonzero(~np.isnan(array))
@@ -508,7 +511,9 @@ def interpolate_with_threshold(array,
     # the "left" and "right" here mean that we want to leave NaNs in place
     # if the array begins and/or ends with a sequence of NaNs (i.e. don't
     # try to extrapolate)
-    new_array[x] = np.interp(x, xp, yp, left=np.NaN, right=np.NaN)
+    # (np.interp needs at least one data point)
+    if len(x) > 0 and len(xp) > 0:
+        new_array[x] = np.interp(x, xp, yp, left=np.NaN, right=np.NaN)
 
     return new_array
 
@@ -610,6 +615,22 @@ def _extract_time_from_disk(parent_ref, name, is_matrix = False):
     return wtf
 
 
+def _write_time_to_disk(parent_ref, name, value, is_matrix=False):
+    """
+    The inverse of _extract_time_from_disk. Vectors (and scalars) are 
+    saved as [n x 1], as in the Matlab files. Datasets with more than one 
+    value are chunked and compressed.
+    """
+    value = np.asarray(value)
+    if not is_matrix:
+        value = value.reshape(-1, 1)
+
+    if value.size > 1:
+        parent_ref.create_dataset(name, data=value, chunks=True, 
+                                  compression='gzip', shuffle=True)
+    else:
+        parent_ref.create_dataset(name, data=value)
+
 
 def filter_non_numeric(data):
     """
@@ -4,14 +4,29 @@ Some unit tests of the movement_validation package
 
 """
 
-import sys, subprocess, os
+import sys, subprocess, os, tempfile, warnings, weakref, hashlib
+
+import numpy as np
+import h5py
 
 
 # We must add .. to the path so that we can perform the
 # import of movement_validation while running this as
 # a top-level script (i.e. with __name__ = '__main__')
 sys.path.append('..')
-from movement_validation import NormalizedWorm
+from movement_validation import NormalizedWorm, RaggedFrames, BasicWorm
+from movement_validation import VideoInfo, WormBatch, FeatureCache
+from movement_validation import batch_features, config
+from movement_validation.pre_features import WormParsing, ChainCodeCache
+from movement_validation.features.feature_processing_options import \
+    FeatureProcessingOptions
+from movement_validation.features import path_features, events, \
+    posture_features, feature_cache
+from movement_validation.features.worm_features import WormFeatures, \
+    get_precision_report
+from movement_validation.features.chunked_features import \
+    compute_features_in_chunks
+from movement_validation.features.feature_timer import FeatureTimer
 
 
 def test_simply():
@@ -26,6 +41,707 @@ def test_empty_nw():
     nw.validate()
     #centred_skeleton = nw.centre()
 
+def get_example_contours(n_frames=10):
+    """
+    Creates a wavy worm shape for testing, with a different # of points on
+    each side of the contour and some missing frames.
+    """
+    vulva_contours = []
+    non_vulva_contours = []
+    for iFrame in range(n_frames):
+        if iFrame % 4 == 3:
+            vulva_contours.append(None)
+            non_vulva_contours.append(None)
+            continue
+        contours = []
+        for side, n_points in ((1, 120 + 3*iFrame), (-1, 135 - 2*iFrame)):
+            t = np.linspace(0, 1, n_points)
+            x = 1000*t
+            y = 80*np.sin(2*np.pi*t + 0.3*iFrame) + side*40*np.sin(np.pi*t)
+            contours.append(np.round(np.vstack((x, y))))
+        vulva_contours.append(contours[0])
+        non_vulva_contours.append(contours[1])
+    return vulva_contours, non_vulva_contours
+
+
+def test_batched_widths():
+    # Processing frames together should give exactly what we get 
+    # when processing one frame at a time
+    vc, nvc = get_example_contours()
+    widths1, skeletons1 = WormParsing.computeWidths(vc, nvc, frames_per_batch=4)
+
+    vc, nvc = get_example_contours()
+    widths2, skeletons2 = WormParsing.computeWidths(vc, nvc, frames_per_batch=None)
+
+    # The per-frame code using the full distance matrices
+    vc, nvc = get_example_contours()
+    widths3, skeletons3 = WormParsing.h__computeWidthsByFrame(vc, nvc, banded=False)
+
+    for w1, w2, w3, s1, s2, s3 in zip(widths1, widths2, widths3, 
+                                      skeletons1, skeletons2, skeletons3):
+        if w1 is None:
+            assert w2 is None and w3 is None
+        else:
+            assert np.array_equal(w1, w2) and np.array_equal(w1, w3)
+            assert np.array_equal(s1, s2) and np.array_equal(s1, s3)
+
+
+def test_normalize_frames():
+    # Resampling all frames together should match np.interp on each frame
+    vc, nvc = get_example_contours()
+    normalized = WormParsing.normalizeAllFramesXY(vc)
+    assert normalized.shape == (49, 2, len(vc))
+    for iFrame, contour in enumerate(vc):
+        if contour is None:
+            assert np.all(np.isnan(normalized[:, :, iFrame]))
+            continue
+        cc = WormParsing.computeChainCodeLengths(contour[0, :], contour[1, :])
+        new_lengths = np.linspace(0, cc[-1], 49)
+        assert np.array_equal(normalized[:, 0, iFrame], 
+                              np.interp(new_lengths, cc, contour[0, :]))
+        assert np.array_equal(normalized[:, 1, iFrame], 
+                              np.interp(new_lengths, cc, contour[1, :]))
+
+
+def test_batched_angles():
+    # Skeletons with the same # of points are processed together, which 
+    # should match processing them one frame at a time
+    vc, nvc = get_example_contours()
+    x, y, n = WormParsing.h__packPolylines(WormParsing.normalizeAllFramesXY(vc))
+    cc = WormParsing.h__chainCodeLengthsBatch(x, y)
+    np.testing.assert_array_equal(
+        WormParsing.h__calculateAnglesBatch(x, y, n, cc),
+        WormParsing.h__calculateAnglesByFrame(x, y, n, cc))
+
+def test_sgolay():
+    # The batched smoothing matches scipy's savgol_filter to within rounding
+    # (the sums are done in a different order), and each row gives exactly
+    # what smoothing it on its own gives
+    from scipy.signal import savgol_filter
+    data = 100*np.random.RandomState(0).randn(6, 120)
+    for window_length in (5, 11, 21):
+        smoothed = WormParsing.h__sgolay(data, window_length, 3)
+        np.testing.assert_allclose(smoothed, 
+                                   savgol_filter(data, window_length, 3),
+                                   rtol=0, atol=1e-9)
+        np.testing.assert_array_equal(smoothed[2:4], 
+            WormParsing.h__sgolay(data[2:4], window_length, 3))
+
+def test_parallel_pre_features():
+    # Processing chunks of frames in other processes should give the same
+    # results as processing all of the frames at once
+    worms = []
+    for n_workers in (None, 2):
+        nw = NormalizedWorm()
+        nw.vulva_contour, nw.non_vulva_contour = get_example_contours()
+        nw.skeleton = None
+        nw.calculate_pre_features(n_workers=n_workers, frames_per_chunk=3)
+        worms.append(nw)
+        
+    for name in ('angles', 'skeleton', 'vulva_contour', 'non_vulva_contour', 
+                 'length'):
+        np.testing.assert_array_equal(getattr(worms[0], name), 
+                                      getattr(worms[1], name))
+
+def test_float32_pre_features():
+    options = FeatureProcessingOptions(25.8)
+    options.dtype = np.float32
+    worms = []
+    for processing_options in (None, options):
+        nw = NormalizedWorm()
+        nw.vulva_contour, nw.non_vulva_contour = get_example_contours()
+        nw.skeleton = None
+        nw.calculate_pre_features(processing_options=processing_options)
+        worms.append(nw)
+        
+    for name in ('angles', 'skeleton', 'vulva_contour', 'length'):
+        assert getattr(worms[0], name).dtype == np.float64
+        assert getattr(worms[1], name).dtype == np.float32
+        np.testing.assert_allclose(getattr(worms[1], name), 
+                                   getattr(worms[0], name), rtol=1e-6)
+    
+    nw = worms[1].astype(np.float64)
+    assert nw.skeleton.dtype == np.float64
+    assert worms[1].skeleton.dtype == np.float32
+    # Nothing to convert
+    assert worms[1].astype(np.float32) is worms[1]
+
+    # The worm isn't copied, and the features are stored as float32
+    options.features_to_compute = ['path.range', 'path.coordinates']
+    wf = WormFeatures(worms[1], VideoInfo('Test', 25.8), options)
+    assert wf.nw is worms[1]
+    assert wf.path.range.value.dtype == np.float32
+    assert wf.path.coordinates.x.dtype == np.float32
+
+def test_precision_report():
+    nw = NormalizedWorm()
+    nw.vulva_contour, nw.non_vulva_contour = get_example_contours()
+    nw.skeleton = None
+    nw.calculate_pre_features()
+    options = FeatureProcessingOptions(25.8)
+    options.features_to_compute = ['path.range', 'path.coordinates']
+
+    # Identical values pass
+    report = get_precision_report(nw, VideoInfo('Test', 25.8), np.float64, 
+                                  options)
+    assert 'path.range.value' in report
+    assert not any(name.startswith('posture') for name in report)
+    assert all(result['passes'] for result in report.values())
+    assert report['path.coordinates.x']['max_abs_error'] == 0
+
+    report = get_precision_report(nw, VideoInfo('Test', 25.8), np.float32, 
+                                  options)
+    result = report['path.coordinates.x']
+    assert result['passes'] and 0 < result['max_rel_error'] < 1e-5
+
+def test_features_to_compute():
+    options = FeatureProcessingOptions(25.8)
+    assert options.should_compute_feature('path.curvature', None)
+
+    options.features_to_compute = ['posture.coils', 'path']
+    to_compute = options.get_features_to_compute()
+    assert 'locomotion.velocity' in to_compute
+    assert 'path.range' in to_compute
+    assert 'locomotion.turns' not in to_compute
+    assert not options.should_compute_feature('morphology.length', None)
+
+    options.features_to_compute = None
+    options.features_to_ignore = ['posture.eccentricity']
+    to_compute = options.get_features_to_compute()
+    assert 'posture.amplitude_and_wavelength' not in to_compute
+    assert 'posture.bends' in to_compute
+    assert options.should_compute_feature('morphology.length', None)
+
+    # The features resolved by should_compute_feature are updated when the
+    # lists are set
+    assert options.should_compute_feature('posture.coils', None)
+    options.disable_feature_sections(['locomotion'])
+    to_compute = options.get_features_to_compute()
+    assert 'posture.coils' not in to_compute
+    assert 'morphology.length' in to_compute
+    assert not options.should_compute_feature('posture.coils', None)
+
+def test_feature_timer():
+    timer = FeatureTimer(n_frames=100, track_memory=True)
+    with timer.span('posture'):
+        for iCall in range(2):
+            timer.tic()
+            data = np.ones(10000)
+            timer.toc('posture.kinks')
+    summary = timer.get_summary()
+    assert list(summary) == ['posture/posture.kinks', 'posture']
+    assert summary['posture/posture.kinks']['count'] == 2
+    assert summary['posture']['wall_time'] >= \
+        summary['posture/posture.kinks']['wall_time']
+    assert summary['posture']['frames_per_second'] > 0
+    if summary['posture']['peak_memory'] is not None:
+        assert summary['posture']['peak_memory'] >= data.nbytes
+
+    csv_path = os.path.join(tempfile.mkdtemp(), 'timing.csv')
+    timer.save_to_CSV(csv_path)
+    with open(csv_path) as infile:
+        assert len(infile.readlines()) == 3
+
+def test_ragged_frames():
+    vc, nvc = get_example_contours()
+    ragged = RaggedFrames.from_list(vc)
+    assert len(ragged) == len(vc)
+    for frame, ragged_frame in zip(vc, ragged):
+        if frame is None:
+            assert ragged_frame is None
+        else:
+            assert np.array_equal(frame, ragged_frame)
+    
+    # Frame ranges share the data
+    subset = ragged[2:6]
+    assert len(subset) == 4 and subset[1] is None
+    assert np.shares_memory(subset[0], ragged.data)
+    assert subset == RaggedFrames.from_list(vc[2:6])
+    
+    np.testing.assert_array_equal(WormParsing.normalizeAllFramesXY(ragged),
+                                  WormParsing.normalizeAllFramesXY(vc))
+
+def test_downsample_contours():
+    vc, nvc = get_example_contours()
+    downsampled = WormParsing.downsampleContours(vc, 125)
+    for frame, new_frame in zip(vc, downsampled):
+        if frame is None or frame.shape[1] <= 125:
+            assert new_frame is frame
+            continue
+        assert new_frame.shape == (2, 125)
+        assert np.array_equal(new_frame[:, [0, -1]], frame[:, [0, -1]])
+        # Points are evenly spaced along the original contour
+        cc = WormParsing.computeChainCodeLengths(frame[0, :], frame[1, :])
+        new_lengths = np.linspace(0, cc[-1], 125)
+        np.testing.assert_allclose(new_frame[0, :], 
+                                   np.interp(new_lengths, cc, frame[0, :]))
+
+def test_downsample_deviation():
+    # The bound documented in WormParsing.downsampleContours for contours
+    # like these: the skeleton and widths change by less than d/2
+    def normalize(skeleton, widths):
+        cc = WormParsing.computeChainCodeLengths(skeleton[0], skeleton[1])
+        new_lengths = np.linspace(0, cc[-1], 49)
+        return (np.interp(new_lengths, cc, skeleton[0]), 
+                np.interp(new_lengths, cc, skeleton[1]),
+                np.interp(new_lengths, cc, widths))
+
+    for max_n_points in (50, 100, 125):
+        vc, nvc = get_example_contours()
+        widths1, skeletons1 = WormParsing.computeWidths(vc, nvc)
+        vc, nvc = get_example_contours()
+        # The spacing of the new points, from the longer side
+        d = [None if side1 is None else 
+             max(WormParsing.computeChainCodeLengths(s[0], s[1])[-1] 
+                 for s in (side1, side2)) / (max_n_points - 1) 
+             for side1, side2 in zip(vc, nvc)]
+        widths2, skeletons2 = WormParsing.computeWidths(
+            WormParsing.downsampleContours(vc, max_n_points),
+            WormParsing.downsampleContours(nvc, max_n_points))
+        for iFrame in range(len(vc)):
+            if d[iFrame] is None:
+                continue
+            x1, y1, w1 = normalize(skeletons1[iFrame], widths1[iFrame])
+            x2, y2, w2 = normalize(skeletons2[iFrame], widths2[iFrame])
+            assert np.max(np.hypot(x1 - x2, y1 - y2)) < d[iFrame] / 2
+            assert np.max(np.abs(w1 - w2)) < d[iFrame] / 2
+
+    try:
+        WormParsing.downsampleContours(vc, 1)
+        assert False
+    except ValueError:
+        pass
+
+def test_load_schafer_file():
+    # A file laid out like the Matlab files, with a reference per frame
+    vc, nvc = get_example_contours()
+    file_path = os.path.join(tempfile.mkdtemp(), 'worm.mat')
+    with h5py.File(file_path, 'w') as h:
+        for name, frames in (('all_vulva_contours', vc), 
+                             ('all_non_vulva_contours', nvc)):
+            refs = np.zeros((len(frames), 1), dtype=h5py.special_dtype(ref=h5py.Reference))
+            for iFrame, frame in enumerate(frames):
+                if frame is None:
+                    frame = np.zeros(2, dtype=np.uint64)
+                refs[iFrame, 0] = h.create_dataset('%s_%d' % (name, iFrame), 
+                                                   data=frame).ref
+            h.create_dataset(name, data=refs)
+        h.create_dataset('is_valid', 
+                         data=np.array([[frame is not None for frame in vc]]))
+        h.create_dataset('is_stage_movement', data=np.zeros((1, len(vc))))
+        
+    bw = BasicWorm.from_schafer_file_factory(file_path, frame_range=(1, 9))
+    assert bw.vulva_contour == RaggedFrames.from_list(vc[1:9])
+    assert bw.non_vulva_contour == RaggedFrames.from_list(nvc[1:9])
+
+def test_lazy_npy_directory():
+    nw = NormalizedWorm()
+    nw.vulva_contour, nw.non_vulva_contour = get_example_contours()
+    nw.skeleton = None
+    nw.calculate_pre_features()
+    # Cached values (private attributes) aren't saved
+    nw.orientation_free_skeleton
+    dir_path = tempfile.mkdtemp()
+    nw.save_to_npy_directory(dir_path)
+    
+    nw2 = NormalizedWorm.from_npy_directory_factory(dir_path)
+    assert not [name for name in nw2.__dict__ if name.startswith('_') and
+                name != '_lazy_array_paths']
+    assert not [name for name in os.listdir(dir_path) if 
+                name.startswith('_')]
+    # Arrays are only loaded when accessed
+    assert 'skeleton' not in nw2.__dict__
+    np.testing.assert_array_equal(nw2.skeleton, nw.skeleton)
+    assert 'skeleton' in nw2.__dict__ and 'angles' not in nw2.__dict__
+    np.testing.assert_array_equal(nw2.angles, nw.angles)
+    assert nw2.ventral_mode == nw.ventral_mode
+
+def test_orientation_free_skeleton():
+    nw = NormalizedWorm()
+    vc, nvc = get_example_contours()
+    nw.skeleton = WormParsing.normalizeAllFramesXY(vc)
+    skeleton = nw.orientation_free_skeleton
+    assert skeleton.shape == nw.skeleton.shape
+    # Centred, with the first and last points along the x axis
+    is_valid = ~np.isnan(skeleton[0, 0, :])
+    assert np.allclose(np.mean(skeleton[:, :, is_valid], 0), 0)
+    assert np.allclose(skeleton[-1, 1, is_valid], skeleton[0, 1, is_valid])
+    
+    assert nw.orientation_free_skeleton is skeleton
+    nw.skeleton = nw.skeleton * 2
+    assert nw.orientation_free_skeleton is not skeleton
+
+def test_partition_stats():
+    nw = NormalizedWorm()
+    nw.vulva_contour, nw.non_vulva_contour = get_example_contours()
+    nw.skeleton = None
+    nw.calculate_pre_features()
+    
+    head_x, head_y = nw.get_partition_stat('head')
+    np.testing.assert_array_equal(head_x, np.mean(nw.skeleton_x[0:8], 0))
+    np.testing.assert_array_equal(
+        nw.get_partition_stat('first_third', 'angles', 'nanmean'),
+        np.nanmean(nw.angles[0:16], 0))
+    
+    # Computed once and shared
+    stat = nw.get_partition_stat('tail', 'angles', 'nanstd')
+    assert nw.get_partition_stat('tail', 'angles', 'nanstd') is stat
+    assert not stat.flags.writeable
+    
+    # Replacing the data invalidates the result
+    nw.angles = nw.angles + 1
+    assert nw.get_partition_stat('tail', 'angles', 'nanstd') is not stat
+
+def test_frame_range_view():
+    nw = NormalizedWorm()
+    nw.vulva_contour, nw.non_vulva_contour = get_example_contours()
+    nw.skeleton = None
+    nw.calculate_pre_features()
+    nw.segmentation_status = np.array(['s', 'f'] * 5)
+    nw.frame_code = np.arange(10)
+    nw.contour_frames = RaggedFrames.from_list(get_example_contours()[0])
+    nw.plate_wireframe_video_key = 'Test'
+    
+    window = nw.get_frame_range(2, 6)
+    assert window.num_frames == 4
+    assert window.plate_wireframe_video_key == nw.plate_wireframe_video_key
+    np.testing.assert_array_equal(window.frame_code, [2, 3, 4, 5])
+    for name in ('skeleton', 'angles', 'length', 'segmentation_status'):
+        np.testing.assert_array_equal(getattr(window, name),
+                                      getattr(nw, name)[..., 2:6])
+        assert np.may_share_memory(getattr(window, name), getattr(nw, name))
+    assert window.contour_frames == nw.contour_frames[2:6]
+    assert np.may_share_memory(window.contour_frames.data, 
+                            nw.contour_frames.data)
+
+def test_worm_batch():
+    worms = []
+    for n_frames in (10, 7):
+        nw = NormalizedWorm()
+        nw.vulva_contour, nw.non_vulva_contour = \
+            get_example_contours(n_frames)
+        nw.skeleton = None
+        nw.calculate_pre_features()
+        worms.append(nw)
+    video_info = VideoInfo('Test', 25.8)
+    
+    batch = WormBatch(worms, video_info)
+    assert batch.skeleton.shape == (2, 49, 2, 10)
+    
+    bends = batch.get_bends()
+    directions = batch.get_directions()
+    path_range = batch.get_path_range()
+    for iWorm, nw in enumerate(worms):
+        # The same as computing the features of each worm on its own
+        n = nw.num_frames
+        one_worm = WormBatch([nw], video_info)
+        np.testing.assert_array_equal(directions.head[iWorm, :n], 
+                                      one_worm.get_directions().head[0])
+        np.testing.assert_array_equal(bends.midbody.std_dev[iWorm, :n], 
+                                      one_worm.get_bends().midbody.std_dev[0])
+        np.testing.assert_allclose(path_range.value[iWorm, :n], 
+            path_features.Range(nw.contour_x, nw.contour_y).value)
+        assert np.all(np.isnan(directions.head[iWorm, n:]))
+
+def test_lazy_features():
+    nw = NormalizedWorm()
+    nw.vulva_contour, nw.non_vulva_contour = get_example_contours()
+    nw.skeleton = None
+    nw.calculate_pre_features()
+
+    wf = WormFeatures(nw, VideoInfo('Test', 25.8), lazy=True)
+    assert 'path' not in wf.__dict__
+    path_range = wf.path.range
+    np.testing.assert_array_equal(path_range.value,
+        path_features.Range(nw.contour_x, nw.contour_y).value)
+    # Only the features that were accessed are computed
+    assert 'posture' not in wf.__dict__
+    assert 'curvature' not in wf.path.__dict__
+    assert wf.path.range is path_range
+
+def test_write_features_to_disk():
+    nw = NormalizedWorm()
+    nw.vulva_contour, nw.non_vulva_contour = get_example_contours()
+    nw.skeleton = None
+    nw.calculate_pre_features()
+    # 1 is a segmented frame
+    nw.frame_code = np.ones(nw.num_frames, dtype=int)
+
+    options = FeatureProcessingOptions(25.8)
+    options.features_to_compute = ['path.range', 'path.coordinates', 
+                                   'posture.coils']
+    wf = WormFeatures(nw, VideoInfo('Test', 25.8), options)
+    file_path = os.path.join(tempfile.mkdtemp(), 'features.h5')
+    wf.write_to_disk(file_path)
+
+    with h5py.File(file_path, 'r') as h:
+        assert h['worm'].attrs['schema_version'] == 1
+        # Features that weren't computed aren't saved
+        assert 'length' not in h['worm/morphology']
+
+    for lazy in [False, True]:
+        wf2 = WormFeatures.from_disk(file_path, lazy=lazy)
+        np.testing.assert_array_equal(wf2.path.range.value, 
+                                      wf.path.range.value)
+        np.testing.assert_array_equal(wf2.path.coordinates.x, 
+                                      wf.path.coordinates.x)
+        np.testing.assert_array_equal(wf2.posture.coils.start_frames, 
+                                      wf.posture.coils.start_frames)
+        assert wf2.posture.coils.is_null == wf.posture.coils.is_null
+        assert wf2.path.curvature is None
+        assert wf2.morphology.length is None
+        assert wf2.locomotion.motion_events is None
+        assert wf2.locomotion.turns is None
+        # The file is closed once all of the sections are read
+        assert '_lazy_disk_group' not in wf2.__dict__
+
+    # Or when leaving the with statement
+    with WormFeatures.from_disk(file_path, lazy=True) as wf2:
+        features_file = wf2._lazy_disk_group.file
+        np.testing.assert_array_equal(wf2.path.range.value, 
+                                      wf.path.range.value)
+    assert not features_file
+
+    # An event at each end of the video, so no events for the stats
+    event_list = events.EventListWithFeatures(
+        25.8, events.EventList(np.array([[0, 2], [7, 9]])), np.ones(10))
+    with h5py.File(os.path.join(tempfile.mkdtemp(), 'events.h5'), 'w') as h:
+        event_list.to_disk(h.create_group('coils'))
+        event_list2 = events.EventListWithFeatures.from_disk(h['coils'], 
+                                                             'MRC')
+    assert event_list2.num_events_for_stats == 0
+    assert event_list2.total_time == event_list.total_time == 10 / 25.8
+
+def test_worm_coils():
+    features_ref = WormFeatures.__new__(WormFeatures)
+    features_ref.options = FeatureProcessingOptions(25.8)
+    features_ref.video_info = VideoInfo('Test', 25.8)
+    features_ref.nw = NormalizedWorm()
+    midbody_distance = np.ones(20)
+
+    # No coils, as every frame was segmented (code 1)
+    features_ref.nw.frame_code = np.ones(20, dtype=int)
+    coils = posture_features.get_worm_coils(features_ref, midbody_distance)
+    assert coils.is_null
+
+    # A coil (code 105) that is still going at the last frame
+    features_ref.nw.frame_code[10:] = 105
+    coils = posture_features.get_worm_coils(features_ref, midbody_distance)
+    np.testing.assert_array_equal(coils.start_frames, [9])
+    np.testing.assert_array_equal(coils.end_frames, [18])
+
+def test_feature_cache():
+    nw = NormalizedWorm()
+    nw.vulva_contour, nw.non_vulva_contour = get_example_contours()
+    nw.skeleton = None
+    nw.calculate_pre_features()
+
+    options = FeatureProcessingOptions(25.8)
+    options.features_to_compute = ['path.range', 'path.coordinates']
+    cache = FeatureCache(tempfile.mkdtemp())
+    wf = WormFeatures(nw, VideoInfo('Test', 25.8), options, cache=cache)
+    assert (cache.n_hits, cache.n_misses) == (0, 2)
+
+    wf2 = WormFeatures(nw, VideoInfo('Test', 25.8), options, cache=cache)
+    assert (cache.n_hits, cache.n_misses) == (2, 2)
+    np.testing.assert_array_equal(wf2.path.range.value, wf.path.range.value)
+
+    cache.invalidate(['path.range'])
+    WormFeatures(nw, VideoInfo('Test', 25.8), options, cache=cache)
+    assert (cache.n_hits, cache.n_misses) == (3, 3)
+
+    # The size of the entries is kept up to date as they're stored
+    assert cache._size == cache.get_size()
+
+    # The least recently used entries are removed when storing takes them
+    # over max_size
+    cache.max_size = cache.get_size() + 1
+    options.dtype = np.float32
+    WormFeatures(nw, VideoInfo('Test', 25.8), options, cache=cache)
+    assert (cache.n_hits, cache.n_misses) == (3, 5)
+    assert 0 < cache.get_size() <= cache.max_size
+    assert cache._size == cache.get_size()
+
+    # Worms are hashed by all of their data, including ragged frames
+    def get_worm_hash(nw):
+        worm_hash = hashlib.sha1()
+        feature_cache.h__updateWormHash(worm_hash, nw)
+        return worm_hash.hexdigest()
+    vc, nvc = get_example_contours()
+    bw = BasicWorm()
+    bw.vulva_contour = RaggedFrames.from_list(vc)
+    bw.non_vulva_contour = [vc[0], None]
+    worm_hash = get_worm_hash(bw)
+    bw.vulva_contour.data[0, -1] += 1
+    assert get_worm_hash(bw) != worm_hash
+    worm_hash = get_worm_hash(bw)
+    bw.non_vulva_contour[0] = vc[0] + 1
+    assert get_worm_hash(bw) != worm_hash
+    bw.non_vulva_contour = set()
+    np.testing.assert_raises(TypeError, get_worm_hash, bw)
+
+    # The cache doesn't keep the worm
+    worm_ref = weakref.ref(nw)
+    del nw, wf, wf2
+    assert worm_ref() is None
+
+def test_batch_features():
+    nw = NormalizedWorm()
+    nw.vulva_contour, nw.non_vulva_contour = get_example_contours()
+    nw.skeleton = None
+    nw.calculate_pre_features()
+    input_dir = tempfile.mkdtemp()
+    input_paths = [os.path.join(input_dir, 'worm.h5'), 
+                   os.path.join(input_dir, 'bad.h5')]
+    nw.save_to_HDF5(input_paths[0])
+    with open(input_paths[1], 'w') as outfile:
+        outfile.write('not an HDF5 file')
+
+    output_dir = tempfile.mkdtemp()
+    result = batch_features.process_files(input_paths, output_dir, 
+                                          features_to_compute=['path.range'])
+    # A file that fails doesn't stop the others
+    assert result['completed'] == [input_paths[0]]
+    assert result['failed'] == [input_paths[1]]
+    output_path = os.path.join(output_dir, 'worm_features.hdf5')
+    options = FeatureProcessingOptions(config.FPS)
+    options.features_to_compute = ['path.range', 'path.coordinates']
+    wf = WormFeatures(nw, VideoInfo('Test', config.FPS), options)
+    np.testing.assert_array_equal(
+        WormFeatures.from_disk(output_path).path.range.value, 
+        wf.path.range.value)
+
+    # Completed files are skipped when run again
+    result = batch_features.process_files(input_paths, output_dir, 
+                                          features_to_compute=['path.range'])
+    assert result['skipped'] == [input_paths[0]]
+    assert result['failed'] == [input_paths[1]]
+
+    # ... but not when other features are asked for
+    result = batch_features.process_files(input_paths[:1], output_dir, 
+                                          n_workers=1,
+                                          features_to_compute=['path.range',
+                                                           'path.coordinates'])
+    assert result['completed'] == [input_paths[0]]
+    features = WormFeatures.from_disk(output_path)
+    np.testing.assert_array_equal(features.path.coordinates.x, 
+                                  wf.path.coordinates.x)
+
+def test_chunked_features():
+    nw = NormalizedWorm()
+    nw.vulva_contour, nw.non_vulva_contour = get_example_contours(40)
+    nw.skeleton = None
+    nw.calculate_pre_features()
+    nw.segmentation_status = np.array(['s'] * nw.num_frames)
+    video_info = VideoInfo('Test', 25.8)
+
+    options = FeatureProcessingOptions(25.8)
+    options.features_to_compute = ['locomotion.velocity', 'locomotion.turns',
+                                   'path.range', 'path.coordinates', 
+                                   'path.curvature']
+    wf = WormFeatures(nw, video_info, options)
+    chunked = compute_features_in_chunks(nw, video_info, options,
+                                         chunk_size=11)
+    # The same as computing all of the frames at once
+    np.testing.assert_array_equal(chunked.locomotion.velocity.midbody.speed,
+                                  wf.locomotion.velocity.midbody.speed)
+    np.testing.assert_array_equal(chunked.path.curvature, wf.path.curvature)
+    np.testing.assert_array_equal(chunked.path.coordinates.x,
+                                  wf.path.coordinates.x)
+    # ... including those computed from values stitched from the chunks
+    np.testing.assert_array_equal(chunked.path.range.value, 
+                                  wf.path.range.value)
+    for name in ['omegas', 'upsilons']:
+        chunked_turns = getattr(chunked.locomotion.turns, name)
+        turns = getattr(wf.locomotion.turns, name)
+        assert chunked_turns.is_null == turns.is_null
+        np.testing.assert_array_equal(chunked_turns.start_frames, 
+                                      turns.start_frames)
+        np.testing.assert_array_equal(chunked_turns.end_frames, 
+                                      turns.end_frames)
+
+    # The path duration needs all of the frames at once
+    options.features_to_compute = ['path.duration']
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        chunked = compute_features_in_chunks(nw, video_info, options,
+                                             chunk_size=11)
+    assert chunked.path.duration is None
+    assert any('path.duration' in str(w.message) for w in caught)
+
+def test_HDF5_round_trip():
+    nw = NormalizedWorm()
+    nw.vulva_contour, nw.non_vulva_contour = get_example_contours()
+    nw.skeleton = None
+    nw.calculate_pre_features()
+    nw.segmentation_status = np.array(list('sfsmsfsdss'))
+    file_path = os.path.join(tempfile.mkdtemp(), 'worm.h5')
+    nw.save_to_HDF5(file_path)
+    
+    nw2 = NormalizedWorm()
+    nw2.load_from_HDF5(file_path)
+    assert sorted(nw2.__dict__) == sorted(nw.__dict__)
+    for name in ('skeleton', 'angles', 'length', 'segmentation_status'):
+        np.testing.assert_array_equal(getattr(nw2, name), getattr(nw, name))
+        assert getattr(nw2, name).dtype == getattr(nw, name).dtype
+    assert nw2.worm_partitions == nw.worm_partitions
+    
+    nw3 = NormalizedWorm()
+    nw3.load_from_HDF5(file_path, frame_range=(2, 5))
+    np.testing.assert_array_equal(nw3.skeleton, nw.skeleton[:, :, 2:5])
+    np.testing.assert_array_equal(nw3.segmentation_status, 
+                                  nw.segmentation_status[2:5])
+    
+    # Lists of frames are kept as lists
+    bw = BasicWorm()
+    bw.vulva_contour, bw.non_vulva_contour = get_example_contours()
+    bw.skeleton = None
+    bw.save_to_HDF5(file_path)
+    bw2 = BasicWorm()
+    bw2.load_from_HDF5(file_path, frame_range=(2, 5))
+    assert isinstance(bw2.vulva_contour, list) and bw2.vulva_contour[1] is None
+    np.testing.assert_array_equal(bw2.vulva_contour[0], bw.vulva_contour[2])
+
+def test_JSON_array_formats():
+    bw = BasicWorm()
+    bw.vulva_contour, bw.non_vulva_contour = get_example_contours()
+    bw.non_vulva_contour = RaggedFrames.from_list(bw.non_vulva_contour)
+    bw.skeleton = np.arange(24, dtype=np.int16).reshape((2, 3, 4))
+    bw.plate_wireframe_video_key = 'Test'
+    for array_format in ('base64', 'npy', 'list'):
+        JSON_path = os.path.join(tempfile.mkdtemp(), 'worm.json')
+        bw.save_to_JSON(JSON_path, array_format)
+        bw2 = BasicWorm()
+        bw2.load_from_JSON(JSON_path)
+        assert bw2.plate_wireframe_video_key == 'Test'
+        assert bw2.skeleton.dtype == np.int16
+        np.testing.assert_array_equal(bw2.skeleton, bw.skeleton)
+        assert bw2.non_vulva_contour == bw.non_vulva_contour
+        for frame, frame2 in zip(bw.vulva_contour, bw2.vulva_contour):
+            if frame is None:
+                assert frame2 is None
+            else:
+                np.testing.assert_array_equal(frame, frame2)
+
+def test_chain_code_cache():
+    # Cached lengths are reused for the same points and recomputed when the
+    # points are replaced
+    vc, nvc = get_example_contours()
+    cache = ChainCodeCache()
+    angles = WormParsing.calculateAngles(vc, cache)
+    normalized = WormParsing.normalizeAllFramesXY(vc, cache)
+    assert cache.n_misses == 1 and cache.n_hits == 1
+    np.testing.assert_array_equal(angles, WormParsing.calculateAngles(vc))
+    np.testing.assert_array_equal(normalized, 
+                                  WormParsing.normalizeAllFramesXY(vc))
+
+    vc = list(vc)
+    vc[0] = vc[0] * 2
+    normalized = WormParsing.normalizeAllFramesXY(vc, cache)
+    assert cache.n_misses == 2
+    np.testing.assert_array_equal(normalized, 
+                                  WormParsing.normalizeAllFramesXY(vc))
+
 def test_example_scripts():
     """
     Generates a test for each example enumerated in examples_list.